@@ -0,0 +1,127 @@
+"""
+Бенчмарк параллельного распознавания длинной записи по сегментам.
+
+Для каждого размера пула запускает WhisperService, прогревает процессы
+(загрузка модели в замер не входит) и распознает одну длинную запись.
+При одном процессе запись распознается целиком, при нескольких -
+разбивается по паузам на сегменты (WHISPER_SEGMENT_SECONDS), которые
+распознаются параллельно. Печатает время, ускорение относительно одного
+процесса и эффективность (ускорение / число процессов).
+
+Без аргумента --audio используется синтетическая запись (фразы с паузами)
+и движок fake, который занимает ядро на rtf секунд на секунду сигнала:
+так проверяется масштабирование самого пула без загрузки модели.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_parallel_whisper [--audio meeting.ogg] \
+        [--engine faster-whisper] [--model base] [--sizes 1,2,4] [--threads 1]
+"""
+import os
+import time
+import asyncio
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+
+# Переменные окружения из .env загружаются до импорта конфигурации
+load_dotenv()
+
+from config.config import Config
+from services.audio_decoder import decode_audio, SAMPLE_RATE
+from services.whisper_service import WhisperService
+
+def synthetic_audio(seconds, seed=0):
+    """
+    Создает сигнал из «фраз» (тон со случайной длиной 3-12 с) и пауз 0.3-2 с на фоне шума.
+    """
+    rng = np.random.default_rng(seed)
+    parts = []
+    total = 0.0
+
+    while total < seconds:
+        phrase = rng.uniform(3, 12)
+        pause = rng.uniform(0.3, 2)
+        t = np.arange(int(phrase * SAMPLE_RATE)) / SAMPLE_RATE
+        parts.append(0.3 * np.sin(2 * np.pi * rng.uniform(150, 300) * t))
+        parts.append(np.zeros(int(pause * SAMPLE_RATE)))
+        total += phrase + pause
+
+    audio = np.concatenate(parts)[:int(seconds * SAMPLE_RATE)]
+    audio += 0.001 * rng.standard_normal(len(audio))
+
+    return audio.astype(np.float32)
+
+async def measure(audio, engine, model, size, options):
+    """
+    Возвращает время распознавания (в секундах) и количество символов текста.
+    """
+    service = WhisperService(engine=engine, model=model, pool_size=size, engine_options=options)
+
+    try:
+        await service.warm_up()
+
+        started = time.perf_counter()
+        text = await service.transcribe_pcm(audio)
+        elapsed = time.perf_counter() - started
+    finally:
+        await service.close()
+
+    if text is None:
+        raise RuntimeError("распознавание завершилось ошибкой (см. журнал)")
+
+    return elapsed, len(text)
+
+async def main():
+    """
+    Разбирает аргументы, выполняет замеры и печатает отчет.
+    """
+    cores = os.cpu_count() or 1
+    default_sizes = sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+
+    parser = argparse.ArgumentParser(description="Бенчмарк параллельного распознавания по сегментам")
+    parser.add_argument("--audio", help="Длинная запись (по умолчанию - синтетическая)")
+    parser.add_argument("--seconds", type=float, default=900, help="Длительность синтетической записи")
+    parser.add_argument("--engine", default=None, help="Движок (по умолчанию fake без --audio, иначе из .env)")
+    parser.add_argument("--model", default=None, help="Модель (по умолчанию WHISPER_MODEL)")
+    parser.add_argument("--rtf", type=float, default=0.05, help="Нагрузка движка fake: секунд CPU на секунду сигнала")
+    parser.add_argument("--sizes", default=",".join(map(str, default_sizes)), help="Размеры пула через запятую")
+    parser.add_argument("--threads", type=int, default=1, help="Потоков вычислений на процесс")
+    parser.add_argument("--segment-seconds", type=float, default=Config.WHISPER_SEGMENT_SECONDS,
+                        help="Максимальная длина сегмента")
+    args = parser.parse_args()
+
+    if args.audio:
+        with open(args.audio, "rb") as f:
+            audio = await decode_audio(f.read())
+        engine = args.engine or Config.WHISPER_ENGINE
+    else:
+        audio = synthetic_audio(args.seconds)
+        engine = args.engine or "fake"
+
+    model = args.model or Config.WHISPER_MODEL
+    options = {"language": Config.WHISPER_LANGUAGE, "beam_size": Config.WHISPER_BEAM_SIZE, "threads": args.threads}
+    if engine == "fake":
+        options["rtf"] = args.rtf
+    elif engine == "faster-whisper":
+        options["compute_type"] = Config.WHISPER_COMPUTE_TYPE
+
+    # Замеряется только разбиение и параллельность, без вырезания тишины
+    Config.VAD_ENABLED = False
+    Config.WHISPER_SEGMENT_SECONDS = args.segment_seconds
+
+    print(f"Аудио: {len(audio) / SAMPLE_RATE:.0f} с; движок: {engine}, модель: {model}; "
+          f"ядер: {cores}, потоков на процесс: {args.threads}; сегмент до {args.segment_seconds:.0f} с")
+    print(f"{'процессов':>9} {'время, с':>10} {'ускорение':>10} {'эффективность':>14} {'символов':>9}")
+
+    # Базовый замер - один процесс без разбиения
+    sizes = sorted({1} | set(map(int, args.sizes.split(","))))
+
+    baseline = None
+    for size in sizes:
+        elapsed, chars = await measure(audio, engine, model, size, options)
+        baseline = baseline or elapsed
+        speedup = baseline / elapsed
+        print(f"{size:9d} {elapsed:10.2f} {speedup:9.2f}x {speedup / size:14.0%} {chars:9d}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
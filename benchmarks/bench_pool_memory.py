@@ -0,0 +1,106 @@
+"""
+Бенчмарк памяти пула распознавания в зависимости от его размера.
+
+Для каждого размера пула запускает процессы в двух режимах: модель
+загружается в каждом процессе или один раз в процессе-шаблоне, из
+которого обработчики порождаются через fork (WHISPER_SHARE_MODEL). После
+загрузки (и, если указано аудио, одного распознавания в каждом процессе,
+чтобы учесть рабочие буферы) печатает RSS и PSS на обработчик и суммарный
+PSS пула с процессом-шаблоном. RSS учитывает общие страницы в каждом
+процессе, PSS делит их между процессами, поэтому суммарный PSS - реальный
+расход памяти. Данные берутся из /proc/<pid>/smaps_rollup (только Linux).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_pool_memory --engine whisper --model large --sizes 1,2,4 \
+        [--audio meeting.ogg]
+    python -m benchmarks.bench_pool_memory --engine fake --weights-mb 1000
+"""
+import asyncio
+import argparse
+from dotenv import load_dotenv
+
+# Переменные окружения из .env загружаются до импорта конфигурации
+load_dotenv()
+
+from config.config import Config
+from services.audio_decoder import decode_audio
+from services.whisper_pool import WhisperPool
+
+MB = 1024 * 1024
+
+async def measure(engine, model, size, share_model, options, audio):
+    """
+    Запускает пул и возвращает память его процессов (WhisperPool.memory_usage).
+    """
+    pool = WhisperPool(
+        engine,
+        model,
+        size=size,
+        job_timeout=Config.WHISPER_JOB_TIMEOUT_SECONDS,
+        max_jobs_per_worker=0,
+        load_timeout=Config.WHISPER_LOAD_TIMEOUT_SECONDS,
+        engine_options=options,
+        share_model=share_model
+    )
+
+    try:
+        await pool.start_async()
+
+        if audio is not None:
+            # Задач по числу процессов: каждый выполнит хотя бы одну
+            await asyncio.gather(*[pool.run("transcribe", audio) for _ in range(size)])
+
+        return pool.share_model, pool.memory_usage()
+    finally:
+        await pool.stop_async()
+
+async def main():
+    """
+    Разбирает аргументы, выполняет замеры и печатает отчет.
+    """
+    parser = argparse.ArgumentParser(description="Бенчмарк памяти пула распознавания")
+    parser.add_argument("--engine", default=Config.WHISPER_ENGINE, help="Движок распознавания")
+    parser.add_argument("--model", default=Config.WHISPER_MODEL, help="Модель")
+    parser.add_argument("--sizes", default="1,2,4", help="Размеры пула через запятую")
+    parser.add_argument("--audio", help="Аудио для одного распознавания в каждом процессе")
+    parser.add_argument("--weights-mb", type=int, default=500, help="Размер имитации весов движка fake")
+    parser.add_argument("--threads", type=int, default=1, help="Потоков вычислений на процесс")
+    args = parser.parse_args()
+
+    options = {"language": Config.WHISPER_LANGUAGE, "beam_size": Config.WHISPER_BEAM_SIZE, "threads": args.threads}
+    if args.engine == "fake":
+        options["weights_mb"] = args.weights_mb
+    elif args.engine == "faster-whisper":
+        options["compute_type"] = Config.WHISPER_COMPUTE_TYPE
+
+    audio = None
+    if args.audio:
+        with open(args.audio, "rb") as f:
+            audio = await decode_audio(f.read())
+
+    print(f"Движок: {args.engine}, модель: {args.model}")
+    print(f"{'процессов':>9} {'режим':<10} {'RSS/проц, МБ':>13} {'PSS/проц, МБ':>13} {'шаблон PSS, МБ':>15} {'всего PSS, МБ':>14}")
+
+    for size in map(int, args.sizes.split(",")):
+        for share_model in (False, True):
+            shared, usage = await measure(args.engine, args.model, size, share_model, options, audio)
+
+            if share_model and not shared:
+                print(f"{size:9d} {'общая':<10} движок не поддерживает общую модель")
+                continue
+
+            workers = usage["workers"]
+            if not workers:
+                print("Нет данных о памяти процессов (нужен Linux с /proc/<pid>/smaps_rollup)")
+                return
+
+            zygote_pss = usage["zygote"]["pss"] if usage["zygote"] else 0
+            total_pss = sum(worker["pss"] for worker in workers) + zygote_pss
+
+            print(f"{size:9d} {'общая' if shared else 'отдельная':<10} "
+                  f"{sum(worker['rss'] for worker in workers) / len(workers) / MB:13.0f} "
+                  f"{sum(worker['pss'] for worker in workers) / len(workers) / MB:13.0f} "
+                  f"{zygote_pss / MB:15.0f} {total_pss / MB:14.0f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+"""
+Бенчмарк задержки обработчиков при медленном диске.
+
+Сравнивает синхронную работу с сессиями (запись в цикле событий)
+и асинхронные варианты SessionManager (запись в пуле ввода-вывода).
+Медленный диск имитируется задержкой в каждой операции хранилища.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_slow_disk [--users 50] [--messages 20] [--disk-delay-ms 20]
+"""
+import argparse
+import asyncio
+import shutil
+import statistics
+import tempfile
+import time
+from dotenv import load_dotenv
+
+# Переменные окружения из .env загружаются до импорта конфигурации
+load_dotenv()
+
+from config.config import Config
+from core.session_manager import SessionManager
+from core.session_store import FileSessionStore
+from utils.async_io import shutdown_io_executor
+
+class SlowFileSessionStore(FileSessionStore):
+    """
+    Файловое хранилище с искусственной задержкой каждой операции.
+    """
+
+    def __init__(self, base_dir, delay):
+        super().__init__(base_dir)
+        self.delay = delay
+
+    def load(self, user_id):
+        time.sleep(self.delay)
+        return super().load(user_id)
+
+    def save(self, user_id, session_data):
+        time.sleep(self.delay)
+        return super().save(user_id, session_data)
+
+    def create(self, user_id, session_data):
+        time.sleep(self.delay)
+        return super().create(user_id, session_data)
+
+    def exists(self, user_id):
+        time.sleep(self.delay)
+        return super().exists(user_id)
+
+def percentile(values, q):
+    """
+    Возвращает q-й перцентиль списка значений.
+    """
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+async def run_scenario(session_manager, use_async, users, messages, interval):
+    """
+    Имитирует поток сообщений от пользователей и измеряет задержку обработчиков.
+
+    Задержка считается от запланированного времени прихода сообщения
+    до завершения обработчика, поэтому учитывает и ожидание заблокированного цикла.
+
+    Returns:
+        list: Задержки обработчиков в миллисекундах.
+    """
+    for user_id in range(users):
+        await session_manager.create_session_async(user_id, initial_state="step_0")
+
+    latencies = []
+    tasks = []
+
+    async def handle(user_id, step, arrival):
+        update = {"metadata": {f"field_{step}": "value"}}
+        if use_async:
+            await session_manager.transition_async(user_id, f"step_{step + 1}", update)
+        else:
+            session_manager.transition(user_id, f"step_{step + 1}", update)
+        # Имитация отправки ответа пользователю
+        await asyncio.sleep(0)
+        latencies.append((time.perf_counter() - arrival) * 1000)
+
+    start = time.perf_counter()
+
+    for step in range(messages):
+        for user_id in range(users):
+            arrival = start + (step * users + user_id) * interval
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(handle(user_id, step, arrival)))
+
+    await asyncio.gather(*tasks)
+
+    return latencies
+
+def main():
+    """
+    Запускает бенчмарк для синхронного и асинхронного вариантов и печатает отчет.
+    """
+    parser = argparse.ArgumentParser(description="Задержка обработчиков при медленном диске")
+    parser.add_argument("--users", type=int, default=50, help="Количество одновременных пользователей")
+    parser.add_argument("--messages", type=int, default=20, help="Сообщений от каждого пользователя")
+    parser.add_argument("--disk-delay-ms", type=float, default=20.0, help="Задержка одной дисковой операции")
+    parser.add_argument("--interval-ms", type=float, default=2.0, help="Интервал между входящими сообщениями")
+    args = parser.parse_args()
+
+    print(f"Пользователей: {args.users}, сообщений: {args.messages}, задержка диска: {args.disk_delay_ms} мс, "
+          f"пул ввода-вывода: {Config.IO_EXECUTOR_WORKERS}")
+    print(f"{'вариант':<10} {'p50, мс':>10} {'p95, мс':>10} {'p99, мс':>10} {'max, мс':>10}")
+
+    for use_async in (False, True):
+        base_dir = tempfile.mkdtemp(prefix="bench_sessions_")
+        Config.SESSION_BASE_DIR = base_dir
+
+        try:
+            store = SlowFileSessionStore(base_dir, args.disk_delay_ms / 1000)
+            session_manager = SessionManager(flush_policy=SessionManager.FLUSH_ON_STATE_CHANGE, store=store)
+            latencies = asyncio.run(run_scenario(
+                session_manager, use_async, args.users, args.messages, args.interval_ms / 1000
+            ))
+        finally:
+            shutdown_io_executor()
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+        name = "async" if use_async else "sync"
+        print(f"{name:<10} {statistics.median(latencies):>10.1f} {percentile(latencies, 95):>10.1f} "
+              f"{percentile(latencies, 99):>10.1f} {max(latencies):>10.1f}")
+
+if __name__ == "__main__":
+    main()
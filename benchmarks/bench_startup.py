@@ -0,0 +1,157 @@
+"""
+Бенчмарк холодного запуска бота с бюджетом времени.
+
+В отдельном процессе интерпретатора (python -X importtime) импортирует
+core.bot и создает TelegramBot - все, что происходит до начала приема
+обновлений. Печатает время запуска и самые долгие импорты, проверяет,
+что тяжелые сервисы не импортируются при запуске, и завершается с кодом 1,
+если медиана времени запуска превышает бюджет. Файлы бота (список
+пользователей, сессии) создаются во временной директории, а не в data/ и sessions/.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_startup [--runs 5] [--budget-ms 1500] [--top 15]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули, которые должны импортироваться при первом обращении, а не при запуске
+LAZY_MODULES = (
+    "services.whisper_service",
+    "services.ollama_service",
+    "utils.pdf_generator",
+    "fpdf",
+)
+
+# Код, выполняемый в отдельном процессе: импорт и создание бота с файлами
+# во временной директории (sys.argv[1])
+PROBE = """
+import os, sys, json, time
+started = time.perf_counter()
+from dotenv import load_dotenv
+load_dotenv()
+from core.bot import TelegramBot
+imported = time.perf_counter()
+from config.config import Config
+Config.USERS_FILE_PATH = os.path.join(sys.argv[1], "users.json")
+Config.SESSION_BASE_DIR = os.path.join(sys.argv[1], "sessions")
+Config.SESSION_DB_PATH = os.path.join(Config.SESSION_BASE_DIR, "sessions.db")
+Config.TRANSCRIPTION_CACHE_DIR = os.path.join(sys.argv[1], "transcriptions")
+TelegramBot()
+created = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "init_ms": (created - imported) * 1000}))
+"""
+
+def parse_importtime(stderr):
+    """
+    Разбирает отчет python -X importtime.
+
+    Args:
+        stderr (str): Вывод процесса в stderr.
+
+    Returns:
+        dict: Имя модуля -> (собственное время, суммарное время) в миллисекундах.
+    """
+    modules = {}
+
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+
+        try:
+            modules[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+        except ValueError:
+            # Строка заголовка отчета
+            continue
+
+    return modules
+
+def measure_startup():
+    """
+    Запускает процесс с импортом и созданием бота.
+
+    Returns:
+        tuple: (время процесса в мс, результат замера внутри процесса, импорты).
+    """
+    env = dict(os.environ)
+    # Для создания бота достаточно токена в правильном формате, сеть не используется
+    env.setdefault("TELEGRAM_BOT_TOKEN", "123456:startup-benchmark")
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE, data_dir],
+            cwd=PROJECT_ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Процесс запуска завершился с ошибкой:\n{result.stderr[-2000:]}")
+
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+
+    return elapsed, probe, parse_importtime(result.stderr)
+
+def main():
+    """
+    Разбирает аргументы, выполняет замеры и печатает отчет.
+    """
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного запуска бота")
+    parser.add_argument("--runs", type=int, default=5, help="Количество запусков")
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="Бюджет времени запуска (медиана)")
+    parser.add_argument("--top", type=int, default=15, help="Сколько самых долгих импортов показать")
+    args = parser.parse_args()
+
+    totals, imports, inits = [], [], []
+    modules = {}
+
+    for _ in range(args.runs):
+        elapsed, probe, modules = measure_startup()
+        totals.append(elapsed)
+        imports.append(probe["import_ms"])
+        inits.append(probe["init_ms"])
+
+    total = statistics.median(totals)
+
+    print(f"Запусков: {args.runs}")
+    print(f"Запуск процесса до готовности бота, мс: медиана {total:.0f}, min {min(totals):.0f}, max {max(totals):.0f}")
+    print(f"Импорт core.bot, мс: медиана {statistics.median(imports):.0f}")
+    print(f"Создание TelegramBot, мс: медиана {statistics.median(inits):.0f}")
+
+    print(f"\nСамые долгие импорты (последний запуск), мс:")
+    print(f"{'суммарно':>10} {'собственно':>11}  модуль")
+    slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_ms, cumulative_ms) in slowest:
+        print(f"{cumulative_ms:10.1f} {self_ms:11.1f}  {name}")
+
+    failed = False
+
+    eager = [name for name in LAZY_MODULES if name in modules]
+    if eager:
+        print(f"\nОШИБКА: при запуске импортированы модули, которые должны загружаться лениво: {', '.join(eager)}")
+        failed = True
+
+    if total > args.budget_ms:
+        print(f"\nОШИБКА: время запуска {total:.0f} мс превышает бюджет {args.budget_ms:.0f} мс")
+        failed = True
+    else:
+        print(f"\nВремя запуска в пределах бюджета {args.budget_ms:.0f} мс")
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Нагрузочный тест режима webhook на фейковом сервере Telegram.
+
+Поднимает tools.fake_telegram_server, встроенный WebhookServer и бота
+с обработчиком-эхо, отправляет на webhook синтетические обновления и
+измеряет пропускную способность и задержку от отправки обновления
+до получения фейковым сервером ответа бота (sendMessage).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_webhook [--updates 2000] [--users 100] [--api-latency-ms 20]
+"""
+import time
+import asyncio
+import argparse
+import statistics
+from dotenv import load_dotenv
+
+# Переменные окружения из .env загружаются до импорта конфигурации
+load_dotenv()
+
+from telebot.async_telebot import AsyncTeleBot
+from core.webhook_server import WebhookServer
+from tools.fake_telegram_server import FakeTelegramServer, push_updates
+from benchmarks.bench_slow_disk import percentile
+
+SECRET_TOKEN = "bench-secret"
+
+async def run_benchmark(args):
+    """
+    Выполняет нагрузочный тест.
+
+    Returns:
+        tuple: (время выполнения в секундах, список задержек в миллисекундах).
+    """
+    fake = FakeTelegramServer(port=args.api_port, latency=args.api_latency_ms / 1000)
+    fake.install()
+    await fake.start()
+
+    bot = AsyncTeleBot("123456:BENCH")
+
+    @bot.message_handler(content_types=["text"])
+    async def echo(message):
+        await bot.send_message(message.chat.id, f"echo {message.message_id}")
+
+    server = WebhookServer(bot, host="127.0.0.1", port=args.webhook_port, secret_token=SECRET_TOKEN)
+    await server.start()
+
+    try:
+        started = time.monotonic()
+        sent = await push_updates(
+            f"http://127.0.0.1:{args.webhook_port}{server.path}",
+            args.updates,
+            args.users,
+            SECRET_TOKEN,
+            args.concurrency
+        )
+
+        # Ждем ответа бота на каждое обновление
+        while fake.count("sendMessage") < args.updates:
+            await asyncio.sleep(0.01)
+
+        elapsed = time.monotonic() - started
+    finally:
+        await server.stop()
+        await bot.close_session()
+        await fake.stop()
+
+    latencies = []
+    for received, method, params in fake.calls:
+        if method == "sendmessage":
+            update_id = int(params["text"].split()[1])
+            latencies.append((received - sent[update_id]) * 1000)
+
+    return elapsed, latencies
+
+def main():
+    """
+    Разбирает аргументы, запускает тест и печатает отчет.
+    """
+    parser = argparse.ArgumentParser(description="Нагрузочный тест режима webhook")
+    parser.add_argument("--updates", type=int, default=2000, help="Количество обновлений")
+    parser.add_argument("--users", type=int, default=100, help="Количество разных пользователей")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных запросов к webhook")
+    parser.add_argument("--api-latency-ms", type=float, default=20.0, help="Задержка ответа Bot API")
+    parser.add_argument("--api-port", type=int, default=8081, help="Порт фейкового Bot API")
+    parser.add_argument("--webhook-port", type=int, default=8080, help="Порт сервера webhook")
+    args = parser.parse_args()
+
+    elapsed, latencies = asyncio.run(run_benchmark(args))
+
+    print(f"Обновлений: {args.updates}, пользователей: {args.users}, задержка Bot API: {args.api_latency_ms} мс")
+    print(f"Пропускная способность: {args.updates / elapsed:.0f} обновлений/с")
+    print(f"Задержка ответа, мс: p50 {statistics.median(latencies):.1f}, p95 {percentile(latencies, 95):.1f}, "
+          f"p99 {percentile(latencies, 99):.1f}, max {max(latencies):.1f}")
+
+if __name__ == "__main__":
+    main()
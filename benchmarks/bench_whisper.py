@@ -0,0 +1,140 @@
+"""
+Бенчмарк движков и моделей распознавания речи на CPU.
+
+Для каждой комбинации движка и модели в отдельном процессе загружает модель
+и распознает образцы аудио (например, записи встреч на русском языке).
+Печатает время загрузки, коэффициент реального времени (RTF - время
+распознавания / длительность аудио, меньше - быстрее), пиковую память
+процесса и, если указан эталонный текст, долю ошибок в словах (WER).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_whisper --audio samples/meeting_ru.ogg \
+        [--reference samples/meeting_ru.txt] [--engines faster-whisper,whisper] \
+        [--models base,small] [--threads 4] [--beam-size 5] [--compute-type int8]
+"""
+import re
+import time
+import argparse
+import resource
+import subprocess
+import multiprocessing
+
+def audio_duration(path):
+    """
+    Возвращает длительность аудиофайла (в секундах) по данным ffprobe.
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return float(result.stdout.strip())
+
+def word_error_rate(reference, hypothesis):
+    """
+    Доля ошибок в словах: расстояние Левенштейна по словам / число слов эталона.
+    """
+    ref = re.findall(r"\w+", reference.lower())
+    hyp = re.findall(r"\w+", hypothesis.lower())
+
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, start=1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+
+    return previous[-1] / max(1, len(ref))
+
+def run_engine(engine_name, model, options, audio_files, results):
+    """
+    Выполняется в отдельном процессе: загружает модель и распознает файлы.
+    Пиковая память процесса не смешивается с другими комбинациями.
+    """
+    from services.whisper_engines import create_engine
+
+    try:
+        started = time.perf_counter()
+        engine = create_engine(engine_name, model, **options)
+        load_seconds = time.perf_counter() - started
+
+        transcripts = []
+        transcribe_seconds = 0.0
+
+        for path in audio_files:
+            started = time.perf_counter()
+            transcripts.append(engine.transcribe(path))
+            transcribe_seconds += time.perf_counter() - started
+
+        # ru_maxrss в Linux - в килобайтах
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        results.put({
+            "load_seconds": load_seconds,
+            "transcribe_seconds": transcribe_seconds,
+            "peak_rss_mb": peak_rss_mb,
+            "transcripts": transcripts,
+        })
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+
+def main():
+    """
+    Разбирает аргументы, выполняет замеры и печатает отчет.
+    """
+    parser = argparse.ArgumentParser(description="Бенчмарк движков распознавания речи на CPU")
+    parser.add_argument("--audio", nargs="+", required=True, help="Образцы аудио")
+    parser.add_argument("--reference", nargs="*", default=[], help="Эталонные тексты (по одному на файл аудио)")
+    parser.add_argument("--engines", default="faster-whisper,whisper", help="Движки через запятую")
+    parser.add_argument("--models", default="base,small", help="Модели через запятую")
+    parser.add_argument("--language", default="ru", help="Язык речи")
+    parser.add_argument("--threads", type=int, default=0, help="Потоков вычислений (0 - по умолчанию)")
+    parser.add_argument("--beam-size", type=int, default=5, help="Ширина лучевого поиска")
+    parser.add_argument("--compute-type", default="int8", help="Тип вычислений faster-whisper")
+    args = parser.parse_args()
+
+    if args.reference and len(args.reference) != len(args.audio):
+        parser.error("количество эталонных текстов должно совпадать с количеством файлов аудио")
+
+    references = []
+    for path in args.reference:
+        with open(path, "r", encoding="utf-8") as f:
+            references.append(f.read())
+
+    total_audio = sum(audio_duration(path) for path in args.audio)
+    options = {
+        "language": args.language,
+        "beam_size": args.beam_size,
+        "threads": args.threads,
+        "compute_type": args.compute_type,
+    }
+
+    print(f"Аудио: {len(args.audio)} файлов, {total_audio:.1f} с; потоков: {args.threads or 'по умолчанию'}, "
+          f"beam size: {args.beam_size}, compute type: {args.compute_type}")
+    print(f"{'движок':<16} {'модель':<10} {'загрузка, с':>12} {'RTF':>7} {'память, МБ':>11} {'WER':>7}")
+
+    context = multiprocessing.get_context("spawn")
+
+    for engine_name in args.engines.split(","):
+        for model in args.models.split(","):
+            results = context.Queue()
+            process = context.Process(target=run_engine, args=(engine_name, model, options, args.audio, results))
+            process.start()
+            result = results.get()
+            process.join()
+
+            if "error" in result:
+                print(f"{engine_name:<16} {model:<10} ошибка: {result['error']}")
+                continue
+
+            wer = "-"
+            if references:
+                rates = [word_error_rate(ref, hyp) for ref, hyp in zip(references, result["transcripts"])]
+                wer = f"{sum(rates) / len(rates):.1%}"
+
+            print(f"{engine_name:<16} {model:<10} {result['load_seconds']:12.1f} "
+                  f"{result['transcribe_seconds'] / total_audio:7.2f} {result['peak_rss_mb']:11.0f} {wer:>7}")
+
+if __name__ == "__main__":
+    main()
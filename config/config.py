@@ -1,15 +1,9 @@
 import os
 import logging
-from dotenv import load_dotenv
 
-# Загрузка переменных окружения из файла .env
-load_dotenv()
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Переменные окружения из файла .env загружает каждая точка входа (main.py, скрипты
+# tools/ и benchmarks/) до импорта конфигурации; логирование тоже настраивает она,
+# а не импорт модуля
 logger = logging.getLogger(__name__)
 
 # Конфигурационные параметры
@@ -22,9 +16,75 @@ class Config:
 
     # USER_FILE_PATH:
     USERS_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'users.json')
+    # Как часто (в секундах) проверять, не изменили ли файл пользователей вручную
+    USERS_RELOAD_INTERVAL_SECONDS = float(os.getenv('USERS_RELOAD_INTERVAL_SECONDS', '5'))
+    # Попытки доступа одного пользователя за окно объединяются в одно уведомление администратору,
+    # которое обновляется не чаще раза в ADMIN_ALERT_EDIT_INTERVAL_SECONDS (в секундах)
+    ADMIN_ALERT_WINDOW_SECONDS = float(os.getenv('ADMIN_ALERT_WINDOW_SECONDS', '600'))
+    ADMIN_ALERT_EDIT_INTERVAL_SECONDS = float(os.getenv('ADMIN_ALERT_EDIT_INTERVAL_SECONDS', '30'))
+    # Сколько секунд не повторять сообщение об отказе в доступе тому же пользователю
+    UNAUTHORIZED_REPLY_TTL_SECONDS = float(os.getenv('UNAUTHORIZED_REPLY_TTL_SECONDS', '600'))
 
     # Настройки Whisper
     WHISPER_MODEL = os.getenv('WHISPER_MODEL', 'large')
+    # Движок распознавания: "faster-whisper" (CTranslate2, быстрый на CPU), "whisper"
+    # (эталонный openai-whisper) или "fake" (для тестов, без модели)
+    WHISPER_ENGINE = os.getenv('WHISPER_ENGINE', 'faster-whisper')
+    WHISPER_LANGUAGE = os.getenv('WHISPER_LANGUAGE', 'ru')
+    # Квантование весов faster-whisper (int8, int8_float32, float32), ширина лучевого поиска
+    # и потоков вычислений на процесс (0 - по умолчанию; потоки x процессы <= ядра CPU)
+    WHISPER_COMPUTE_TYPE = os.getenv('WHISPER_COMPUTE_TYPE', 'int8')
+    WHISPER_BEAM_SIZE = int(os.getenv('WHISPER_BEAM_SIZE', '5'))
+    WHISPER_THREADS = int(os.getenv('WHISPER_THREADS', '0'))
+    # Пул процессов распознавания: количество процессов (модель загружается в каждом),
+    # максимальное время задачи и загрузки модели (в секундах), количество задач,
+    # после которого процесс заменяется новым (0 - не заменять)
+    WHISPER_POOL_SIZE = int(os.getenv('WHISPER_POOL_SIZE', '1'))
+    WHISPER_JOB_TIMEOUT_SECONDS = float(os.getenv('WHISPER_JOB_TIMEOUT_SECONDS', '900'))
+    WHISPER_LOAD_TIMEOUT_SECONDS = float(os.getenv('WHISPER_LOAD_TIMEOUT_SECONDS', '600'))
+    WHISPER_MAX_JOBS_PER_WORKER = int(os.getenv('WHISPER_MAX_JOBS_PER_WORKER', '100'))
+    # Загружать модель один раз и порождать процессы пула через fork (общие веса в памяти);
+    # действует для движков, допускающих fork после загрузки (whisper), для faster-whisper
+    # игнорируется с предупреждением при запуске
+    WHISPER_SHARE_MODEL = os.getenv('WHISPER_SHARE_MODEL', 'true').lower() == 'true'
+    # Передавать сигнал процессам распознавания через разделяемую память (/dev/shm), а не копией;
+    # в Docker размер /dev/shm по умолчанию 64 МБ (около часа записи), его задает --shm-size
+    WHISPER_SHARED_PCM = os.getenv('WHISPER_SHARED_PCM', 'true').lower() == 'true'
+    # Остановка процессов распознавания (выгрузка модели) после простоя (в секундах, 0 - не выгружать);
+    # модель загружается снова в фоне при получении следующего голосового сообщения
+    WHISPER_IDLE_UNLOAD_SECONDS = float(os.getenv('WHISPER_IDLE_UNLOAD_SECONDS', '3600'))
+    # Голосовые сообщения декодируются ffmpeg в памяти; максимальное время декодирования (в секундах)
+    AUDIO_DECODE_TIMEOUT_SECONDS = float(os.getenv('AUDIO_DECODE_TIMEOUT_SECONDS', '60'))
+    # Вырезание тишины перед распознаванием: паузы короче VAD_MAX_PAUSE_SECONDS сохраняются,
+    # вокруг речи остается VAD_PADDING_SECONDS тишины
+    VAD_ENABLED = os.getenv('VAD_ENABLED', 'true').lower() == 'true'
+    VAD_MAX_PAUSE_SECONDS = float(os.getenv('VAD_MAX_PAUSE_SECONDS', '1.0'))
+    VAD_PADDING_SECONDS = float(os.getenv('VAD_PADDING_SECONDS', '0.2'))
+    # При WHISPER_POOL_SIZE > 1 записи длиннее WHISPER_SEGMENT_SECONDS разбиваются по паузам
+    # и распознаются параллельно; без пауз сегменты режутся с перекрытием
+    WHISPER_SEGMENT_SECONDS = float(os.getenv('WHISPER_SEGMENT_SECONDS', '60'))
+    WHISPER_SEGMENT_OVERLAP_SECONDS = float(os.getenv('WHISPER_SEGMENT_OVERLAP_SECONDS', '1.0'))
+    # Кэш распознанных текстов голосовых сообщений (по file_unique_id и хэшу содержимого):
+    # записей в памяти и размер каталога на диске (МБ, 0 - только в памяти)
+    TRANSCRIPTION_CACHE_ENABLED = os.getenv('TRANSCRIPTION_CACHE_ENABLED', 'true').lower() == 'true'
+    TRANSCRIPTION_CACHE_DIR = os.getenv(
+        'TRANSCRIPTION_CACHE_DIR',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'transcriptions')
+    )
+    TRANSCRIPTION_CACHE_MEMORY_ENTRIES = int(os.getenv('TRANSCRIPTION_CACHE_MEMORY_ENTRIES', '256'))
+    TRANSCRIPTION_CACHE_DISK_MB = float(os.getenv('TRANSCRIPTION_CACHE_DISK_MB', '50'))
+    # Сохранять ли голосовые сообщения в директории сессии (архивная копия, для распознавания не нужна)
+    ARCHIVE_VOICE_MESSAGES = os.getenv('ARCHIVE_VOICE_MESSAGES', 'false').lower() == 'true'
+    
+    # Очередь распознавания: одновременных запусков Whisper, ожидающих в очереди
+    # и начальная оценка длительности распознавания (в секундах) для расчета ожидания
+    VOICE_QUEUE_CONCURRENCY = int(os.getenv('VOICE_QUEUE_CONCURRENCY', '1'))
+    VOICE_QUEUE_MAX_WAITING = int(os.getenv('VOICE_QUEUE_MAX_WAITING', '10'))
+    VOICE_JOB_ESTIMATE_SECONDS = float(os.getenv('VOICE_JOB_ESTIMATE_SECONDS', '60'))
+    
+    # Создавать ли тяжелые сервисы (Whisper, Ollama, PDF) фоновой задачей сразу после запуска;
+    # иначе они создаются при первом обращении
+    SERVICES_WARMUP = os.getenv('SERVICES_WARMUP', 'true').lower() == 'true'
     
     # Настройки Ollama
     OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3')
@@ -36,6 +96,51 @@ class Config:
     
     # Настройки сессий
     SESSION_BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sessions')
+    # Бэкенд хранилища сессий: "file" (session.json в директории пользователя) или "sqlite"
+    SESSION_STORE_BACKEND = os.getenv('SESSION_STORE_BACKEND', 'file')
+    SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', os.path.join(SESSION_BASE_DIR, 'sessions.db'))
+    # Политика сброса кэша сессий на диск: "state" (смена состояния сразу, остальные
+    # изменения не позже чем через SESSION_FLUSH_INTERVAL_MS мс; при сбое теряются
+    # изменения данных за это окно), "interval" (все изменения каждые
+    # SESSION_FLUSH_INTERVAL_MS мс) или "shutdown" (при остановке)
+    SESSION_FLUSH_POLICY = os.getenv('SESSION_FLUSH_POLICY', 'state')
+    SESSION_FLUSH_INTERVAL_MS = int(os.getenv('SESSION_FLUSH_INTERVAL_MS', '1000'))
+    # Время жизни неактивной сессии и период фоновой очистки истекших сессий (в секундах)
+    SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', '86400'))
+    SESSION_JANITOR_INTERVAL_SECONDS = int(os.getenv('SESSION_JANITOR_INTERVAL_SECONDS', '60'))
+    
+    # Размер пула потоков для файловых операций и работы с хранилищем сессий
+    IO_EXECUTOR_WORKERS = int(os.getenv('IO_EXECUTOR_WORKERS', '8'))
+    
+    # Количество параллельных обработчиков обновлений (сообщения одного пользователя
+    # всегда обрабатываются по порядку)
+    UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '16'))
+    
+    # Отсев повторно доставленных обновлений: размер кэша ключей и сохранение в хранилище сессий
+    UPDATE_DEDUP_CAPACITY = int(os.getenv('UPDATE_DEDUP_CAPACITY', '10000'))
+    UPDATE_DEDUP_PERSIST = os.getenv('UPDATE_DEDUP_PERSIST', 'true').lower() == 'true'
+    
+    # Ограничения частоты исходящих запросов к Telegram (запросов в секунду)
+    OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))
+    OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+    # Допустимый всплеск сообщений в один чат и число повторов при ошибке 429
+    OUTBOUND_CHAT_BURST = int(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+    OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+    
+    # Сколько секунд при остановке ждать завершения принятых обновлений;
+    # незавершенные распознавание и генерация PDF возобновятся после перезапуска
+    SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv('SHUTDOWN_TIMEOUT_SECONDS', '30'))
+    
+    # Режим получения обновлений: "polling" (по умолчанию) или "webhook"
+    BOT_MODE = os.getenv('BOT_MODE', 'polling')
+    # Публичный HTTPS-адрес webhook (TLS терминирует обратный прокси)
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+    # Адрес и путь встроенного HTTP-сервера webhook
+    WEBHOOK_LISTEN_HOST = os.getenv('WEBHOOK_LISTEN_HOST', '127.0.0.1')
+    WEBHOOK_LISTEN_PORT = int(os.getenv('WEBHOOK_LISTEN_PORT', '8080'))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram/webhook')
+    # Секретный токен, который Telegram передает в заголовке каждого запроса
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')
     
     # Настройки PDF
     PDF_LOGO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'logo.png')
@@ -49,7 +154,29 @@ class Config:
             logger.error("Не указан токен Telegram бота (TELEGRAM_BOT_TOKEN)")
             return False
         
+        if cls.BOT_MODE not in ("polling", "webhook"):
+            logger.error(f"Неизвестный режим бота BOT_MODE={cls.BOT_MODE}, допустимы polling и webhook")
+            return False
+        
+        if cls.BOT_MODE == "webhook":
+            if not cls.WEBHOOK_URL:
+                logger.error("Не указан адрес webhook (WEBHOOK_URL)")
+                return False
+            
+            if not cls.WEBHOOK_SECRET_TOKEN:
+                logger.warning("Не указан секретный токен webhook (WEBHOOK_SECRET_TOKEN), запросы не проверяются")
+        
         if not cls.ALLOWED_USERS:
             logger.warning("Не указаны разрешенные пользователи (ALLOWED_USERS)")
         
+        # Реестр движков не импортирует их зависимости
+        from services.whisper_engines import ENGINES
+        
+        engine = ENGINES.get(cls.WHISPER_ENGINE)
+        if cls.WHISPER_SHARE_MODEL and engine and not engine.fork_safe:
+            logger.warning(
+                f"WHISPER_SHARE_MODEL не действует для движка {cls.WHISPER_ENGINE}: "
+                f"модель загружается в каждом процессе распознавания"
+            )
+        
         return True
@@ -2,9 +2,12 @@
 Модуль аутентификации пользователей Telegram-бота.
 Проверяет доступ пользователей на основе white list.
 """
+import time
 import logging
 from functools import wraps
+from config.config import Config
 from core.user_manager import UserManager
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -13,16 +16,25 @@ class Auth:
     Класс для аутентификации пользователей Telegram-бота.
     """
 
-    def __init__(self, user_manager: UserManager, admin_handlers=None):
+    # Количество запомненных отказов, после которого удаляются истекшие
+    REJECTED_PRUNE_THRESHOLD = 1000
+
+    def __init__(self, user_manager: UserManager, admin_handlers=None, reject_ttl=None):
         """
         Инициализация аутентификации.
 
         Args:
             user_manager (UserManager): Менеджер пользователей.
             admin_handlers: Обработчики команд администратора.
+            reject_ttl (float): Сколько секунд не повторять отказ тому же пользователю.
+                По умолчанию Config.UNAUTHORIZED_REPLY_TTL_SECONDS.
         """
         self.user_manager = user_manager
         self.admin_handlers = admin_handlers
+        self.reject_ttl = Config.UNAUTHORIZED_REPLY_TTL_SECONDS if reject_ttl is None else reject_ttl
+
+        # Негативный кэш: пользователь -> время, до которого отказ не отправляется повторно
+        self._rejected = {}
 
     def auth_required(self, bot):
         """
@@ -43,12 +55,16 @@ class Auth:
                 if self.user_manager.is_user_allowed(user_id):
                     return await func(message, *args, **kwargs)
                 else:
-                    await bot.send_message(
-                        chat_id=message.chat.id,
-                        text="⛔ У вас нет доступа к этому боту. Обратитесь к администратору."
-                    )
+                    # Повторные сообщения того же пользователя не тратят лимит исходящих запросов
+                    if self._should_reply(user_id):
+                        await bot.send_message(
+                            chat_id=message.chat.id,
+                            text="⛔ У вас нет доступа к этому боту. Обратитесь к администратору."
+                        )
+                    else:
+                        metrics.increment("unauthorized_replies_skipped_total")
 
-                    # Отправляем уведомление админу с кнопками
+                    # Отправляем уведомление админу с кнопками (повторные попытки объединяются)
                     if self.admin_handlers:
                         await self.admin_handlers.handle_unauthorized_access(user_id, username)
 
@@ -81,3 +97,25 @@ class Auth:
                     return None
             return wrapper
         return decorator
+
+    def _should_reply(self, user_id):
+        """
+        Проверяет негативный кэш: отвечать ли пользователю отказом.
+        Отказ отправляется не чаще раза в reject_ttl секунд.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+
+        Returns:
+            bool: True, если отказ нужно отправить.
+        """
+        now = time.monotonic()
+
+        if self._rejected.get(user_id, 0) > now:
+            return False
+
+        if len(self._rejected) >= self.REJECTED_PRUNE_THRESHOLD:
+            self._rejected = {key: expires for key, expires in self._rejected.items() if expires > now}
+
+        self._rejected[user_id] = now + self.reject_ttl
+        return True
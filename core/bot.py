@@ -9,9 +9,17 @@ from telebot.async_telebot import AsyncTeleBot
 from telebot import types
 from config.config import Config
 from core.session_manager import SessionManager
+from core.session_janitor import SessionJanitor
+from core.webhook_server import WebhookServer
+from core.update_scheduler import UpdateScheduler, serialize_update
+from core.update_dedup import UpdateDeduplicator
+from core.outbound import OutboundDispatcher, RateLimitedBot
+from core.callback_router import CallbackRouter
 from core.auth import Auth
 from core.user_manager import UserManager  # Новый импорт
 from handlers.admin_handlers import AdminHandlers  # Новый импорт
+from handlers.protocol_handler import ProtocolHandler
+from utils.async_io import run_io, shutdown_io_executor
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +33,27 @@ class TelegramBot:
         Инициализация Telegram-бота.
         """
         self.bot = AsyncTeleBot(Config.TELEGRAM_BOT_TOKEN)
+
+        # Обновления (из polling и webhook) проходят отсев повторов и планировщик:
+        # по порядку для одного пользователя и параллельно для разных
+        self.update_scheduler = UpdateScheduler(self.bot.process_new_updates)
+        self.bot.process_new_updates = self._accept_updates
+        self._stop_event = None
+        self._stopping = False
+        # Обновления, пришедшие после начала остановки
+        self._late_updates = []
+        self._warmup_task = None
+
+        # Все исходящие сообщения проходят через диспетчер с ограничением частоты
+        self.outbound = OutboundDispatcher()
+        self.outbound_bot = RateLimitedBot(self.bot, self.outbound)
+
         self.session_manager = SessionManager()
+        self.session_janitor = SessionJanitor(self.session_manager)
+        self.update_dedup = UpdateDeduplicator(self.session_manager.store)
+
+        # Обработчик сценария протоколирования встречи
+        self.protocol_handler = ProtocolHandler(self.outbound_bot, self.session_manager)
 
         # Инициализация менеджера пользователей
         self.user_manager = UserManager(
@@ -34,11 +62,16 @@ class TelegramBot:
         )
 
         # Инициализация обработчиков команд администратора
-        self.admin_handlers = AdminHandlers(self.bot, self.user_manager)
+        self.admin_handlers = AdminHandlers(self.outbound_bot, self.user_manager)
 
         # Инициализация аутентификации с передачей менеджера пользователей и обработчиков админа
         self.auth = Auth(self.user_manager, self.admin_handlers)
 
+        # Маршрутизатор callback-запросов; обработчики регистрируют свои пространства имен
+        self.callback_router = CallbackRouter(self.outbound_bot)
+        self.protocol_handler.register_callbacks(self.callback_router)
+        self.admin_handlers.register_callbacks(self.callback_router)
+
         # Регистрация обработчиков команд
         self._register_handlers()
 
@@ -49,8 +82,8 @@ class TelegramBot:
         Регистрация обработчиков команд.
         """
         # Создаем декораторы для проверки прав доступа
-        auth_decorator = self.auth.auth_required(self.bot)
-        admin_decorator = self.auth.admin_required(self.bot)  # Новый декоратор для админа
+        auth_decorator = self.auth.auth_required(self.outbound_bot)
+        admin_decorator = self.auth.admin_required(self.outbound_bot)  # Новый декоратор для админа
 
         # Обработчик команды /start
         @self.bot.message_handler(commands=['start'])
@@ -68,7 +101,7 @@ class TelegramBot:
         @self.bot.message_handler(commands=['protocol'])
         @auth_decorator
         async def protocol_command(message):
-            await self._handle_protocol_start(message)
+            await self.protocol_handler.handle_protocol_start(message)
 
         # НОВЫЕ ОБРАБОТЧИКИ КОМАНД АДМИНИСТРАТОРА
 
@@ -100,25 +133,22 @@ class TelegramBot:
         @self.bot.message_handler(content_types=['text'])
         @auth_decorator
         async def text_message(message):
-            await self._handle_text_message(message)
+            await self.protocol_handler.handle_text_message(message)
 
         # Обработчик голосовых сообщений
         @self.bot.message_handler(content_types=['voice'])
         @auth_decorator
         async def voice_message(message):
-            await self._handle_voice_message(message)
+            # Распознавание может долго ждать слота очереди: обработчик обновлений
+            # освобождается, а сообщения этого пользователя ждут завершения
+            await self.update_scheduler.detach(self.protocol_handler.handle_voice_message(message))
 
         # НОВЫЙ ОБРАБОТЧИК CALLBACK-ЗАПРОСОВ
 
         # Обработчик callback-запросов от кнопок
         @self.bot.callback_query_handler(func=lambda call: True)
         async def callback_handler(call):
-            # Проверяем, относится ли callback к командам администратора
-            if (call.data.startswith('admin_') or
-                call.data.startswith('remove_user_') or
-                call.data.startswith('add_user_') or
-                call.data.startswith('block_user_')):
-                await self.admin_handlers.handle_admin_callback(call)
+            await self.callback_router.dispatch(call)
 
         logger.info("Обработчики команд зарегистрированы")
 
@@ -141,7 +171,7 @@ class TelegramBot:
                              "/adduser ID - Добавить пользователя\n" \
                              "/removeuser ID - Удалить пользователя"
 
-        await self.bot.send_message(
+        await self.outbound_bot.send_message(
             message.chat.id,
             f"Привет, {username}! Я бот для бизнес-задач дизайн-студии.\n\n"
             "Доступные команды:\n"
@@ -169,7 +199,7 @@ class TelegramBot:
                          "При попытке несанкционированного доступа администратор " \
                          "получает уведомление с кнопками для быстрого добавления пользователя."
 
-        await self.bot.send_message(
+        await self.outbound_bot.send_message(
             message.chat.id,
             "Справка по командам бота:\n\n"
             "/protocol - Запуск сценария протоколирования встречи\n"
@@ -185,286 +215,205 @@ class TelegramBot:
         
         logger.info(f"Пользователь {message.from_user.id} запросил справку")
     
-    async def _handle_protocol_start(self, message):
+    async def run(self):
         """
-        Обработчик команды /protocol.
-        Запускает сценарий протоколирования встречи.
-        
-        Args:
-            message: Объект сообщения Telegram.
+        Запуск бота. Работает до вызова stop() (например, по сигналу SIGTERM),
+        после чего выполняет согласованную остановку.
         """
-        user_id = message.from_user.id
+        # Проверка конфигурации
+        if not Config.validate():
+            logger.error("Ошибка в конфигурации бота")
+            return
+        
+        logger.info("Запуск Telegram-бота")
         
-        # Создаем новую сессию для пользователя
-        self.session_manager.create_session(user_id)
+        self._stop_event = asyncio.Event()
         
-        # Устанавливаем начальное состояние сессии
-        self.session_manager.update_session_state(user_id, "waiting_protocol_name")
+        # Запуск периодического сброса кэша сессий (для политики "interval")
+        self.session_manager.start_flush_task()
         
-        # Запрашиваем название протокола
-        await self.bot.send_message(
-            message.chat.id,
-            "Введите название протокола:"
+        # Запуск фоновой очистки истекших сессий
+        await self.session_janitor.start()
+        
+        # Загрузка ключей обработанных обновлений и запуск обработчиков обновлений
+        await self.update_dedup.load()
+        self.update_scheduler.start()
+        
+        # Фоновый прогрев тяжелых сервисов: бот отвечает на команды, не дожидаясь загрузки модели
+        if Config.SERVICES_WARMUP:
+            self._warmup_task = asyncio.create_task(self.protocol_handler.warm_up())
+        
+        # Возобновление обработки, прерванной предыдущей остановкой, затем
+        # обновления, которые к остановке не успели обработать
+        await self._resume_pending_jobs()
+        await self._replay_pending_updates()
+        
+        receiver = asyncio.create_task(
+            self._run_webhook() if Config.BOT_MODE == "webhook" else self._run_polling()
         )
+        stop_waiter = asyncio.create_task(self._stop_event.wait())
         
-        logger.info(f"Пользователь {user_id} запустил сценарий протоколирования встречи")
+        try:
+            await asyncio.wait({receiver, stop_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            await self._shutdown(receiver, stop_waiter)
+    
+    def stop(self):
+        """
+        Запрашивает остановку бота. Безопасно вызывать из обработчика сигнала.
+        """
+        if self._stop_event and not self._stop_event.is_set():
+            logger.info("Получен запрос на остановку бота")
+            self._stop_event.set()
     
-    async def _handle_text_message(self, message):
+    async def _shutdown(self, receiver, stop_waiter):
         """
-        Обработчик текстовых сообщений.
-        Обрабатывает сообщения в зависимости от текущего состояния сессии.
+        Согласованная остановка: прекращает прием обновлений, дожидается
+        обработки принятых до Config.SHUTDOWN_TIMEOUT_SECONDS, сохраняет
+        сессии и закрывает HTTP-сессии.
         
         Args:
-            message: Объект сообщения Telegram.
+            receiver (asyncio.Task): Задача получения обновлений (polling или webhook).
+            stop_waiter (asyncio.Task): Задача ожидания запроса на остановку.
         """
-        user_id = message.from_user.id
-        text = message.text
+        self._stopping = True
+        stop_waiter.cancel()
         
-        # Получаем текущее состояние сессии
-        state = self.session_manager.get_session_state(user_id)
+        # Прекращаем прием обновлений
+        receiver.cancel()
+        try:
+            await receiver
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Ошибка при получении обновлений: {str(e)}")
         
-        if not state:
-            # Если сессия не найдена, предлагаем начать сценарий
-            await self.bot.send_message(
-                message.chat.id,
-                "Для начала работы используйте команду /protocol"
-            )
-            return
+        # Дожидаемся обработки принятых обновлений; незавершенные к сроку распознавание
+        # и генерация PDF возобновятся после перезапуска по отметке в сессии
+        undelivered = await self.update_scheduler.stop(timeout=Config.SHUTDOWN_TIMEOUT_SECONDS)
+        undelivered += self._late_updates
         
-        # Обработка сообщения в зависимости от состояния сессии
-        if state == "waiting_protocol_name":
-            # Сохраняем название протокола
-            self.session_manager.update_session_data(
-                user_id,
-                {"metadata": {"protocol_name": text}}
-            )
-            
-            # Переходим к следующему шагу - запрос даты
-            self.session_manager.update_session_state(user_id, "waiting_date")
-            
-            await self.bot.send_message(
-                message.chat.id,
-                "Введите дату встречи:"
-            )
+        # Telegram уже считает эти обновления доставленными: сохраняем их до следующего запуска
+        await self._save_pending_updates(undelivered)
+        # Ключи обработанных обновлений дописываются до закрытия хранилища
+        await self.update_dedup.flush()
         
-        elif state == "waiting_date":
-            # Сохраняем дату
-            self.session_manager.update_session_data(
-                user_id,
-                {"metadata": {"date": text}}
-            )
-            
-            # Переходим к следующему шагу - запрос номера проекта
-            self.session_manager.update_session_state(user_id, "waiting_project_number")
-            
-            await self.bot.send_message(
-                message.chat.id,
-                "Введите номер проекта:"
-            )
+        if self._warmup_task:
+            self._warmup_task.cancel()
         
-        elif state == "waiting_project_number":
-            # Сохраняем номер проекта
-            self.session_manager.update_session_data(
-                user_id,
-                {"metadata": {"project_number": text}}
-            )
-            
-            # Переходим к следующему шагу - запрос года договора
-            self.session_manager.update_session_state(user_id, "waiting_contract_year")
-            
-            await self.bot.send_message(
-                message.chat.id,
-                "Введите год договора:"
-            )
+        await self.admin_handlers.stop()
+        await self.protocol_handler.close()
+        await self.outbound.stop()
+        await self.session_janitor.stop()
         
-        elif state == "waiting_contract_year":
-            # Сохраняем год договора
-            self.session_manager.update_session_data(
-                user_id,
-                {"metadata": {"contract_year": text}}
-            )
-            
-            # Переходим к следующему шагу - запрос типа проекта
-            self.session_manager.update_session_state(user_id, "waiting_project_type")
-            
-            await self.bot.send_message(
-                message.chat.id,
-                "Введите тип проекта:"
-            )
+        # Сохраняем несброшенные изменения сессий при остановке
+        await self.session_manager.close_async()
+        await self.bot.close_session()
+        shutdown_io_executor()
         
-        elif state == "waiting_project_type":
-            # Сохраняем тип проекта
-            self.session_manager.update_session_data(
-                user_id,
-                {"metadata": {"project_type": text}}
-            )
-            
-            # Переходим к следующему шагу - запрос названия ЖК/объекта
-            self.session_manager.update_session_state(user_id, "waiting_object_name")
-            
-            await self.bot.send_message(
-                message.chat.id,
-                "Введите название ЖК/объекта:"
-            )
+        logger.info(f"Бот остановлен, необработанных обновлений: {len(undelivered)}")
+    
+    async def _save_pending_updates(self, updates):
+        """
+        Сохраняет принятые, но не обработанные обновления в хранилище сессий.
         
-        elif state == "waiting_object_name":
-            # Сохраняем название ЖК/объекта
-            self.session_manager.update_session_data(
-                user_id,
-                {"metadata": {"object_name": text}}
-            )
-            
-            # Переходим к следующему шагу - запрос имени заказчика
-            self.session_manager.update_session_state(user_id, "waiting_client_name")
-            
-            await self.bot.send_message(
-                message.chat.id,
-                "Введите имя заказчика:"
-            )
+        Args:
+            updates (list): Список обновлений.
+        """
+        pending = []
         
-        elif state == "waiting_client_name":
-            # Сохраняем имя заказчика
-            self.session_manager.update_session_data(
-                user_id,
-                {"metadata": {"client_name": text}}
-            )
+        for update in updates:
+            data = serialize_update(update)
             
-            # Переходим к следующему шагу - запрос голосового сообщения с вопросами
-            self.session_manager.update_session_state(user_id, "waiting_questions_voice")
+            if data is None:
+                logger.warning(f"Обновление {update.update_id} не сохранено: нет исходных данных")
+                continue
             
-            await self.bot.send_message(
-                message.chat.id,
-                "Теперь отправьте голосовое сообщение с ключевыми вопросами встречи, указывая нумерацию вопросов."
-            )
+            pending.append(data)
         
-        elif state == "waiting_questions_confirmation":
-            # Обработка подтверждения списка вопросов
-            if text.lower() in ["да", "хорошо", "верно", "ок", "ok", "yes"]:
-                # Переходим к следующему шагу - запрос голосового сообщения с решениями
-                self.session_manager.update_session_state(user_id, "waiting_decisions_voice")
-                
-                await self.bot.send_message(
-                    message.chat.id,
-                    "Теперь отправьте голосовое сообщение с принятыми решениями, указывая нумерацию решений."
-                )
-            else:
-                # Возвращаемся к запросу голосового сообщения с вопросами
-                self.session_manager.update_session_state(user_id, "waiting_questions_voice")
-                
-                await self.bot.send_message(
-                    message.chat.id,
-                    "Пожалуйста, отправьте голосовое сообщение с ключевыми вопросами встречи повторно."
-                )
+        if not pending:
+            return
         
-        elif state == "waiting_decisions_confirmation":
-            # Обработка подтверждения списка решений
-            if text.lower() in ["да", "хорошо", "верно", "ок", "ok", "yes"]:
-                # Переходим к генерации PDF
-                self.session_manager.update_session_state(user_id, "generating_pdf")
-                
-                await self.bot.send_message(
-                    message.chat.id,
-                    "Генерирую итоговый PDF-документ..."
-                )
-                
-                # Здесь будет вызов функции генерации PDF
-                # await self._generate_and_send_pdf(message)
-                
-                # Временная заглушка
-                await self.bot.send_message(
-                    message.chat.id,
-                    "Функция генерации PDF будет реализована на следующем этапе."
-                )
-                
-                # Удаляем сессию
-                self.session_manager.delete_session(user_id)
-            else:
-                # Возвращаемся к запросу голосового сообщения с решениями
-                self.session_manager.update_session_state(user_id, "waiting_decisions_voice")
-                
-                await self.bot.send_message(
-                    message.chat.id,
-                    "Пожалуйста, отправьте голосовое сообщение с принятыми решениями повторно."
-                )
+        try:
+            await run_io(self.session_manager.store.save_pending_updates, pending)
+            logger.info(f"Сохранено необработанных обновлений: {len(pending)}")
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении необработанных обновлений: {str(e)}")
     
-    async def _handle_voice_message(self, message):
+    async def _replay_pending_updates(self):
         """
-        Обработчик голосовых сообщений.
-        Обрабатывает голосовые сообщения в зависимости от текущего состояния сессии.
-        
-        Args:
-            message: Объект сообщения Telegram.
+        Ставит в очередь обновления, сохраненные при предыдущей остановке. Они
+        уже учтены в отсеве повторов, поэтому передаются планировщику напрямую.
         """
-        user_id = message.from_user.id
-        
-        # Получаем текущее состояние сессии
-        state = self.session_manager.get_session_state(user_id)
-        
-        if not state:
-            # Если сессия не найдена, предлагаем начать сценарий
-            await self.bot.send_message(
-                message.chat.id,
-                "Для начала работы используйте команду /protocol"
-            )
+        try:
+            pending = await run_io(self.session_manager.store.take_pending_updates)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке необработанных обновлений: {str(e)}")
             return
         
-        # Обработка голосового сообщения в зависимости от состояния сессии
-        if state == "waiting_questions_voice":
-            # Здесь будет обработка голосового сообщения с вопросами
-            # Скачивание файла, распознавание речи через Whisper, форматирование через Ollama
-            
-            # Временная заглушка
-            await self.bot.send_message(
-                message.chat.id,
-                "Распознавание речи и обработка текста будут реализованы на следующем этапе.\n\n"
-                "Пример распознанного текста:\n"
-                "1. 3D-визуализация спальни\n"
-                "2. Подбор мебели в детскую\n\n"
-                "Всё верно?"
-            )
-            
-            # Переходим к подтверждению списка вопросов
-            self.session_manager.update_session_state(user_id, "waiting_questions_confirmation")
-            
-            # Сохраняем пример списка вопросов
-            self.session_manager.update_session_data(
-                user_id,
-                {"questions": "1. 3D-визуализация спальни\n2. Подбор мебели в детскую"}
-            )
+        if pending:
+            await self.update_scheduler.submit([types.Update.de_json(data) for data in pending])
+            logger.info(f"Повторно обрабатываются обновления предыдущего запуска: {len(pending)}")
+    
+    async def _resume_pending_jobs(self):
+        """
+        Ставит в очереди пользователей возобновление прерванной обработки.
+        """
+        user_ids = await run_io(self.session_manager.list_sessions_with, "pending_job")
         
-        elif state == "waiting_decisions_voice":
-            # Здесь будет обработка голосового сообщения с решениями
-            # Скачивание файла, распознавание речи через Whisper, форматирование через Ollama
-            
-            # Временная заглушка
-            await self.bot.send_message(
-                message.chat.id,
-                "Распознавание речи и обработка текста будут реализованы на следующем этапе.\n\n"
-                "Пример распознанного текста:\n"
-                "1. Подготовить 3D-визуализацию спальни к следующей встрече\n"
-                "2. Составить список рекомендуемой мебели для детской\n\n"
-                "Всё верно?"
-            )
-            
-            # Переходим к подтверждению списка решений
-            self.session_manager.update_session_state(user_id, "waiting_decisions_confirmation")
-            
-            # Сохраняем пример списка решений
-            self.session_manager.update_session_data(
+        for user_id in user_ids:
+            self.update_scheduler.submit_job(
                 user_id,
-                {"decisions": "1. Подготовить 3D-визуализацию спальни к следующей встрече\n2. Составить список рекомендуемой мебели для детской"}
+                lambda user_id=user_id: self.update_scheduler.detach(self.protocol_handler.resume_pending_job(user_id))
             )
+        
+        if user_ids:
+            logger.info(f"Возобновляется прерванная обработка пользователей: {len(user_ids)}")
     
-    async def run(self):
+    async def _accept_updates(self, updates):
         """
-        Запуск бота.
+        Принимает обновления из polling или webhook: отбрасывает повторно
+        доставленные и ставит остальные в очередь обработки.
+        
+        Args:
+            updates (list): Список обновлений.
         """
-        # Проверка конфигурации
-        if not Config.validate():
-            logger.error("Ошибка в конфигурации бота")
+        # Между отсевом повторов и постановкой в очередь нет ожидания: пакеты
+        # попадают в очереди пользователей в порядке приема
+        updates = self.update_dedup.filter(updates)
+        
+        # После начала остановки обновления не обрабатываются, а сохраняются вместе
+        # с оставшимися в очереди: Telegram их повторно не доставит
+        if self._stopping:
+            self._late_updates.extend(updates)
             return
         
-        logger.info("Запуск Telegram-бота")
+        await self.update_scheduler.submit(updates)
+    
+    async def _run_polling(self):
+        """
+        Получение обновлений в режиме long polling.
+        """
+        # Telegram не отдает обновления через getUpdates, пока установлен webhook
+        await self.bot.delete_webhook()
         
-        # Запуск бота в режиме polling
         await self.bot.polling(non_stop=True)
+    
+    async def _run_webhook(self):
+        """
+        Получение обновлений через встроенный сервер webhook.
+        """
+        server = WebhookServer(self.bot)
+        await server.start()
+        
+        try:
+            await self.bot.set_webhook(
+                url=Config.WEBHOOK_URL,
+                secret_token=Config.WEBHOOK_SECRET_TOKEN
+            )
+            logger.info(f"Webhook установлен: {Config.WEBHOOK_URL}")
+            
+            # Обновления приходят в обработчик сервера, ждем до остановки бота
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
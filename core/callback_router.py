@@ -0,0 +1,148 @@
+"""
+Маршрутизатор callback-запросов от inline-кнопок.
+
+Обработчики регистрируют пространства имен - префиксы callback_data
+(например, "remove_user_"). Поиск обработчика выполняется по префиксному
+дереву за O(len(data)) и выбирает самый длинный совпавший префикс.
+Остаток данных после префикса разбирается в типизированное значение
+(например, идентификатор пользователя) и передается обработчику.
+
+На callback-запросы без обработчика или с некорректными данными
+маршрутизатор отвечает сам, чтобы клиент Telegram не ждал ответа бесконечно.
+"""
+import logging
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def choice(*values):
+    """
+    Создает разборщик данных, допускающий только указанные значения.
+
+    Args:
+        *values (str): Допустимые значения.
+
+    Returns:
+        callable: Функция разбора, вызывающая ValueError для прочих значений.
+    """
+    allowed = frozenset(values)
+
+    def parse(payload):
+        if payload not in allowed:
+            raise ValueError(f"Недопустимое значение: {payload}")
+        return payload
+
+    return parse
+
+class CallbackRoute:
+    """
+    Зарегистрированное пространство имен callback-запросов.
+    """
+
+    def __init__(self, prefix, handler, parser=None, auto_answer=True):
+        """
+        Инициализация маршрута.
+
+        Args:
+            prefix (str): Префикс callback_data.
+            handler (callable): async-обработчик (call, payload).
+            parser (callable): Разбор остатка данных (например, int). None - строка без изменений.
+            auto_answer (bool): Отвечать ли на запрос после обработчика.
+        """
+        self.prefix = prefix
+        self.handler = handler
+        self.parser = parser
+        self.auto_answer = auto_answer
+
+class CallbackRouter:
+    """
+    Класс маршрутизатора callback-запросов.
+    """
+
+    def __init__(self, bot):
+        """
+        Инициализация маршрутизатора.
+
+        Args:
+            bot: Объект Telegram-бота (для ответов на callback-запросы).
+        """
+        self.bot = bot
+        # Узел дерева: [дочерние узлы по символу, маршрут или None]
+        self._root = [{}, None]
+
+    def register(self, prefix, handler, parser=None, auto_answer=True):
+        """
+        Регистрирует пространство имен callback-запросов.
+
+        Args:
+            prefix (str): Префикс callback_data.
+            handler (callable): async-обработчик (call, payload).
+            parser (callable): Разбор остатка данных после префикса.
+            auto_answer (bool): Отвечать ли на запрос после обработчика.
+                False, если обработчик отвечает сам (например, с текстом).
+        """
+        node = self._root
+
+        for char in prefix:
+            node = node[0].setdefault(char, [{}, None])
+
+        if node[1] is not None:
+            raise ValueError(f"Префикс callback-запросов уже зарегистрирован: {prefix}")
+
+        node[1] = CallbackRoute(prefix, handler, parser, auto_answer)
+
+    def match(self, data):
+        """
+        Находит маршрут с самым длинным префиксом данных.
+
+        Args:
+            data (str): callback_data.
+
+        Returns:
+            CallbackRoute: Маршрут или None.
+        """
+        node = self._root
+        route = node[1]
+
+        for char in data or "":
+            node = node[0].get(char)
+
+            if node is None:
+                break
+
+            if node[1] is not None:
+                route = node[1]
+
+        return route
+
+    async def dispatch(self, call):
+        """
+        Передает callback-запрос обработчику его пространства имен.
+
+        Args:
+            call: Объект callback-запроса Telegram.
+        """
+        route = self.match(call.data)
+
+        if route is None:
+            metrics.increment("callbacks_unknown_total")
+            logger.warning(f"Необработанный callback-запрос от пользователя {call.from_user.id}: {call.data}")
+            await self.bot.answer_callback_query(call.id)
+            return
+
+        payload = call.data[len(route.prefix):]
+
+        if route.parser:
+            try:
+                payload = route.parser(payload)
+            except ValueError:
+                metrics.increment("callbacks_invalid_total")
+                logger.warning(f"Некорректные данные callback-запроса от пользователя {call.from_user.id}: {call.data}")
+                await self.bot.answer_callback_query(call.id, text="Кнопка устарела или содержит некорректные данные.")
+                return
+
+        try:
+            await route.handler(call, payload)
+        finally:
+            if route.auto_answer:
+                await self.bot.answer_callback_query(call.id)
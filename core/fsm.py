@@ -0,0 +1,450 @@
+"""
+Табличный движок сценариев (конечный автомат) Telegram-бота.
+
+Сценарий описывается данными: список шагов с состоянием, подсказкой,
+целевым полем сессии, валидатором и следующим состоянием. Движок
+находит шаг по состоянию сессии словарем за O(1) и выполняет переход
+через SessionManager.transition_async.
+
+Шаги, требующие кода (распознавание голоса, генерация PDF), ссылаются
+на именованные действия, которые регистрирует обработчик. Перед запуском
+действия в сессии сохраняется отметка pending_job, по которой прерванная
+остановкой бота обработка возобновляется после перезапуска.
+"""
+import time
+import logging
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+# Ответы пользователя, считающиеся подтверждением
+YES_ANSWERS = frozenset(["да", "хорошо", "верно", "ок", "ok", "yes"])
+
+def validate_not_empty(text):
+    """
+    Валидатор непустого текста.
+
+    Args:
+        text (str): Введенный текст.
+
+    Returns:
+        str: Текст без пробелов по краям или None, если он пустой.
+    """
+    text = (text or "").strip()
+    return text or None
+
+class Step:
+    """
+    Шаг сценария.
+    """
+
+    # Виды шагов
+    TEXT = "text"        # ввод текста в поле сессии
+    VOICE = "voice"      # голосовое сообщение, обрабатываемое действием
+    CONFIRM = "confirm"  # подтверждение да/нет
+    ACTION = "action"    # действие, выполняемое при входе в состояние
+
+    def __init__(self, state, kind=TEXT, prompt=None, field=None, next_state=None,
+                 validator=None, error_prompt=None, retry_state=None, retry_prompt=None,
+                 action=None, params=None):
+        """
+        Инициализация шага сценария.
+
+        Args:
+            state (str): Состояние сессии, в котором выполняется шаг.
+            kind (str): Вид шага (Step.TEXT, Step.VOICE, Step.CONFIRM, Step.ACTION).
+            prompt (str): Сообщение при входе в состояние. Может содержать {value} -
+                результат предыдущего шага.
+            field (str): Поле сессии для результата шага, вложенность через точку ("metadata.date").
+            next_state (str): Следующее состояние (для подтверждения - при ответе "да").
+            validator (callable): Функция проверки текста, возвращает значение или None.
+            error_prompt (str): Сообщение при непрошедшей проверке.
+            retry_state (str): Состояние при отказе в подтверждении.
+            retry_prompt (str): Сообщение при отказе в подтверждении.
+            action (str): Имя действия для шагов Step.VOICE и Step.ACTION.
+            params (dict): Параметры действия.
+        """
+        self.state = state
+        self.kind = kind
+        self.prompt = prompt
+        self.field = field
+        self.next_state = next_state
+        self.validator = validator
+        self.error_prompt = error_prompt
+        self.retry_state = retry_state
+        self.retry_prompt = retry_prompt
+        self.action = action
+        self.params = params or {}
+
+    def field_update(self, value):
+        """
+        Формирует обновление данных сессии для значения шага.
+
+        Args:
+            value: Значение поля.
+
+        Returns:
+            dict: Обновление данных сессии или None, если поле не задано.
+        """
+        if not self.field:
+            return None
+
+        update = value
+        for key in reversed(self.field.split(".")):
+            update = {key: update}
+
+        return update
+
+class Scenario:
+    """
+    Сценарий - набор шагов, запускаемый командой.
+    """
+
+    def __init__(self, name, command, initial_state, steps):
+        """
+        Инициализация сценария.
+
+        Args:
+            name (str): Имя сценария (хранится в сессии).
+            command (str): Команда запуска без "/".
+            initial_state (str): Начальное состояние.
+            steps (list): Шаги сценария.
+        """
+        self.name = name
+        self.command = command
+        self.initial_state = initial_state
+        self.steps = {step.state: step for step in steps}
+
+        # Заранее вычисленные подсказки для каждого состояния
+        self.prompts = {step.state: step.prompt for step in steps if step.prompt}
+
+        for step in steps:
+            for target in (step.next_state, step.retry_state):
+                if target and target not in self.steps:
+                    raise ValueError(f"Сценарий {name}: шаг {step.state} ссылается на неизвестное состояние {target}")
+
+        if initial_state not in self.steps:
+            raise ValueError(f"Сценарий {name}: неизвестное начальное состояние {initial_state}")
+
+class ScenarioEngine:
+    """
+    Движок выполнения сценариев.
+    """
+
+    def __init__(self, bot, session_manager, scenarios, actions=None, confirm_markup=None):
+        """
+        Инициализация движка сценариев.
+
+        Args:
+            bot: Объект Telegram-бота.
+            session_manager: Объект менеджера сессий.
+            scenarios (list): Сценарии. Первый используется для сессий без указанного сценария.
+            actions (dict): Действия по имени: async callable(message, step, session_data).
+                Действие голосового шага возвращает значение для поля шага или None при ошибке.
+            confirm_markup (callable): Возвращает по состоянию шага клавиатуру, прикрепляемую
+                к запросу подтверждения (например, кнопки да/нет с состоянием в callback_data).
+        """
+        self.bot = bot
+        self.session_manager = session_manager
+        self.confirm_markup = confirm_markup
+        self.scenarios = {scenario.name: scenario for scenario in scenarios}
+        self.commands = {scenario.command: scenario for scenario in scenarios}
+        self.default_scenario = scenarios[0]
+        self.actions = dict(actions or {})
+
+        # Обработчики текстовых сообщений по виду шага
+        self._text_handlers = {
+            Step.TEXT: self._handle_text_step,
+            Step.CONFIRM: self._handle_confirm_step,
+        }
+
+        for scenario in scenarios:
+            for step in scenario.steps.values():
+                if step.action and step.action not in self.actions:
+                    raise ValueError(f"Сценарий {scenario.name}: действие {step.action} не зарегистрировано")
+
+    async def start(self, message, command):
+        """
+        Запускает сценарий по команде.
+
+        Args:
+            message: Объект сообщения Telegram.
+            command (str): Команда запуска без "/".
+        """
+        scenario = self.commands[command]
+        user_id = message.from_user.id
+
+        # Создаем новую сессию сразу в начальном состоянии сценария
+        await self.session_manager.create_session_async(
+            user_id,
+            initial_state=scenario.initial_state,
+            initial_data={"scenario": scenario.name}
+        )
+
+        await self._enter(message, scenario, scenario.initial_state, None)
+
+        logger.info(f"Пользователь {user_id} запустил сценарий {scenario.name}")
+
+    async def handle_text(self, message):
+        """
+        Обрабатывает текстовое сообщение в зависимости от состояния сессии.
+
+        Args:
+            message: Объект сообщения Telegram.
+        """
+        session_data, scenario, step = await self._current_step(message)
+
+        if not step:
+            return
+
+        handler = self._text_handlers.get(step.kind)
+
+        if handler:
+            await handler(message, scenario, step, session_data)
+
+    async def handle_voice(self, message):
+        """
+        Обрабатывает голосовое сообщение в зависимости от состояния сессии.
+
+        Args:
+            message: Объект сообщения Telegram.
+        """
+        session_data, scenario, step = await self._current_step(message)
+
+        if not step or step.kind != Step.VOICE:
+            return
+
+        await self._checkpoint(message, step)
+
+        value = await self.actions[step.action](message, step, session_data)
+
+        if value is None:
+            # Снятие отметки сразу записывается в хранилище, иначе завершенная
+            # обработка будет возобновлена после перезапуска
+            await self.session_manager.update_session_data_async(message.from_user.id, {"pending_job": None})
+            await self.session_manager.flush_async(message.from_user.id)
+            return
+
+        await self._advance(message, scenario, step, step.next_state, value)
+
+    async def resume(self, user_id):
+        """
+        Возобновляет обработку, прерванную остановкой бота (по отметке pending_job).
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+
+        Returns:
+            bool: True, если обработка возобновлена.
+        """
+        session_data = await self.session_manager.get_session_data_async(user_id)
+        job = (session_data or {}).get("pending_job")
+
+        if not job:
+            return False
+
+        scenario = self.scenarios.get(session_data.get("scenario"), self.default_scenario)
+        step = scenario.steps.get(session_data.get("state"))
+
+        # Сессия успела перейти дальше - возобновлять нечего
+        if step is None or step.state != job["state"]:
+            await self.session_manager.update_session_data_async(user_id, {"pending_job": None})
+            await self.session_manager.flush_async(user_id)
+            return False
+
+        message = SimpleNamespace(
+            from_user=SimpleNamespace(id=user_id),
+            chat=SimpleNamespace(id=job["chat_id"]),
+            text=None,
+            voice=SimpleNamespace(
+                file_id=job["file_id"],
+                file_unique_id=job.get("file_unique_id")
+            ) if job.get("file_id") else None
+        )
+
+        logger.info(f"Возобновление обработки пользователя {user_id} в состоянии {step.state}")
+
+        await self.bot.send_message(
+            message.chat.id,
+            "Бот был перезапущен. Продолжаю обработку вашего запроса..."
+        )
+
+        if step.kind == Step.VOICE:
+            await self.handle_voice(message)
+        elif step.kind == Step.ACTION:
+            await self._checkpoint(message, step)
+            await self.actions[step.action](message, step, session_data)
+
+        return True
+
+    async def handle_confirmation(self, message, confirmed, state):
+        """
+        Обрабатывает ответ на запрос подтверждения, полученный не текстом (например, кнопкой).
+        Кнопка под старым запросом не должна подтверждать другой шаг, поэтому
+        ответ принимается, только если сессия все еще в состоянии запроса.
+
+        Args:
+            message: Объект с from_user и chat пользователя.
+            confirmed (bool): Подтвердил ли пользователь результат.
+            state (str): Состояние шага, к запросу которого относится ответ.
+
+        Returns:
+            bool: True, если ответ принят.
+        """
+        session_data, scenario, step = await self._current_step(message)
+
+        if not step or step.kind != Step.CONFIRM or step.state != state:
+            return False
+
+        return await self._confirm(message, scenario, step, confirmed)
+
+    async def _current_step(self, message):
+        """
+        Находит текущий шаг сценария пользователя.
+
+        Args:
+            message: Объект сообщения Telegram.
+
+        Returns:
+            tuple: (данные сессии, сценарий, шаг); шаг равен None, если обрабатывать нечего.
+        """
+        session_data = await self.session_manager.get_session_data_async(message.from_user.id)
+
+        if not session_data:
+            # Если сессия не найдена, предлагаем начать сценарий
+            await self.bot.send_message(
+                message.chat.id,
+                f"Для начала работы используйте команду /{self.default_scenario.command}"
+            )
+            return session_data, None, None
+
+        scenario = self.scenarios.get(session_data.get("scenario"), self.default_scenario)
+
+        return session_data, scenario, scenario.steps.get(session_data.get("state"))
+
+    async def _handle_text_step(self, message, scenario, step, session_data):
+        """
+        Обрабатывает ввод текста в поле сессии.
+        """
+        value = step.validator(message.text) if step.validator else message.text
+
+        if value is None:
+            await self.bot.send_message(message.chat.id, step.error_prompt or scenario.prompts[step.state])
+            return
+
+        await self._advance(message, scenario, step, step.next_state, value)
+
+    async def _handle_confirm_step(self, message, scenario, step, session_data):
+        """
+        Обрабатывает ответ на запрос подтверждения.
+        """
+        # Ответ текстом: кнопки под запросом больше не нужны
+        await self._remove_confirm_markup(message, session_data)
+        await self._confirm(message, scenario, step, (message.text or "").strip().lower() in YES_ANSWERS)
+
+    async def _confirm(self, message, scenario, step, confirmed):
+        """
+        Переходит дальше по сценарию или к повторному вводу в зависимости от ответа.
+
+        Returns:
+            bool: True, если переход выполнен.
+        """
+        if confirmed:
+            return await self._advance(message, scenario, step, step.next_state, None)
+
+        # Возвращаемся к шагу повторного ввода
+        if not await self.session_manager.transition_async(
+            message.from_user.id,
+            step.retry_state,
+            expected_state=step.state
+        ):
+            return False
+
+        await self.bot.send_message(message.chat.id, step.retry_prompt or scenario.prompts[step.retry_state])
+        return True
+
+    async def _remove_confirm_markup(self, message, session_data):
+        """
+        Убирает кнопки из запроса подтверждения (идентификатор сообщения сохранен в сессии).
+        """
+        message_id = session_data.get("confirm_message_id")
+
+        if not message_id:
+            return
+
+        try:
+            await self.bot.edit_message_reply_markup(chat_id=message.chat.id, message_id=message_id, reply_markup=None)
+        except Exception as e:
+            # Сообщение могло быть удалено или кнопки уже убраны
+            logger.warning(f"Не удалось убрать кнопки запроса подтверждения: {str(e)}")
+
+    async def _advance(self, message, scenario, step, next_state, value):
+        """
+        Сохраняет значение шага и переходит в следующее состояние одной записью.
+
+        Returns:
+            bool: True, если переход выполнен.
+        """
+        data_update = step.field_update(value) if value is not None else None
+
+        # Результат действия сохраняется вместе со снятием отметки о незавершенной обработке
+        if step.kind == Step.VOICE:
+            data_update = dict(data_update or {}, pending_job=None)
+
+        if not await self.session_manager.transition_async(
+            message.from_user.id,
+            next_state,
+            data_update,
+            expected_state=step.state
+        ):
+            return False
+
+        await self._enter(message, scenario, next_state, value)
+        return True
+
+    async def _enter(self, message, scenario, state, value):
+        """
+        Выполняет вход в состояние: отправляет подсказку и запускает действие шага.
+        """
+        step = scenario.steps[state]
+        prompt = scenario.prompts.get(state)
+
+        markup = self.confirm_markup(state) if self.confirm_markup and step.kind == Step.CONFIRM else None
+
+        if prompt:
+            sent = await self.bot.send_message(
+                message.chat.id,
+                prompt.format(value=value) if value is not None else prompt,
+                reply_markup=markup
+            )
+
+            # Кнопки убираются, если пользователь ответит на запрос текстом
+            if markup is not None:
+                await self.session_manager.update_session_data_async(
+                    message.from_user.id,
+                    {"confirm_message_id": sent.message_id}
+                )
+
+        if step.kind == Step.ACTION:
+            await self._checkpoint(message, step)
+            session_data = await self.session_manager.get_session_data_async(message.from_user.id)
+            await self.actions[step.action](message, step, session_data)
+
+    async def _checkpoint(self, message, step):
+        """
+        Сохраняет в сессии отметку о запущенной долгой обработке.
+        Отметка сразу записывается в хранилище, чтобы пережить перезапуск бота.
+        """
+        voice = getattr(message, "voice", None)
+        user_id = message.from_user.id
+
+        await self.session_manager.update_session_data_async(user_id, {
+            "pending_job": {
+                "state": step.state,
+                "chat_id": message.chat.id,
+                "file_id": voice.file_id if voice else None,
+                "file_unique_id": getattr(voice, "file_unique_id", None),
+                "started_at": time.time(),
+            }
+        })
+        await self.session_manager.flush_async(user_id)
@@ -0,0 +1,191 @@
+"""
+Ограниченная очередь тяжелых задач (распознавание голосовых сообщений).
+
+Одновременно выполняется не более concurrency задач, еще не более
+max_waiting ожидают в очереди FIFO; новые задачи сверх этого отклоняются
+исключением JobQueueFull. Ожидающим задачам сообщается их позиция
+в очереди и оценка времени ожидания по средней длительности задачи;
+уведомления о продвижении очереди отправляются фоновой задачей, чтобы
+их длительность не добавлялась к задачам.
+"""
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class JobQueueFull(Exception):
+    """
+    Исключение при переполненной очереди задач.
+    """
+
+class JobQueue:
+    """
+    Класс ограниченной очереди задач.
+    """
+
+    # Вес последней задачи в скользящей средней длительности
+    DURATION_SMOOTHING = 0.3
+
+    def __init__(self, name, concurrency, max_waiting, estimated_duration):
+        """
+        Инициализация очереди.
+
+        Args:
+            name (str): Имя очереди (префикс метрик).
+            concurrency (int): Количество одновременно выполняемых задач.
+            max_waiting (int): Максимальное количество ожидающих задач.
+            estimated_duration (float): Начальная оценка длительности задачи (в секундах).
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.average_duration = estimated_duration
+        self.running = 0
+        # Ожидающие задачи: [future разрешения на запуск, callback позиции]
+        self._waiting = deque()
+        # Фоновая задача уведомлений о позициях и признак, что очередь сдвинулась во время уведомлений
+        self._notifier = None
+        self._renotify = False
+
+    @property
+    def full(self):
+        """
+        Признак переполненной очереди: новая задача будет отклонена.
+        """
+        return self.running >= self.concurrency and len(self._waiting) >= self.max_waiting
+
+    def estimate_wait(self, position):
+        """
+        Оценивает время ожидания задачи на указанной позиции.
+
+        Args:
+            position (int): Позиция в очереди (с 1).
+
+        Returns:
+            float: Оценка ожидания в секундах.
+        """
+        return math.ceil(position / self.concurrency) * self.average_duration
+
+    async def run(self, func, *args, on_position=None, **kwargs):
+        """
+        Выполняет задачу, дождавшись своей очереди.
+
+        Args:
+            func (callable): async-функция задачи.
+            *args: Позиционные аргументы задачи.
+            on_position (callable): async-функция (position, eta), вызываемая при постановке
+                в очередь и при каждом продвижении; position 0 означает начало выполнения.
+            **kwargs: Именованные аргументы задачи.
+
+        Returns:
+            Результат задачи.
+
+        Raises:
+            JobQueueFull: Если очередь переполнена.
+        """
+        if self.full:
+            metrics.increment(f"{self.name}_rejected_total")
+            raise JobQueueFull(self.name)
+
+        enqueued = time.monotonic()
+
+        if self.running >= self.concurrency or self._waiting:
+            entry = [asyncio.get_running_loop().create_future(), on_position]
+            self._waiting.append(entry)
+            self._update_gauges()
+
+            await self._notify(on_position, len(self._waiting))
+
+            try:
+                await entry[0]
+            except asyncio.CancelledError:
+                # Отмененная задача освобождает свое место в очереди
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    self._update_gauges()
+                    self._schedule_notify_positions()
+                elif entry[0].done() and not entry[0].cancelled():
+                    self._release()
+                raise
+        else:
+            self.running += 1
+
+        metrics.observe(f"{self.name}_wait_seconds", time.monotonic() - enqueued)
+        self._update_gauges()
+
+        await self._notify(on_position, 0)
+
+        started = time.monotonic()
+
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            duration = time.monotonic() - started
+            self.average_duration += self.DURATION_SMOOTHING * (duration - self.average_duration)
+            metrics.observe(f"{self.name}_duration_seconds", duration)
+
+            self._release()
+            self._schedule_notify_positions()
+
+    def _release(self):
+        """
+        Освобождает место выполнения и передает его первой ожидающей задаче.
+        """
+        while self._waiting:
+            future, _ = self._waiting.popleft()
+
+            # Задача отменена, но еще не успела убрать себя из очереди
+            if future.done():
+                continue
+
+            # Место сразу переходит следующей задаче, счетчик выполняемых не меняется
+            future.set_result(None)
+            break
+        else:
+            self.running -= 1
+
+        self._update_gauges()
+
+    def _schedule_notify_positions(self):
+        """
+        Запускает фоновое уведомление ожидающих задач о новых позициях.
+        """
+        if not self._waiting:
+            return
+
+        if self._notifier is not None and not self._notifier.done():
+            # Текущее уведомление пройдет по очереди еще раз
+            self._renotify = True
+            return
+
+        self._notifier = asyncio.create_task(self._notify_positions())
+
+    async def _notify_positions(self):
+        """
+        Сообщает ожидающим задачам их новые позиции.
+        """
+        while True:
+            self._renotify = False
+
+            for position, (_, on_position) in enumerate(list(self._waiting), start=1):
+                await self._notify(on_position, position)
+
+            if not self._renotify:
+                break
+
+    async def _notify(self, on_position, position):
+        if not on_position:
+            return
+
+        try:
+            await on_position(position, self.estimate_wait(position) if position else 0)
+        except Exception as e:
+            logger.warning(f"Ошибка при уведомлении о позиции в очереди {self.name}: {str(e)}")
+
+    def _update_gauges(self):
+        metrics.set_gauge(f"{self.name}_running", self.running)
+        metrics.set_gauge(f"{self.name}_waiting", len(self._waiting))
@@ -0,0 +1,315 @@
+"""
+Централизованная отправка исходящих запросов к Telegram Bot API.
+
+Telegram ограничивает частоту сообщений: около 30 в секунду на бота
+и около одного в секунду в один чат; при превышении API отвечает
+ошибкой 429 с параметром retry_after. OutboundDispatcher пропускает все
+исходящие запросы через два token bucket (общий и на чат), соблюдает
+retry_after при ошибке 429 и обслуживает ожидающие запросы по приоритету:
+ответы пользователям уходят раньше уведомлений администратору.
+
+Обработчики работают с RateLimitedBot - оберткой над AsyncTeleBot
+с теми же методами, которые проходят через диспетчер.
+"""
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from telebot.apihelper import ApiTelegramException
+from config.config import Config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих запросов (меньше - раньше)
+PRIORITY_HIGH = 0    # ответы пользователям
+PRIORITY_LOW = 10    # уведомления администратору и прочий фоновый трафик
+
+class TokenBucket:
+    """
+    Класс ограничителя частоты "token bucket".
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Инициализация ограничителя.
+
+        Args:
+            rate (float): Скорость пополнения (токенов в секунду).
+            capacity (float): Емкость (допустимый всплеск). По умолчанию max(1, rate).
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, now=None):
+        """
+        Возвращает время до появления токена.
+
+        Args:
+            now (float): Текущее время (time.monotonic()).
+
+        Returns:
+            float: Задержка в секундах (0, если токен доступен).
+        """
+        now = now or time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        if self.tokens >= 1:
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        """
+        Забирает один токен.
+        """
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        """
+        Приостанавливает выдачу токенов (например, по retry_after).
+
+        Args:
+            seconds (float): Длительность паузы.
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    @property
+    def full(self):
+        """
+        Признак полного ограничителя (состояние не отличается от нового).
+        """
+        return self.delay() == 0 and self.tokens >= self.capacity
+
+class OutboundDispatcher:
+    """
+    Класс диспетчера исходящих запросов.
+    """
+
+    # Количество чатов, после которого удаляются состояния простаивающих чатов
+    PRUNE_THRESHOLD = 1000
+
+    def __init__(self, global_rate=None, chat_rate=None, chat_burst=None, max_retries=None):
+        """
+        Инициализация диспетчера.
+
+        Args:
+            global_rate (float): Запросов в секунду на бота. По умолчанию Config.OUTBOUND_GLOBAL_RATE.
+            chat_rate (float): Запросов в секунду в один чат. По умолчанию Config.OUTBOUND_CHAT_RATE.
+            chat_burst (int): Допустимый всплеск в один чат. По умолчанию Config.OUTBOUND_CHAT_BURST.
+            max_retries (int): Повторов при ошибке 429. По умолчанию Config.OUTBOUND_MAX_RETRIES.
+        """
+        self.global_bucket = TokenBucket(global_rate or Config.OUTBOUND_GLOBAL_RATE)
+        self.chat_rate = chat_rate or Config.OUTBOUND_CHAT_RATE
+        self.chat_burst = chat_burst or Config.OUTBOUND_CHAT_BURST
+        self.max_retries = max_retries if max_retries is not None else Config.OUTBOUND_MAX_RETRIES
+
+        # Состояние чатов: (token bucket, блокировка порядка отправки)
+        self._chats = {}
+        # Ожидающие общего токена: (приоритет, порядковый номер, future)
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def call(self, chat_id, func, *args, priority=PRIORITY_HIGH, **kwargs):
+        """
+        Выполняет запрос к API с учетом ограничений частоты.
+
+        Args:
+            chat_id: Идентификатор чата (None для запросов без чата).
+            func (callable): async-метод AsyncTeleBot.
+            *args: Позиционные аргументы метода.
+            priority (int): Приоритет запроса (PRIORITY_HIGH, PRIORITY_LOW).
+            **kwargs: Именованные аргументы метода.
+
+        Returns:
+            Результат метода API.
+        """
+        if chat_id is None:
+            return await self._call_with_retries(None, func, args, kwargs, priority)
+
+        bucket, lock = self._chat_state(chat_id)
+
+        # Блокировка чата сохраняет порядок сообщений в чате
+        async with lock:
+            return await self._call_with_retries(bucket, func, args, kwargs, priority)
+
+    async def stop(self):
+        """
+        Останавливает задачу выдачи токенов.
+        """
+        if not self._task:
+            return
+
+        self._task.cancel()
+
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+        self._task = None
+
+    async def _call_with_retries(self, bucket, func, args, kwargs, priority):
+        """
+        Выполняет запрос, повторяя его после retry_after при ошибке 429.
+        """
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+
+            if bucket:
+                delay = bucket.delay()
+                while delay > 0:
+                    await asyncio.sleep(delay)
+                    delay = bucket.delay()
+
+            await self._acquire_global(priority)
+
+            if bucket:
+                bucket.consume()
+
+            metrics.observe("outbound_wait_ms", (time.monotonic() - started) * 1000)
+            metrics.increment("outbound_requests_total")
+
+            try:
+                return await func(*args, **kwargs)
+            except ApiTelegramException as e:
+                if e.error_code != 429 or attempt == self.max_retries:
+                    raise
+
+                retry_after = (e.result_json.get("parameters") or {}).get("retry_after", 1)
+                metrics.increment("outbound_flood_wait_total")
+                logger.warning(f"Превышен лимит Telegram ({func.__name__}), повтор через {retry_after} с")
+
+                if bucket:
+                    bucket.pause(retry_after)
+                else:
+                    await asyncio.sleep(retry_after)
+
+                # Файлы, прочитанные неудачным запросом, отправляем заново с начала
+                for value in itertools.chain(args, kwargs.values()):
+                    if hasattr(value, "seek"):
+                        value.seek(0)
+
+    async def _acquire_global(self, priority):
+        """
+        Дожидается общего токена в порядке приоритета.
+        """
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        metrics.set_gauge("outbound_queue_depth", len(self._waiters))
+        self._wakeup.set()
+
+        await future
+
+    async def _run(self):
+        """
+        Цикл выдачи общих токенов ожидающим запросам.
+        """
+        while True:
+            if not self._waiters:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            delay = self.global_bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            metrics.set_gauge("outbound_queue_depth", len(self._waiters))
+
+            # Запрос мог быть отменен, пока ждал очереди
+            if future.done():
+                continue
+
+            self.global_bucket.consume()
+            future.set_result(None)
+
+    def _chat_state(self, chat_id):
+        """
+        Возвращает состояние чата, создавая его при необходимости.
+        """
+        state = self._chats.get(chat_id)
+
+        if state is None:
+            if len(self._chats) >= self.PRUNE_THRESHOLD:
+                self._prune()
+
+            state = self._chats[chat_id] = (TokenBucket(self.chat_rate, self.chat_burst), asyncio.Lock())
+
+        return state
+
+    def _prune(self):
+        """
+        Удаляет состояния чатов, которые не отличаются от новых.
+        """
+        for chat_id, (bucket, lock) in list(self._chats.items()):
+            if not lock.locked() and bucket.full:
+                del self._chats[chat_id]
+
+class RateLimitedBot:
+    """
+    Обертка над AsyncTeleBot, отправляющая запросы через OutboundDispatcher.
+
+    Методы отправки принимают дополнительный аргумент priority;
+    остальные атрибуты передаются боту без изменений.
+    """
+
+    # Методы, у которых идентификатор чата - первый позиционный аргумент
+    CHAT_METHODS = frozenset([
+        "send_message",
+        "send_document",
+        "send_photo",
+        "send_voice",
+        "send_chat_action",
+        "delete_message",
+    ])
+
+    # Методы, у которых идентификатор чата передается только по имени (или отсутствует)
+    KEYWORD_METHODS = frozenset([
+        "edit_message_text",
+        "edit_message_reply_markup",
+        "answer_callback_query",
+    ])
+
+    def __init__(self, bot, dispatcher):
+        """
+        Инициализация обертки.
+
+        Args:
+            bot (AsyncTeleBot): Экземпляр бота.
+            dispatcher (OutboundDispatcher): Диспетчер исходящих запросов.
+        """
+        self.bot = bot
+        self.dispatcher = dispatcher
+
+    def __getattr__(self, name):
+        attr = getattr(self.bot, name)
+
+        if name in self.CHAT_METHODS:
+            async def limited(*args, priority=PRIORITY_HIGH, **kwargs):
+                chat_id = kwargs.get("chat_id", args[0] if args else None)
+                return await self.dispatcher.call(chat_id, attr, *args, priority=priority, **kwargs)
+            return limited
+
+        if name in self.KEYWORD_METHODS:
+            async def limited(*args, priority=PRIORITY_HIGH, **kwargs):
+                return await self.dispatcher.call(kwargs.get("chat_id"), attr, *args, priority=priority, **kwargs)
+            return limited
+
+        return attr
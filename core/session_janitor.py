@@ -0,0 +1,106 @@
+"""
+Фоновая очистка истекших сессий пользователей Telegram-бота.
+
+Брошенные сценарии /protocol оставляют сессии (вместе с голосовыми файлами)
+в хранилище. SessionJanitor периодически удаляет сессии, неактивные дольше TTL.
+Истекшие сессии берутся из индекса активности SessionManager (min-куча),
+поэтому каждый проход стоит O(истекших), а не обход всех директорий.
+"""
+import time
+import asyncio
+import logging
+from config.config import Config
+from utils.async_io import run_io
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class SessionJanitor:
+    """
+    Класс фоновой задачи удаления истекших сессий.
+    """
+
+    def __init__(self, session_manager, ttl_seconds=None, interval_seconds=None):
+        """
+        Инициализация очистки сессий.
+
+        Args:
+            session_manager (SessionManager): Менеджер сессий.
+            ttl_seconds (float): Время жизни неактивной сессии. По умолчанию Config.SESSION_TTL_SECONDS.
+            interval_seconds (float): Период проверки. По умолчанию Config.SESSION_JANITOR_INTERVAL_SECONDS.
+        """
+        self.session_manager = session_manager
+        self.ttl_seconds = ttl_seconds or Config.SESSION_TTL_SECONDS
+        self.interval_seconds = interval_seconds or Config.SESSION_JANITOR_INTERVAL_SECONDS
+        self._task = None
+
+    async def start(self):
+        """
+        Загружает индекс активности существующих сессий и запускает фоновую задачу.
+        """
+        if self._task:
+            return
+
+        indexed = await run_io(self.session_manager.load_activity_index)
+        metrics.set_gauge("sessions_tracked", self.session_manager.tracked_sessions_count())
+
+        self._task = asyncio.create_task(self._run())
+
+        logger.info(
+            f"Запущена очистка сессий: TTL {self.ttl_seconds} с, проверка каждые {self.interval_seconds} с, "
+            f"найдено сохраненных сессий: {indexed}"
+        )
+
+    async def stop(self):
+        """
+        Останавливает фоновую задачу.
+        """
+        if not self._task:
+            return
+
+        self._task.cancel()
+
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+        self._task = None
+
+    async def run_once(self, now=None):
+        """
+        Удаляет все сессии, неактивные дольше TTL.
+
+        Args:
+            now (float): Текущее время (timestamp). По умолчанию time.time().
+
+        Returns:
+            int: Количество удаленных сессий.
+        """
+        cutoff = (now or time.time()) - self.ttl_seconds
+        expired = self.session_manager.pop_expired_sessions(cutoff)
+
+        for user_id in expired:
+            await self.session_manager.delete_session_async(user_id)
+            logger.info(f"Сессия пользователя {user_id} удалена по истечении TTL")
+
+        metrics.increment("sessions_janitor_runs_total")
+        metrics.set_gauge("sessions_tracked", self.session_manager.tracked_sessions_count())
+
+        if expired:
+            metrics.increment("sessions_expired_total", len(expired))
+            logger.info(f"Удалено истекших сессий: {len(expired)}")
+
+        return len(expired)
+
+    async def _run(self):
+        """
+        Цикл периодической очистки.
+        """
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка при очистке истекших сессий: {str(e)}")
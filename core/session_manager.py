@@ -1,12 +1,34 @@
 """
 Модуль управления сессиями пользователей Telegram-бота.
 Создает и управляет сессиями, хранит временные данные и файлы.
+
+Данные активных сессий держатся в памяти: чтение не обращается к диску,
+а изменения помечаются как "грязные" и сбрасываются в хранилище
+согласно политике сброса:
+- "state" (по умолчанию): смена состояния записывается сразу, изменения
+  только данных - не позже чем через SESSION_FLUSH_INTERVAL_MS после первого
+  из них (изменения за это время объединяются в одну запись); синхронные
+  вызовы записывают и изменения данных сразу;
+- "interval": все изменения сбрасываются только по таймеру;
+- "shutdown": изменения записываются только при остановке бота.
+Чем реже сброс, тем меньше записей на диск, но тем больше изменений теряется
+при аварийном завершении процесса: изменения данных за последние
+SESSION_FLUSH_INTERVAL_MS для "state", все изменения за период для "interval"
+и все несохраненные изменения для "shutdown". Данные, которые должны пережить
+перезапуск в любом случае (например, отметка pending_job), вызывающий код
+записывает сразу через flush_async.
+Хранилище (файлы session.json или SQLite) выбирается через Config.SESSION_STORE_BACKEND.
 """
 import os
+import copy
+import time
+import heapq
 import shutil
 import logging
-import json
+import asyncio
 from config.config import Config
+from core.session_store import create_session_store
+from utils.async_io import run_io
 
 logger = logging.getLogger(__name__)
 
@@ -14,133 +36,216 @@ class SessionManager:
     """
     Класс для управления сессиями пользователей Telegram-бота.
     """
-    
-    def __init__(self):
+
+    # Политики сброса кэша сессий на диск
+    FLUSH_ON_STATE_CHANGE = "state"
+    FLUSH_INTERVAL = "interval"
+    FLUSH_ON_SHUTDOWN = "shutdown"
+
+    def __init__(self, flush_policy=None, flush_interval_ms=None, store=None):
         """
         Инициализация менеджера сессий.
         Создает базовую директорию для сессий, если она не существует.
+
+        Args:
+            flush_policy (str): Политика сброса кэша на диск ("state", "interval" или "shutdown").
+                По умолчанию берется из Config.SESSION_FLUSH_POLICY.
+            flush_interval_ms (int): Период сброса в миллисекундах для политики "interval".
+            store (SessionStore): Хранилище данных сессий. По умолчанию создается
+                по Config.SESSION_STORE_BACKEND.
         """
         os.makedirs(Config.SESSION_BASE_DIR, exist_ok=True)
-    
-    def create_session(self, user_id):
+
+        self.store = store or create_session_store()
+
+        self.flush_policy = flush_policy or Config.SESSION_FLUSH_POLICY
+        self.flush_interval_ms = flush_interval_ms or Config.SESSION_FLUSH_INTERVAL_MS
+
+        if self.flush_policy not in (self.FLUSH_ON_STATE_CHANGE, self.FLUSH_INTERVAL, self.FLUSH_ON_SHUTDOWN):
+            logger.warning(f"Неизвестная политика сброса сессий '{self.flush_policy}', используется 'state'")
+            self.flush_policy = self.FLUSH_ON_STATE_CHANGE
+
+        # Кэш данных активных сессий и множество сессий с несохраненными изменениями
+        self._cache = {}
+        self._dirty = set()
+        self._flush_task = None
+
+        # Задачи отложенного сброса изменений данных (политика "state")
+        self._scheduled_flushes = {}
+
+        # Сессии, для которых директория с файлами уже создана
+        self._dirs = set()
+
+        # Блокировки асинхронного сброса, сохраняющие порядок записей одной сессии
+        self._flush_locks = {}
+
+        # Индекс активности для истечения сессий: время последней активности
+        # и min-куча (timestamp, user_id) с ленивым удалением устаревших записей
+        self._last_activity = {}
+        self._activity_heap = []
+
+    def create_session(self, user_id, initial_state="init", initial_data=None):
         """
         Создает новую сессию для пользователя.
-        
+
         Args:
             user_id (int): Идентификатор пользователя Telegram.
-            
+            initial_state (str): Начальное состояние сессии.
+            initial_data (dict): Дополнительные начальные данные сессии.
+
         Returns:
-            str: Путь к директории сессии.
+            str: Путь к директории сессии. Директория для файлов создается
+                при первом обращении через get_session_dir.
         """
-        session_dir = os.path.join(Config.SESSION_BASE_DIR, f"user_id={user_id}")
-        
         # Если сессия уже существует, удаляем ее
-        if os.path.exists(session_dir):
+        if user_id in self._cache or self.store.exists(user_id):
             self.delete_session(user_id)
-        
-        # Создаем директорию для новой сессии
-        os.makedirs(session_dir, exist_ok=True)
-        
+
         # Инициализируем данные сессии
         session_data = {
             "user_id": user_id,
             "metadata": {},
-            "state": "init"
+            "state": initial_state,
+            "last_activity": time.time()
         }
-        
-        # Сохраняем данные сессии
-        self._save_session_data(user_id, session_data)
-        
+        session_data.update(copy.deepcopy(initial_data or {}))
+
+        # Новая сессия сразу сохраняется в хранилище
+        if not self.store.create(user_id, session_data):
+            logger.error(f"Не удалось создать сессию для пользователя {user_id}")
+            return None
+
+        self._cache[user_id] = session_data
+        self._track_activity(user_id, session_data["last_activity"])
+
         logger.info(f"Создана новая сессия для пользователя {user_id}")
-        
-        return session_dir
-    
+
+        return self._session_path(user_id)
+
     def get_session_dir(self, user_id):
         """
         Возвращает путь к директории сессии пользователя.
-        
+
         Args:
             user_id (int): Идентификатор пользователя Telegram.
-            
+
         Returns:
             str: Путь к директории сессии или None, если сессия не существует.
         """
-        session_dir = os.path.join(Config.SESSION_BASE_DIR, f"user_id={user_id}")
-        
-        if not os.path.exists(session_dir):
+        # Для сессий из кэша обращение к хранилищу не нужно
+        if user_id not in self._cache and not self.store.exists(user_id):
             logger.warning(f"Сессия для пользователя {user_id} не найдена")
             return None
-        
+
+        session_dir = self._session_path(user_id)
+
+        # Директория для файлов сессии создается лениво, один раз
+        if user_id not in self._dirs:
+            os.makedirs(session_dir, exist_ok=True)
+            self._dirs.add(user_id)
+
         return session_dir
-    
+
     def delete_session(self, user_id):
         """
         Удаляет сессию пользователя и все связанные файлы.
-        
+
         Args:
             user_id (int): Идентификатор пользователя Telegram.
-            
+
         Returns:
             bool: True, если сессия успешно удалена, иначе False.
         """
-        session_dir = self.get_session_dir(user_id)
-        
-        if not session_dir:
-            return False
-        
-        try:
-            shutil.rmtree(session_dir)
-            logger.info(f"Сессия пользователя {user_id} удалена")
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка при удалении сессии пользователя {user_id}: {str(e)}")
+        self._forget_session(user_id)
+
+        return self._delete_stored_session(user_id)
+
+    def _delete_stored_session(self, user_id):
+        """
+        Удаляет сессию из хранилища вместе с файлами на диске.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+
+        Returns:
+            bool: True, если сессия успешно удалена, иначе False.
+        """
+        deleted = self.store.delete(user_id)
+
+        # Удаляем файлы сессии (голосовые сообщения, PDF), если они остались на диске
+        session_dir = self._session_path(user_id)
+
+        if os.path.exists(session_dir):
+            try:
+                shutil.rmtree(session_dir)
+                deleted = True
+            except Exception as e:
+                logger.error(f"Ошибка при удалении сессии пользователя {user_id}: {str(e)}")
+                return False
+
+        if not deleted:
+            logger.warning(f"Сессия для пользователя {user_id} не найдена")
             return False
-    
+
+        logger.info(f"Сессия пользователя {user_id} удалена")
+        return True
+
     def get_session_data(self, user_id):
         """
         Получает данные сессии пользователя.
-        
+
         Args:
             user_id (int): Идентификатор пользователя Telegram.
-            
+
         Returns:
-            dict: Данные сессии или пустой словарь, если сессия не существует.
+            dict: Копия данных сессии или пустой словарь, если сессия не существует.
         """
-        session_dir = self.get_session_dir(user_id)
-        
-        if not session_dir:
-            return {}
-        
-        session_file = os.path.join(session_dir, "session.json")
-        
-        if not os.path.exists(session_file):
-            logger.warning(f"Файл данных сессии для пользователя {user_id} не найден")
-            return {}
-        
-        try:
-            with open(session_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Ошибка при чтении данных сессии пользователя {user_id}: {str(e)}")
+        session_data = self._get_cached_session(user_id)
+
+        if not session_data:
             return {}
-    
+
+        # Возвращаем копию, чтобы изменения вызывающего кода не попадали в кэш
+        return copy.deepcopy(session_data)
+
     def update_session_data(self, user_id, data_update):
         """
         Обновляет данные сессии пользователя.
-        
+
         Args:
             user_id (int): Идентификатор пользователя Telegram.
             data_update (dict): Словарь с обновлениями данных сессии.
-            
+
         Returns:
             bool: True, если данные успешно обновлены, иначе False.
         """
-        session_data = self.get_session_data(user_id)
-        
+        session_data = self._get_cached_session(user_id)
+
         if not session_data:
             logger.warning(f"Невозможно обновить данные: сессия для пользователя {user_id} не найдена")
             return False
-        
+
+        # У синхронных вызовов нет отложенного сброса: при политике "state"
+        # изменения данных тоже записываются сразу
+        if self._apply_update(user_id, session_data, data_update) or self.flush_policy == self.FLUSH_ON_STATE_CHANGE:
+            return self.flush(user_id)
+
+        return True
+
+    def _apply_update(self, user_id, session_data, data_update):
+        """
+        Применяет обновление к данным сессии в кэше и помечает сессию измененной.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+            session_data (dict): Данные сессии из кэша.
+            data_update (dict): Словарь с обновлениями данных сессии.
+
+        Returns:
+            bool: True, если по политике сброса изменения нужно сразу сохранить.
+        """
+        state_changed = "state" in data_update and data_update["state"] != session_data.get("state")
+
         # Обновляем данные сессии
         for key, value in data_update.items():
             if key == "metadata" and isinstance(value, dict) and "metadata" in session_data:
@@ -148,95 +253,683 @@ class SessionManager:
                 session_data["metadata"].update(value)
             else:
                 # Для остальных полей заменяем значение полностью
-                session_data[key] = value
-        
-        # Сохраняем обновленные данные
-        return self._save_session_data(user_id, session_data)
-    
+                session_data[key] = copy.deepcopy(value)
+
+        session_data["last_activity"] = time.time()
+        self._track_activity(user_id, session_data["last_activity"])
+        self._dirty.add(user_id)
+
+        # При политике "state" смена состояния сбрасывается на диск сразу,
+        # остальные изменения - отложенным сбросом (_schedule_flush)
+        return state_changed and self.flush_policy == self.FLUSH_ON_STATE_CHANGE
+
     def update_session_state(self, user_id, state):
         """
         Обновляет состояние сессии пользователя.
-        
+
         Args:
             user_id (int): Идентификатор пользователя Telegram.
             state (str): Новое состояние сессии.
-            
+
         Returns:
             bool: True, если состояние успешно обновлено, иначе False.
         """
         return self.update_session_data(user_id, {"state": state})
-    
+
+    def transition(self, user_id, new_state, data_update=None, expected_state=None):
+        """
+        Атомарно переводит сессию в новое состояние вместе с обновлением данных.
+        Данные и состояние применяются одной записью, поэтому после сбоя
+        не остается данных, записанных без перехода в следующее состояние.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+            new_state (str): Новое состояние сессии.
+            data_update (dict): Словарь с обновлениями данных сессии.
+            expected_state (str): Ожидаемое текущее состояние. Если указано и не совпадает
+                с фактическим, переход не выполняется.
+
+        Returns:
+            bool: True, если переход выполнен, иначе False.
+        """
+        update = self._transition_update(
+            user_id, self._get_cached_session(user_id), new_state, data_update, expected_state
+        )
+
+        if update is None:
+            return False
+
+        return self.update_session_data(user_id, update)
+
+    def _transition_update(self, user_id, session_data, new_state, data_update, expected_state):
+        """
+        Проверяет допустимость перехода и формирует единое обновление данных и состояния.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+            session_data (dict): Данные сессии или None, если сессия не существует.
+            new_state (str): Новое состояние сессии.
+            data_update (dict): Словарь с обновлениями данных сессии.
+            expected_state (str): Ожидаемое текущее состояние.
+
+        Returns:
+            dict: Обновление для применения или None, если переход недопустим.
+        """
+        if not session_data:
+            logger.warning(f"Невозможно выполнить переход: сессия для пользователя {user_id} не найдена")
+            return None
+
+        current_state = session_data.get("state")
+
+        if expected_state is not None and current_state != expected_state:
+            logger.warning(
+                f"Переход сессии пользователя {user_id} в состояние {new_state} отклонен: "
+                f"ожидалось состояние {expected_state}, текущее {current_state}"
+            )
+            return None
+
+        update = dict(data_update or {})
+        update["state"] = new_state
+
+        return update
+
     def get_session_state(self, user_id):
         """
         Получает текущее состояние сессии пользователя.
-        
+
         Args:
             user_id (int): Идентификатор пользователя Telegram.
-            
+
         Returns:
             str: Текущее состояние сессии или None, если сессия не существует.
         """
-        session_data = self.get_session_data(user_id)
-        
+        session_data = self._get_cached_session(user_id)
+
         if not session_data:
             return None
-        
+
         return session_data.get("state")
-    
+
     def save_file(self, user_id, file_data, file_name):
         """
         Сохраняет файл в директории сессии пользователя.
-        
+
         Args:
             user_id (int): Идентификатор пользователя Telegram.
             file_data (bytes): Данные файла.
             file_name (str): Имя файла.
-            
+
         Returns:
             str: Путь к сохраненному файлу или None, если сессия не существует.
         """
         session_dir = self.get_session_dir(user_id)
-        
+
         if not session_dir:
             logger.warning(f"Невозможно сохранить файл: сессия для пользователя {user_id} не найдена")
             return None
-        
+
         file_path = os.path.join(session_dir, file_name)
-        
+
         try:
             with open(file_path, "wb") as f:
                 f.write(file_data)
-            
+
+            # Файл остается на диске, в данных сессии хранится ссылка на него
+            files = self._get_cached_session(user_id).setdefault("files", {})
+            files[file_name] = file_path
+            self._dirty.add(user_id)
+
+            if self.flush_policy == self.FLUSH_ON_STATE_CHANGE:
+                self.flush(user_id)
+
             logger.info(f"Файл {file_name} сохранен для пользователя {user_id}")
             return file_path
         except Exception as e:
             logger.error(f"Ошибка при сохранении файла {file_name} для пользователя {user_id}: {str(e)}")
             return None
-    
-    def _save_session_data(self, user_id, session_data):
+
+    def flush(self, user_id):
         """
-        Сохраняет данные сессии в файл.
-        
+        Сбрасывает несохраненные изменения сессии пользователя в хранилище.
+
         Args:
             user_id (int): Идентификатор пользователя Telegram.
-            session_data (dict): Данные сессии.
-            
+
         Returns:
-            bool: True, если данные успешно сохранены, иначе False.
+            bool: True, если данные сохранены (или сохранять нечего), иначе False.
         """
-        session_dir = self.get_session_dir(user_id)
-        
-        if not session_dir:
-            logger.warning(f"Невозможно сохранить данные: сессия для пользователя {user_id} не найдена")
+        if user_id not in self._dirty:
+            return True
+
+        session_data = self._cache.get(user_id)
+
+        if session_data is None:
+            self._dirty.discard(user_id)
+            return True
+
+        if not self.store.save(user_id, session_data):
+            return False
+
+        self._dirty.discard(user_id)
+        return True
+
+    def flush_all(self):
+        """
+        Сбрасывает в хранилище все сессии с несохраненными изменениями.
+
+        Returns:
+            bool: True, если все данные сохранены, иначе False.
+        """
+        success = True
+
+        for user_id in list(self._dirty):
+            success = self.flush(user_id) and success
+
+        return success
+
+    def start_flush_task(self):
+        """
+        Запускает фоновую задачу периодического сброса кэша для политики "interval".
+        Должен вызываться из работающего цикла событий.
+        """
+        if self.flush_policy != self.FLUSH_INTERVAL or self._flush_task:
+            return
+
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Запущен периодический сброс сессий каждые {self.flush_interval_ms} мс")
+
+    def close(self):
+        """
+        Останавливает фоновый сброс и сохраняет все несохраненные изменения.
+        """
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+
+        self._cancel_scheduled_flushes()
+        self.flush_all()
+        self.store.close()
+        logger.info("Кэш сессий сброшен в хранилище")
+
+    # Асинхронные варианты методов: операции с хранилищем и файлами выполняются
+    # в пуле ввода-вывода, а кэш изменяется только в цикле событий.
+
+    async def create_session_async(self, user_id, initial_state="init", initial_data=None):
+        """
+        Асинхронно создает новую сессию для пользователя.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+            initial_state (str): Начальное состояние сессии.
+            initial_data (dict): Дополнительные начальные данные сессии.
+
+        Returns:
+            str: Путь к директории сессии или None в случае ошибки.
+        """
+        # Если сессия уже существует, удаляем ее
+        if user_id in self._cache or await run_io(self.store.exists, user_id):
+            await self.delete_session_async(user_id)
+
+        session_data = {
+            "user_id": user_id,
+            "metadata": {},
+            "state": initial_state,
+            "last_activity": time.time()
+        }
+        session_data.update(copy.deepcopy(initial_data or {}))
+
+        if not await run_io(self.store.create, user_id, copy.deepcopy(session_data)):
+            logger.error(f"Не удалось создать сессию для пользователя {user_id}")
+            return None
+
+        self._cache[user_id] = session_data
+        self._track_activity(user_id, session_data["last_activity"])
+
+        logger.info(f"Создана новая сессия для пользователя {user_id}")
+
+        return self._session_path(user_id)
+
+    async def get_session_dir_async(self, user_id):
+        """
+        Асинхронно возвращает путь к директории сессии, создавая ее при необходимости.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+
+        Returns:
+            str: Путь к директории сессии или None, если сессия не существует.
+        """
+        if user_id in self._dirs:
+            return self._session_path(user_id)
+
+        if await self._get_cached_session_async(user_id) is None:
+            logger.warning(f"Сессия для пользователя {user_id} не найдена")
+            return None
+
+        session_dir = self._session_path(user_id)
+        await run_io(os.makedirs, session_dir, exist_ok=True)
+        self._dirs.add(user_id)
+
+        return session_dir
+
+    async def delete_session_async(self, user_id):
+        """
+        Асинхронно удаляет сессию пользователя и все связанные файлы.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+
+        Returns:
+            bool: True, если сессия успешно удалена, иначе False.
+        """
+        lock = self._flush_locks.get(user_id) or asyncio.Lock()
+        self._forget_session(user_id)
+
+        # Запись, начатая до удаления, должна завершиться раньше него,
+        # иначе она вернет удаленную сессию в хранилище
+        async with lock:
+            return await run_io(self._delete_stored_session, user_id)
+
+    async def get_session_data_async(self, user_id):
+        """
+        Асинхронно получает данные сессии пользователя.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+
+        Returns:
+            dict: Копия данных сессии или пустой словарь, если сессия не существует.
+        """
+        session_data = await self._get_cached_session_async(user_id)
+
+        if not session_data:
+            return {}
+
+        return copy.deepcopy(session_data)
+
+    async def get_session_state_async(self, user_id):
+        """
+        Асинхронно получает текущее состояние сессии пользователя.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+
+        Returns:
+            str: Текущее состояние сессии или None, если сессия не существует.
+        """
+        session_data = await self._get_cached_session_async(user_id)
+
+        if not session_data:
+            return None
+
+        return session_data.get("state")
+
+    async def update_session_data_async(self, user_id, data_update):
+        """
+        Асинхронно обновляет данные сессии пользователя.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+            data_update (dict): Словарь с обновлениями данных сессии.
+
+        Returns:
+            bool: True, если данные успешно обновлены, иначе False.
+        """
+        session_data = await self._get_cached_session_async(user_id)
+
+        if not session_data:
+            logger.warning(f"Невозможно обновить данные: сессия для пользователя {user_id} не найдена")
+            return False
+
+        if self._apply_update(user_id, session_data, data_update):
+            return await self.flush_async(user_id)
+
+        self._schedule_flush(user_id)
+        return True
+
+    async def transition_async(self, user_id, new_state, data_update=None, expected_state=None):
+        """
+        Асинхронный вариант transition: проверка и применение перехода выполняются
+        в цикле событий, запись в хранилище - в пуле ввода-вывода.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+            new_state (str): Новое состояние сессии.
+            data_update (dict): Словарь с обновлениями данных сессии.
+            expected_state (str): Ожидаемое текущее состояние.
+
+        Returns:
+            bool: True, если переход выполнен, иначе False.
+        """
+        update = self._transition_update(
+            user_id, await self._get_cached_session_async(user_id), new_state, data_update, expected_state
+        )
+
+        if update is None:
             return False
-        
-        session_file = os.path.join(session_dir, "session.json")
-        
+
+        return await self.update_session_data_async(user_id, update)
+
+    async def save_file_async(self, user_id, file_data, file_name):
+        """
+        Асинхронно сохраняет файл в директории сессии пользователя.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+            file_data (bytes): Данные файла.
+            file_name (str): Имя файла.
+
+        Returns:
+            str: Путь к сохраненному файлу или None, если сессия не существует.
+        """
+        session_dir = await self.get_session_dir_async(user_id)
+
+        if not session_dir:
+            logger.warning(f"Невозможно сохранить файл: сессия для пользователя {user_id} не найдена")
+            return None
+
+        file_path = os.path.join(session_dir, file_name)
+
         try:
-            with open(session_file, "w", encoding="utf-8") as f:
-                json.dump(session_data, f, ensure_ascii=False, indent=2)
-            
-            return True
+            await run_io(self._write_file, file_path, file_data)
         except Exception as e:
-            logger.error(f"Ошибка при сохранении данных сессии пользователя {user_id}: {str(e)}")
-            return False
+            logger.error(f"Ошибка при сохранении файла {file_name} для пользователя {user_id}: {str(e)}")
+            return None
+
+        session_data = self._cache.get(user_id)
+
+        if session_data is not None:
+            session_data.setdefault("files", {})[file_name] = file_path
+            self._dirty.add(user_id)
+            self._schedule_flush(user_id)
+
+        logger.info(f"Файл {file_name} сохранен для пользователя {user_id}")
+        return file_path
+
+    async def flush_async(self, user_id):
+        """
+        Асинхронно сбрасывает несохраненные изменения сессии в хранилище.
+        Записи одной сессии выполняются строго по очереди.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+
+        Returns:
+            bool: True, если данные сохранены (или сохранять нечего), иначе False.
+        """
+        lock = self._flush_locks.setdefault(user_id, asyncio.Lock())
+
+        async with lock:
+            # Пока ожидалась блокировка, сессия могла быть удалена (и создана заново
+            # со своей блокировкой): сохранять нечего
+            if self._flush_locks.get(user_id) is not lock or user_id not in self._dirty:
+                return True
+
+            session_data = self._cache.get(user_id)
+            self._dirty.discard(user_id)
+
+            if session_data is None:
+                return True
+
+            # Снимок берется в цикле событий, изменения во время записи снова пометят сессию
+            if not await run_io(self.store.save, user_id, copy.deepcopy(session_data)):
+                self._dirty.add(user_id)
+                return False
+
+            return True
+
+    async def flush_all_async(self):
+        """
+        Асинхронно сбрасывает в хранилище все сессии с несохраненными изменениями.
+
+        Returns:
+            bool: True, если все данные сохранены, иначе False.
+        """
+        results = await asyncio.gather(*(self.flush_async(user_id) for user_id in list(self._dirty)))
+        return all(results)
+
+    async def close_async(self):
+        """
+        Асинхронно останавливает фоновый сброс и сохраняет все несохраненные изменения.
+        """
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+
+        self._cancel_scheduled_flushes()
+        await self.flush_all_async()
+        await run_io(self.store.close)
+        logger.info("Кэш сессий сброшен в хранилище")
+
+    def _schedule_flush(self, user_id):
+        """
+        Планирует отложенный сброс изменений данных сессии при политике "state".
+        Изменения, сделанные до сброса, записываются вместе с первым.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+        """
+        if self.flush_policy != self.FLUSH_ON_STATE_CHANGE:
+            return
+
+        scheduled = self._scheduled_flushes.get(user_id)
+
+        if scheduled and not scheduled.done():
+            return
+
+        self._scheduled_flushes[user_id] = asyncio.create_task(self._delayed_flush(user_id))
+
+    async def _delayed_flush(self, user_id):
+        """
+        Сбрасывает изменения сессии через SESSION_FLUSH_INTERVAL_MS.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+        """
+        await asyncio.sleep(self.flush_interval_ms / 1000)
+
+        # Изменения, сделанные во время записи, запланируют новый сброс
+        self._scheduled_flushes.pop(user_id, None)
+        await self.flush_async(user_id)
+
+    def _cancel_scheduled_flushes(self):
+        """
+        Отменяет отложенные сбросы (изменения записывает вызывающий код).
+        """
+        for task in self._scheduled_flushes.values():
+            task.cancel()
+
+        self._scheduled_flushes.clear()
+
+    async def _flush_loop(self):
+        """
+        Цикл периодического сброса кэша сессий в хранилище.
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval_ms / 1000)
+            await self.flush_all_async()
+
+    def list_sessions_with(self, field):
+        """
+        Возвращает пользователей, в данных сессии которых задано поле.
+        Обходит все сессии хранилища, поэтому используется только при запуске.
+
+        Args:
+            field (str): Имя поля данных сессии.
+
+        Returns:
+            list: Идентификаторы пользователей.
+        """
+        user_ids = []
+
+        for user_id in self.store.list_sessions():
+            session_data = self._cache.get(user_id) or self.store.load(user_id)
+
+            if session_data and session_data.get(field):
+                user_ids.append(user_id)
+
+        return user_ids
+
+    def load_activity_index(self):
+        """
+        Заполняет индекс активности сессиями, уже сохраненными в хранилище.
+        Выполняется один раз при запуске; дальше индекс обновляется при каждом изменении сессии.
+
+        Returns:
+            int: Количество проиндексированных сессий.
+        """
+        activity = self.store.list_activity()
+
+        for user_id, timestamp in activity:
+            if user_id not in self._last_activity:
+                self._track_activity(user_id, timestamp)
+
+        return len(activity)
+
+    def pop_expired_sessions(self, cutoff):
+        """
+        Извлекает из индекса сессии, неактивные с момента cutoff.
+        Время работы пропорционально количеству истекших записей.
+
+        Args:
+            cutoff (float): Граница активности (timestamp); более старые сессии считаются истекшими.
+
+        Returns:
+            list: Идентификаторы пользователей с истекшими сессиями.
+        """
+        expired = []
+
+        while self._activity_heap and self._activity_heap[0][0] <= cutoff:
+            timestamp, user_id = heapq.heappop(self._activity_heap)
+
+            # Пропускаем устаревшие записи кучи: сессия с тех пор обновлялась или удалена
+            if self._last_activity.get(user_id) != timestamp:
+                continue
+
+            del self._last_activity[user_id]
+            expired.append(user_id)
+
+        return expired
+
+    def tracked_sessions_count(self):
+        """
+        Возвращает количество сессий в индексе активности.
+
+        Returns:
+            int: Количество отслеживаемых сессий.
+        """
+        return len(self._last_activity)
+
+    def _track_activity(self, user_id, timestamp):
+        """
+        Обновляет время последней активности сессии в индексе.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+            timestamp (float): Время последней активности.
+        """
+        self._last_activity[user_id] = timestamp
+        heapq.heappush(self._activity_heap, (timestamp, user_id))
+
+    def _index_loaded_session(self, user_id, session_data):
+        """
+        Добавляет в индекс активности сессию, загруженную из хранилища.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+            session_data (dict): Данные сессии.
+        """
+        if user_id not in self._last_activity:
+            self._track_activity(user_id, session_data.get("last_activity", time.time()))
+
+    def _forget_session(self, user_id):
+        """
+        Удаляет сессию из кэша и служебных структур.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+        """
+        self._cache.pop(user_id, None)
+        self._dirty.discard(user_id)
+        self._dirs.discard(user_id)
+        self._flush_locks.pop(user_id, None)
+        self._last_activity.pop(user_id, None)
+
+        scheduled = self._scheduled_flushes.pop(user_id, None)
+
+        if scheduled:
+            scheduled.cancel()
+
+    @staticmethod
+    def _write_file(file_path, file_data):
+        """
+        Записывает данные в файл.
+
+        Args:
+            file_path (str): Путь к файлу.
+            file_data (bytes): Данные файла.
+        """
+        with open(file_path, "wb") as f:
+            f.write(file_data)
+
+    def _session_path(self, user_id):
+        """
+        Формирует путь к директории сессии пользователя.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+
+        Returns:
+            str: Путь к директории сессии.
+        """
+        return os.path.join(Config.SESSION_BASE_DIR, f"user_id={user_id}")
+
+    async def _get_cached_session_async(self, user_id):
+        """
+        Асинхронно возвращает данные сессии из кэша, при промахе загружая их из хранилища.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+
+        Returns:
+            dict: Данные сессии (объект кэша) или None, если сессия не существует.
+        """
+        session_data = self._cache.get(user_id)
+
+        if session_data is not None:
+            return session_data
+
+        session_data = await run_io(self.store.load, user_id)
+
+        if session_data:
+            # Пока шло чтение, сессию могла загрузить другая корутина
+            if user_id not in self._cache:
+                self._cache[user_id] = session_data
+                self._index_loaded_session(user_id, session_data)
+            return self._cache[user_id]
+
+        return None
+
+    def _get_cached_session(self, user_id):
+        """
+        Возвращает данные сессии из кэша, при промахе загружая их из хранилища.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+
+        Returns:
+            dict: Данные сессии (объект кэша) или None, если сессия не существует.
+        """
+        session_data = self._cache.get(user_id)
+
+        if session_data is not None:
+            return session_data
+
+        session_data = self.store.load(user_id)
+
+        if session_data:
+            self._cache[user_id] = session_data
+            self._index_loaded_session(user_id, session_data)
+            return session_data
+
+        return None
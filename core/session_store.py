@@ -0,0 +1,574 @@
+"""
+Хранилища данных сессий пользователей Telegram-бота.
+
+SessionManager работает с хранилищем через общий интерфейс SessionStore:
+- FileSessionStore хранит каждую сессию в session.json в директории пользователя;
+- SqliteSessionStore хранит строки сессий в одном файле SQLite (режим WAL).
+
+Голосовые сообщения и PDF-документы в обоих случаях остаются на диске
+в директории сессии, а в данных сессии хранятся только ссылки на них.
+"""
+import os
+import re
+import json
+import shutil
+import sqlite3
+import logging
+import threading
+import time
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Шаблон имени директории сессии: user_id=<идентификатор>
+SESSION_DIR_PATTERN = re.compile(r"^user_id=(-?\d+)$")
+
+class SessionStore:
+    """
+    Базовый класс хранилища данных сессий.
+    """
+
+    def load(self, user_id):
+        """
+        Загружает данные сессии.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+
+        Returns:
+            dict: Данные сессии или None, если сессия не существует.
+        """
+        raise NotImplementedError("Метод должен быть переопределен в дочернем классе")
+
+    def save(self, user_id, session_data):
+        """
+        Сохраняет данные существующей сессии.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+            session_data (dict): Данные сессии.
+
+        Returns:
+            bool: True, если данные успешно сохранены, иначе False.
+        """
+        raise NotImplementedError("Метод должен быть переопределен в дочернем классе")
+
+    def create(self, user_id, session_data):
+        """
+        Создает новую сессию с указанными данными.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+            session_data (dict): Начальные данные сессии.
+
+        Returns:
+            bool: True, если сессия успешно создана, иначе False.
+        """
+        raise NotImplementedError("Метод должен быть переопределен в дочернем классе")
+
+    def delete(self, user_id):
+        """
+        Удаляет данные сессии.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+
+        Returns:
+            bool: True, если сессия была удалена, иначе False.
+        """
+        raise NotImplementedError("Метод должен быть переопределен в дочернем классе")
+
+    def exists(self, user_id):
+        """
+        Проверяет существование сессии.
+
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+
+        Returns:
+            bool: True, если сессия существует, иначе False.
+        """
+        raise NotImplementedError("Метод должен быть переопределен в дочернем классе")
+
+    def list_sessions(self):
+        """
+        Возвращает идентификаторы всех сохраненных сессий.
+
+        Returns:
+            list: Список идентификаторов пользователей.
+        """
+        raise NotImplementedError("Метод должен быть переопределен в дочернем классе")
+
+    def list_activity(self):
+        """
+        Возвращает время последней активности всех сохраненных сессий.
+
+        Returns:
+            list: Список пар (user_id, timestamp).
+        """
+        raise NotImplementedError("Метод должен быть переопределен в дочернем классе")
+
+    def load_processed_updates(self, limit):
+        """
+        Загружает ключи последних обработанных обновлений Telegram.
+
+        Args:
+            limit (int): Максимальное количество ключей.
+
+        Returns:
+            list: Ключи от старых к новым.
+        """
+        raise NotImplementedError("Метод должен быть переопределен в дочернем классе")
+
+    def add_processed_updates(self, keys, limit):
+        """
+        Сохраняет ключи обработанных обновлений Telegram.
+
+        Args:
+            keys (list): Новые ключи.
+            limit (int): Сколько последних ключей хранить.
+        """
+        raise NotImplementedError("Метод должен быть переопределен в дочернем классе")
+
+    def save_pending_updates(self, updates):
+        """
+        Сохраняет обновления Telegram, принятые, но не обработанные до остановки бота.
+        Telegram их повторно не доставит: webhook уже получил ответ, а polling
+        подтвердил смещение.
+
+        Args:
+            updates (list): Обновления в виде словарей JSON Bot API.
+        """
+        raise NotImplementedError("Метод должен быть переопределен в дочернем классе")
+
+    def take_pending_updates(self):
+        """
+        Возвращает сохраненные необработанные обновления и удаляет их из хранилища.
+
+        Returns:
+            list: Обновления в виде словарей JSON Bot API по порядку приема.
+        """
+        raise NotImplementedError("Метод должен быть переопределен в дочернем классе")
+
+    def close(self):
+        """
+        Освобождает ресурсы хранилища.
+        """
+
+
+class FileSessionStore(SessionStore):
+    """
+    Хранилище сессий в файлах session.json внутри директорий user_id=<id>.
+    """
+
+    def __init__(self, base_dir=None):
+        """
+        Инициализация файлового хранилища.
+
+        Args:
+            base_dir (str): Базовая директория сессий. По умолчанию Config.SESSION_BASE_DIR.
+        """
+        self.base_dir = base_dir or Config.SESSION_BASE_DIR
+        os.makedirs(self.base_dir, exist_ok=True)
+
+        # Журнал ключей обработанных обновлений (по одному в строке)
+        self.processed_updates_file = os.path.join(self.base_dir, "processed_updates.log")
+        self._processed_lock = threading.Lock()
+        self._processed_lines = 0
+
+        # Обновления, не обработанные до остановки бота
+        self.pending_updates_file = os.path.join(self.base_dir, "pending_updates.json")
+
+    def load(self, user_id):
+        session_file = self._session_file(user_id)
+
+        if not os.path.exists(session_file):
+            return None
+
+        try:
+            with open(session_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка при чтении данных сессии пользователя {user_id}: {str(e)}")
+            return None
+
+    def save(self, user_id, session_data):
+        session_dir = self._session_dir(user_id)
+
+        if not os.path.exists(session_dir):
+            logger.warning(f"Невозможно сохранить данные: сессия для пользователя {user_id} не найдена")
+            return False
+
+        session_file = self._session_file(user_id)
+        temp_file = f"{session_file}.tmp"
+
+        # Запись во временный файл и переименование: при сбое во время записи
+        # на диске остается предыдущая целая версия session.json
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(session_data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(temp_file, session_file)
+
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении данных сессии пользователя {user_id}: {str(e)}")
+
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+
+            return False
+
+    def create(self, user_id, session_data):
+        session_dir = self._session_dir(user_id)
+
+        # Если сессия уже существует, удаляем ее вместе с файлами
+        if os.path.exists(session_dir):
+            self.delete(user_id)
+
+        os.makedirs(session_dir, exist_ok=True)
+
+        return self.save(user_id, session_data)
+
+    def delete(self, user_id):
+        session_dir = self._session_dir(user_id)
+
+        if not os.path.exists(session_dir):
+            return False
+
+        try:
+            shutil.rmtree(session_dir)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при удалении сессии пользователя {user_id}: {str(e)}")
+            return False
+
+    def exists(self, user_id):
+        return os.path.exists(self._session_file(user_id))
+
+    def list_sessions(self):
+        user_ids = []
+
+        for entry in os.listdir(self.base_dir):
+            match = SESSION_DIR_PATTERN.match(entry)
+            if match:
+                user_ids.append(int(match.group(1)))
+
+        return user_ids
+
+    def list_activity(self):
+        activity = []
+
+        for user_id in self.list_sessions():
+            try:
+                # Время изменения session.json соответствует последней записи сессии
+                activity.append((user_id, os.path.getmtime(self._session_file(user_id))))
+            except OSError:
+                continue
+
+        return activity
+
+    def load_processed_updates(self, limit):
+        with self._processed_lock:
+            if not os.path.exists(self.processed_updates_file):
+                return []
+
+            with open(self.processed_updates_file, "r", encoding="utf-8") as f:
+                keys = [line.strip() for line in f if line.strip()][-limit:]
+
+            self._rewrite_processed_updates(keys)
+
+            return keys
+
+    def add_processed_updates(self, keys, limit):
+        with self._processed_lock:
+            with open(self.processed_updates_file, "a", encoding="utf-8") as f:
+                f.write("".join(f"{key}\n" for key in keys))
+
+            self._processed_lines += len(keys)
+
+            # Журнал только дописывается, поэтому периодически сжимаем его до limit ключей
+            if self._processed_lines > 2 * limit:
+                with open(self.processed_updates_file, "r", encoding="utf-8") as f:
+                    self._rewrite_processed_updates([line.strip() for line in f if line.strip()][-limit:])
+
+    def save_pending_updates(self, updates):
+        updates = self.take_pending_updates() + list(updates)
+        temp_file = f"{self.pending_updates_file}.tmp"
+
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(updates, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp_file, self.pending_updates_file)
+
+    def take_pending_updates(self):
+        try:
+            with open(self.pending_updates_file, "r", encoding="utf-8") as f:
+                updates = json.load(f)
+        except FileNotFoundError:
+            return []
+
+        os.remove(self.pending_updates_file)
+
+        return updates
+
+    def _rewrite_processed_updates(self, keys):
+        temp_file = f"{self.processed_updates_file}.tmp"
+
+        with open(temp_file, "w", encoding="utf-8") as f:
+            f.write("".join(f"{key}\n" for key in keys))
+
+        os.replace(temp_file, self.processed_updates_file)
+        self._processed_lines = len(keys)
+
+    def _session_dir(self, user_id):
+        return os.path.join(self.base_dir, f"user_id={user_id}")
+
+    def _session_file(self, user_id):
+        return os.path.join(self._session_dir(user_id), "session.json")
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    Хранилище сессий в одной базе SQLite в режиме WAL.
+    """
+
+    def __init__(self, db_path=None):
+        """
+        Инициализация хранилища SQLite.
+
+        Args:
+            db_path (str): Путь к файлу базы данных. По умолчанию Config.SESSION_DB_PATH.
+        """
+        self.db_path = db_path or Config.SESSION_DB_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+
+        # Соединение используется из нескольких потоков, доступ сериализуется блокировкой
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id INTEGER PRIMARY KEY, "
+            "state TEXT, "
+            "data TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed_updates ("
+            "key TEXT PRIMARY KEY, "
+            "seen_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending_updates ("
+            "update_id INTEGER PRIMARY KEY, "
+            "data TEXT NOT NULL)"
+        )
+
+        logger.info(f"Инициализировано хранилище сессий SQLite: {self.db_path}")
+
+    def load(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+
+        if not row:
+            return None
+
+        try:
+            return json.loads(row[0])
+        except Exception as e:
+            logger.error(f"Ошибка при чтении данных сессии пользователя {user_id}: {str(e)}")
+            return None
+
+    def save(self, user_id, session_data):
+        try:
+            with self._lock:
+                cursor = self._conn.execute(
+                    "UPDATE sessions SET state = ?, data = ?, updated_at = ? WHERE user_id = ?",
+                    (session_data.get("state"), json.dumps(session_data, ensure_ascii=False), time.time(), user_id)
+                )
+
+            if cursor.rowcount == 0:
+                logger.warning(f"Невозможно сохранить данные: сессия для пользователя {user_id} не найдена")
+                return False
+
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении данных сессии пользователя {user_id}: {str(e)}")
+            return False
+
+    def create(self, user_id, session_data):
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions (user_id, state, data, updated_at) VALUES (?, ?, ?, ?)",
+                    (user_id, session_data.get("state"), json.dumps(session_data, ensure_ascii=False), time.time())
+                )
+
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при создании сессии пользователя {user_id}: {str(e)}")
+            return False
+
+    def delete(self, user_id):
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+        return cursor.rowcount > 0
+
+    def exists(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+
+        return row is not None
+
+    def list_sessions(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id FROM sessions").fetchall()
+
+        return [row[0] for row in rows]
+
+    def list_activity(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, updated_at FROM sessions").fetchall()
+
+        return [(row[0], row[1]) for row in rows]
+
+    def load_processed_updates(self, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM processed_updates ORDER BY rowid DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+        return [row[0] for row in reversed(rows)]
+
+    def add_processed_updates(self, keys, limit):
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO processed_updates (key, seen_at) VALUES (?, ?)",
+                    [(key, now) for key in keys]
+                )
+                # Храним только последние limit ключей
+                self._conn.execute(
+                    "DELETE FROM processed_updates WHERE rowid <= (SELECT MAX(rowid) FROM processed_updates) - ?",
+                    (limit,)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def save_pending_updates(self, updates):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pending_updates (update_id, data) VALUES (?, ?)",
+                [(update["update_id"], json.dumps(update, ensure_ascii=False)) for update in updates]
+            )
+
+    def take_pending_updates(self):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                rows = self._conn.execute("SELECT data FROM pending_updates ORDER BY rowid").fetchall()
+                self._conn.execute("DELETE FROM pending_updates")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return [json.loads(row[0]) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def import_file_sessions(self, base_dir=None, remove_json=False):
+        """
+        Импортирует сессии из директорий user_id=* файлового хранилища.
+        Голосовые сообщения и PDF остаются на месте, в данные сессии
+        записываются ссылки на них.
+
+        Args:
+            base_dir (str): Базовая директория сессий. По умолчанию Config.SESSION_BASE_DIR.
+            remove_json (bool): Удалять ли session.json после успешного импорта.
+
+        Returns:
+            int: Количество импортированных сессий.
+        """
+        base_dir = base_dir or Config.SESSION_BASE_DIR
+        imported = 0
+
+        for entry in sorted(os.listdir(base_dir)):
+            match = SESSION_DIR_PATTERN.match(entry)
+            session_dir = os.path.join(base_dir, entry)
+
+            if not match or not os.path.isdir(session_dir):
+                continue
+
+            user_id = int(match.group(1))
+            session_file = os.path.join(session_dir, "session.json")
+
+            if not os.path.exists(session_file):
+                logger.warning(f"Пропущена директория без session.json: {session_dir}")
+                continue
+
+            try:
+                with open(session_file, "r", encoding="utf-8") as f:
+                    session_data = json.load(f)
+            except Exception as e:
+                logger.error(f"Ошибка при чтении {session_file}: {str(e)}")
+                continue
+
+            # Сохраняем ссылки на файлы сессии (голосовые сообщения, PDF)
+            files = session_data.setdefault("files", {})
+            for file_name in os.listdir(session_dir):
+                if file_name != "session.json":
+                    files[file_name] = os.path.join(session_dir, file_name)
+
+            if not self.create(user_id, session_data):
+                continue
+
+            if remove_json:
+                os.unlink(session_file)
+
+            imported += 1
+
+        logger.info(f"Импортировано сессий в SQLite: {imported}")
+
+        return imported
+
+
+def create_session_store(backend=None):
+    """
+    Создает хранилище сессий по имени бэкенда.
+
+    Args:
+        backend (str): "file" или "sqlite". По умолчанию Config.SESSION_STORE_BACKEND.
+
+    Returns:
+        SessionStore: Экземпляр хранилища.
+    """
+    backend = backend or Config.SESSION_STORE_BACKEND
+
+    if backend == "sqlite":
+        return SqliteSessionStore()
+
+    if backend != "file":
+        logger.warning(f"Неизвестный бэкенд хранилища сессий '{backend}', используется 'file'")
+
+    return FileSessionStore()
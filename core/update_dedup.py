@@ -0,0 +1,150 @@
+"""
+Отсев повторно доставленных обновлений Telegram.
+
+После сбоя бота или повторной отправки webhook Telegram доставляет
+обновления заново. Без проверки это повторно запускает распознавание
+голоса и может сдвинуть сессию на два шага вперед. UpdateDeduplicator
+хранит ограниченный LRU-набор ключей обработанных обновлений (update_id
+и идентификатор сообщения в чате) и, при включенном сохранении, дублирует
+их в хранилище сессий, чтобы повторы отсеивались и после перезапуска.
+
+Проверка выполняется в памяти без ожидания, чтобы между отсевом и постановкой
+обновлений в очередь планировщика не было точки переключения: иначе пакет,
+принятый позже (polling и webhook обрабатывают каждый пакет в своей задаче),
+мог бы обогнать более ранний, ждущий записи на диск. Ключи записываются
+в хранилище фоновой задачей по порядку приема.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from config.config import Config
+from utils.async_io import run_io
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def update_keys(update):
+    """
+    Возвращает ключи, по которым обновление считается уже обработанным.
+
+    Args:
+        update: Объект обновления Telegram (telebot.types.Update).
+
+    Returns:
+        list: Строковые ключи обновления.
+    """
+    keys = [f"u:{update.update_id}"]
+
+    # Одно и то же сообщение может прийти под другим update_id
+    message = update.message or update.channel_post
+    if message is not None:
+        keys.append(f"m:{message.chat.id}:{message.message_id}")
+
+    if update.callback_query is not None:
+        keys.append(f"c:{update.callback_query.id}")
+
+    return keys
+
+class UpdateDeduplicator:
+    """
+    Класс кэша обработанных обновлений.
+    """
+
+    def __init__(self, store=None, capacity=None, persist=None):
+        """
+        Инициализация кэша.
+
+        Args:
+            store (SessionStore): Хранилище сессий для сохранения ключей.
+            capacity (int): Количество хранимых ключей. По умолчанию Config.UPDATE_DEDUP_CAPACITY.
+            persist (bool): Сохранять ли ключи в хранилище. По умолчанию Config.UPDATE_DEDUP_PERSIST.
+        """
+        self.store = store
+        self.capacity = capacity or Config.UPDATE_DEDUP_CAPACITY
+        self.persist = (Config.UPDATE_DEDUP_PERSIST if persist is None else persist) and store is not None
+        self._seen = OrderedDict()
+        # Ключи, ожидающие записи в хранилище, и задача их записи
+        self._unsaved = []
+        self._writer = None
+
+    async def load(self):
+        """
+        Загружает ключи обработанных обновлений из хранилища.
+
+        Returns:
+            int: Количество загруженных ключей.
+        """
+        if not self.persist:
+            return 0
+
+        keys = await run_io(self.store.load_processed_updates, self.capacity)
+        self._remember(keys)
+
+        logger.info(f"Загружено ключей обработанных обновлений: {len(keys)}")
+
+        return len(keys)
+
+    def filter(self, updates):
+        """
+        Отбрасывает уже обработанные обновления и запоминает новые.
+        Не ожидает записи ключей в хранилище (см. описание модуля).
+
+        Args:
+            updates (list): Список обновлений.
+
+        Returns:
+            list: Новые обновления.
+        """
+        fresh = []
+
+        for update in updates:
+            keys = update_keys(update)
+
+            if any(key in self._seen for key in keys):
+                metrics.increment("updates_duplicate_total")
+                logger.info(f"Пропущено повторно доставленное обновление {update.update_id}")
+                continue
+
+            self._remember(keys)
+            fresh.append(update)
+
+            if self.persist:
+                self._unsaved.extend(keys)
+
+        if self._unsaved and self._writer is None:
+            self._writer = asyncio.create_task(self._write_keys())
+
+        return fresh
+
+    async def flush(self):
+        """
+        Дожидается записи в хранилище всех запомненных ключей (при остановке бота).
+        """
+        if self._writer is not None:
+            await asyncio.shield(self._writer)
+
+    async def _write_keys(self):
+        """
+        Фоновая запись ключей в хранилище: пакеты записываются по одному в порядке приема.
+        """
+        try:
+            while self._unsaved:
+                keys, self._unsaved = self._unsaved, []
+
+                try:
+                    await run_io(self.store.add_processed_updates, keys, self.capacity)
+                except Exception as e:
+                    logger.error(f"Ошибка при сохранении ключей обработанных обновлений: {str(e)}")
+        finally:
+            self._writer = None
+
+    def _remember(self, keys):
+        """
+        Добавляет ключи в LRU-набор, вытесняя самые старые.
+        """
+        for key in keys:
+            self._seen[key] = None
+            self._seen.move_to_end(key)
+
+        while len(self._seen) > self.capacity:
+            self._seen.popitem(last=False)
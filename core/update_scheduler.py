@@ -0,0 +1,320 @@
+"""
+Планировщик обработки обновлений Telegram.
+
+Обновления распределяются по очередям FIFO по идентификатору пользователя:
+сообщения одного пользователя обрабатываются строго по порядку (данные
+сессии изменяются по схеме чтение-изменение-запись), а сообщения разных
+пользователей - параллельно на ограниченном пуле задач-обработчиков.
+
+Долгую обработку (распознавание голосового сообщения, которое может ждать
+слота в очереди распознавания) обработчик передает в фоновую задачу через
+detach: задача-обработчик сразу освобождается для обновлений других
+пользователей, а очередь пользователя остается занятой до завершения
+фоновой задачи, так что порядок его сообщений сохраняется.
+"""
+import time
+import json
+import asyncio
+import logging
+import contextvars
+from collections import deque
+from config.config import Config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Поля обновления, содержащие объект с автором (from_user)
+UPDATE_FIELDS = (
+    "message",
+    "edited_message",
+    "callback_query",
+    "inline_query",
+    "chosen_inline_result",
+    "shipping_query",
+    "pre_checkout_query",
+    "poll_answer",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+    "channel_post",
+    "edited_channel_post",
+)
+
+def update_key(update):
+    """
+    Возвращает ключ очереди для обновления.
+
+    Args:
+        update: Объект обновления Telegram (telebot.types.Update).
+
+    Returns:
+        int: Идентификатор пользователя, чата или (если их нет) обновления.
+    """
+    for field in UPDATE_FIELDS:
+        obj = getattr(update, field, None)
+
+        if obj is None:
+            continue
+
+        user = getattr(obj, "from_user", None) or getattr(obj, "user", None)
+        if user is not None:
+            return user.id
+
+        chat = getattr(obj, "chat", None)
+        if chat is not None:
+            return chat.id
+
+    return update.update_id
+
+# Обработка, которую выполняет текущая задача-обработчик (для detach)
+_current_handling = contextvars.ContextVar("update_scheduler_handling", default=None)
+
+class _Handling:
+    """
+    Обработка одного обновления или задачи из очереди ключа.
+    """
+
+    __slots__ = ("scheduler", "key", "queue", "started", "task")
+
+    def __init__(self, scheduler, key, queue, started):
+        self.scheduler = scheduler
+        self.key = key
+        self.queue = queue
+        self.started = started
+        # Фоновая задача, в которую передана обработка (detach)
+        self.task = None
+
+def serialize_update(update):
+    """
+    Возвращает обновление в виде словаря JSON Bot API для сохранения в хранилище.
+    Исходный JSON telebot сохраняет только у сообщений и callback-запросов -
+    других обновлений бот не обрабатывает.
+
+    Args:
+        update: Объект обновления Telegram (telebot.types.Update).
+
+    Returns:
+        dict: Обновление или None, если его нельзя восстановить.
+    """
+    data = {"update_id": update.update_id}
+
+    for field in UPDATE_FIELDS:
+        obj = getattr(update, field, None)
+
+        if obj is None:
+            continue
+
+        raw = getattr(obj, "json", None)
+        if isinstance(raw, str):
+            raw = json.loads(raw)
+        if not isinstance(raw, dict):
+            return None
+
+        data[field] = raw
+
+    return data
+
+class UpdateScheduler:
+    """
+    Класс планировщика обработки обновлений.
+    """
+
+    def __init__(self, process_updates, workers=None):
+        """
+        Инициализация планировщика.
+
+        Args:
+            process_updates (callable): async-функция обработки списка обновлений
+                (исходный AsyncTeleBot.process_new_updates).
+            workers (int): Количество задач-обработчиков. По умолчанию Config.UPDATE_WORKERS.
+        """
+        self.process_updates = process_updates
+        self.workers = workers or Config.UPDATE_WORKERS
+
+        # Очереди обновлений по ключу; ключ присутствует, пока у него есть
+        # ожидающие или обрабатываемое обновление
+        self._queues = {}
+        # Ключи, готовые к обработке (очередь не пуста и ключ не обрабатывается)
+        self._ready = asyncio.Queue()
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = []
+        # Фоновые задачи обработки, переданные через detach
+        self._detached = set()
+
+    @property
+    def pending(self):
+        """
+        Количество принятых, но еще не обработанных обновлений.
+        """
+        return self._pending
+
+    async def submit(self, updates):
+        """
+        Ставит обновления в очереди. Совместим по сигнатуре с
+        AsyncTeleBot.process_new_updates и подменяет его.
+
+        Args:
+            updates (list): Список обновлений.
+        """
+        now = time.monotonic()
+
+        for update in updates:
+            self._enqueue(update_key(update), update, now)
+
+        if updates:
+            self._update_gauges()
+
+    def submit_job(self, key, job):
+        """
+        Ставит в очередь пользователя задачу, не связанную с обновлением
+        (например, возобновление прерванной обработки после перезапуска).
+
+        Args:
+            key (int): Идентификатор пользователя.
+            job (callable): async-функция без аргументов.
+        """
+        self._enqueue(key, job, time.monotonic())
+        self._update_gauges()
+
+    async def detach(self, coro):
+        """
+        Выполняет долгую обработку в фоновой задаче и сразу освобождает
+        задачу-обработчик. Следующие обновления того же пользователя ждут
+        завершения фоновой задачи. Вне задачи-обработчика планировщика
+        (или повторно внутри уже переданной обработки) coro просто выполняется.
+
+        Args:
+            coro (coroutine): Обработка обновления.
+        """
+        handling = _current_handling.get()
+
+        if handling is None or handling.scheduler is not self or handling.task is not None:
+            await coro
+            return
+
+        handling.task = asyncio.create_task(self._run_detached(handling, coro))
+        self._detached.add(handling.task)
+
+    def start(self):
+        """
+        Запускает задачи-обработчики.
+        """
+        if self._tasks:
+            return
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+        logger.info(f"Запущен планировщик обновлений: {self.workers} обработчиков")
+
+    async def join(self):
+        """
+        Дожидается обработки всех принятых обновлений.
+        """
+        await self._idle.wait()
+
+    async def stop(self, timeout=None):
+        """
+        Дожидается обработки принятых обновлений и останавливает обработчики.
+        Обработка, не завершенная к сроку, отменяется.
+
+        Args:
+            timeout (float): Максимальное время ожидания (в секундах); None - без ограничения.
+
+        Returns:
+            list: Обновления, обработка которых так и не началась.
+        """
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Остановка планировщика: не обработано обновлений: {self._pending}")
+
+        tasks = self._tasks + list(self._detached)
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+        return [item for queue in self._queues.values() for item, _ in queue if not callable(item)]
+
+    async def _worker(self):
+        """
+        Цикл задачи-обработчика: берет готовый ключ и обрабатывает одно его обновление.
+        """
+        while True:
+            key = await self._ready.get()
+            queue = self._queues[key]
+            item, enqueued_at = queue.popleft()
+
+            started = time.monotonic()
+            metrics.observe("update_wait_ms", (started - enqueued_at) * 1000)
+
+            handling = _Handling(self, key, queue, started)
+            token = _current_handling.set(handling)
+
+            try:
+                if callable(item):
+                    await item()
+                else:
+                    await self.process_updates([item])
+            except Exception as e:
+                logger.error(f"Ошибка при обработке обновления пользователя {key}: {str(e)}")
+            finally:
+                _current_handling.reset(token)
+
+                # Переданная в фон обработка завершится в своей задаче
+                if handling.task is None:
+                    self._finish(handling)
+
+    async def _run_detached(self, handling, coro):
+        """
+        Фоновая задача обработки, переданной через detach.
+        """
+        try:
+            await coro
+        except Exception as e:
+            logger.error(f"Ошибка при обработке обновления пользователя {handling.key}: {str(e)}")
+        finally:
+            self._detached.discard(handling.task)
+            self._finish(handling)
+
+    def _finish(self, handling):
+        """
+        Завершает обработку элемента очереди: освобождает ключ пользователя.
+        """
+        metrics.observe("update_handle_ms", (time.monotonic() - handling.started) * 1000)
+        metrics.increment("updates_processed_total")
+
+        # Следующее обновление ключа встает в конец очереди готовых,
+        # чтобы активный пользователь не занимал обработчик монопольно
+        if handling.queue:
+            self._ready.put_nowait(handling.key)
+        else:
+            del self._queues[handling.key]
+
+        self._pending -= 1
+        if not self._pending:
+            self._idle.set()
+
+        self._update_gauges()
+
+    def _enqueue(self, key, item, enqueued_at):
+        """
+        Добавляет обновление или задачу в очередь ключа.
+        """
+        queue = self._queues.get(key)
+
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._ready.put_nowait(key)
+
+        queue.append((item, enqueued_at))
+        self._pending += 1
+        self._idle.clear()
+
+    def _update_gauges(self):
+        metrics.set_gauge("update_queue_depth", self._pending)
+        metrics.set_gauge("update_queue_keys", len(self._queues))
@@ -0,0 +1,267 @@
+"""
+Менеджер пользователей Telegram-бота.
+
+Списки разрешенных, заблокированных пользователей и администраторов
+хранятся в JSON-файле (Config.USERS_FILE_PATH) и держатся в памяти
+в виде множеств: проверка доступа, выполняемая на каждое обновление, -
+это поиск в множестве без обращения к диску. Файл перечитывается, только
+если изменилось время его модификации (например, его отредактировали
+вручную), причем время модификации проверяется не чаще раза в
+Config.USERS_RELOAD_INTERVAL_SECONDS. Изменения записываются атомарно:
+во временный файл с последующим переименованием.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+class UserManager:
+    """
+    Класс для управления доступом пользователей.
+    """
+
+    def __init__(self, users_file_path, admin_id=None, reload_interval=None):
+        """
+        Инициализация менеджера пользователей.
+
+        Args:
+            users_file_path (str): Путь к файлу пользователей.
+            admin_id (int): Идентификатор главного администратора (всегда имеет доступ).
+            reload_interval (float): Период проверки изменения файла (в секундах).
+                По умолчанию Config.USERS_RELOAD_INTERVAL_SECONDS.
+        """
+        self.users_file_path = users_file_path
+        self.admin_id = admin_id
+        self.reload_interval = Config.USERS_RELOAD_INTERVAL_SECONDS if reload_interval is None else reload_interval
+
+        self.allowed_users = set()
+        self.blocked_users = set()
+        self.admins = set()
+
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.users_file_path):
+            self._load()
+        else:
+            # Первый запуск: начальный список берется из ALLOWED_USERS
+            self.allowed_users = set(Config.ALLOWED_USERS)
+            self._save()
+
+        logger.info(
+            f"Инициализирован менеджер пользователей: разрешенных {len(self.allowed_users)}, "
+            f"заблокированных {len(self.blocked_users)}"
+        )
+
+    def is_user_allowed(self, user_id):
+        """
+        Проверяет, разрешен ли пользователю доступ к боту.
+        При пустом списке разрешенных пользователей доступ открыт всем,
+        кроме заблокированных.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+
+        Returns:
+            bool: True, если доступ разрешен.
+        """
+        self._reload_if_changed()
+
+        if self.is_admin(user_id):
+            return True
+
+        if user_id in self.blocked_users:
+            return False
+
+        return not self.allowed_users or user_id in self.allowed_users
+
+    def is_admin(self, user_id):
+        """
+        Проверяет, является ли пользователь администратором.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+
+        Returns:
+            bool: True, если пользователь - администратор.
+        """
+        return user_id == self.admin_id or user_id in self.admins
+
+    def is_blocked(self, user_id):
+        """
+        Проверяет, заблокирован ли пользователь.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+
+        Returns:
+            bool: True, если пользователь заблокирован.
+        """
+        self._reload_if_changed()
+        return user_id in self.blocked_users
+
+    def get_admin_ids(self):
+        """
+        Возвращает идентификаторы администраторов для уведомлений.
+
+        Returns:
+            list: Отсортированный список идентификаторов.
+        """
+        admins = set(self.admins)
+        if self.admin_id is not None:
+            admins.add(self.admin_id)
+        return sorted(admins)
+
+    def get_allowed_users(self):
+        """
+        Возвращает список разрешенных пользователей.
+
+        Returns:
+            list: Отсортированный список идентификаторов.
+        """
+        self._reload_if_changed()
+        return sorted(self.allowed_users)
+
+    def get_blocked_users(self):
+        """
+        Возвращает список заблокированных пользователей.
+
+        Returns:
+            list: Отсортированный список идентификаторов.
+        """
+        self._reload_if_changed()
+        return sorted(self.blocked_users)
+
+    def add_user(self, user_id):
+        """
+        Разрешает пользователю доступ (и снимает блокировку).
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+
+        Returns:
+            bool: True, если список изменился.
+        """
+        with self._lock:
+            if user_id in self.allowed_users and user_id not in self.blocked_users:
+                return False
+
+            self.allowed_users.add(user_id)
+            self.blocked_users.discard(user_id)
+            self._save()
+
+        logger.info(f"Пользователь {user_id} добавлен в список разрешенных")
+        return True
+
+    def remove_user(self, user_id):
+        """
+        Удаляет пользователя из списка разрешенных.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+
+        Returns:
+            bool: True, если пользователь был в списке.
+        """
+        with self._lock:
+            if user_id not in self.allowed_users:
+                return False
+
+            self.allowed_users.discard(user_id)
+            self._save()
+
+        logger.info(f"Пользователь {user_id} удален из списка разрешенных")
+        return True
+
+    def block_user(self, user_id):
+        """
+        Блокирует пользователя: доступ запрещен, уведомления о его попытках не отправляются.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+
+        Returns:
+            bool: True, если список изменился.
+        """
+        if self.is_admin(user_id):
+            return False
+
+        with self._lock:
+            if user_id in self.blocked_users:
+                return False
+
+            self.blocked_users.add(user_id)
+            self.allowed_users.discard(user_id)
+            self._save()
+
+        logger.info(f"Пользователь {user_id} заблокирован")
+        return True
+
+    def _reload_if_changed(self):
+        """
+        Перечитывает файл, если он изменился после последней загрузки или записи.
+        Время модификации проверяется не чаще раза в reload_interval секунд.
+        """
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+
+        self._checked_at = now
+
+        try:
+            mtime = os.stat(self.users_file_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+
+        if mtime != self._mtime:
+            with self._lock:
+                self._load()
+
+            logger.info("Файл пользователей изменился и был перечитан")
+
+    def _load(self):
+        """
+        Загружает списки пользователей из файла. При ошибке чтения
+        сохраняются текущие списки.
+        """
+        try:
+            mtime = os.stat(self.users_file_path).st_mtime_ns
+
+            with open(self.users_file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+
+            self.allowed_users = {int(user_id) for user_id in data.get("allowed_users", [])}
+            self.blocked_users = {int(user_id) for user_id in data.get("blocked_users", [])}
+            self.admins = {int(user_id) for user_id in data.get("admins", [])}
+            self._mtime = mtime
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке файла пользователей {self.users_file_path}: {str(e)}")
+
+    def _save(self):
+        """
+        Атомарно сохраняет списки пользователей: запись во временный файл
+        и переименование, чтобы файл никогда не оказался записанным наполовину.
+        """
+        data = {
+            "allowed_users": sorted(self.allowed_users),
+            "blocked_users": sorted(self.blocked_users),
+            "admins": sorted(self.admins),
+        }
+
+        os.makedirs(os.path.dirname(self.users_file_path), exist_ok=True)
+        temp_file = f"{self.users_file_path}.tmp"
+
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp_file, self.users_file_path)
+
+        # Собственная запись не должна вызывать повторную загрузку
+        self._mtime = os.stat(self.users_file_path).st_mtime_ns
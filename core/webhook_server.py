@@ -0,0 +1,126 @@
+"""
+Встроенный HTTP-сервер для приема обновлений Telegram в режиме webhook.
+
+Telegram отправляет каждое обновление POST-запросом с JSON-телом и заголовком
+X-Telegram-Bot-Api-Secret-Token. Сервер проверяет секрет, разбирает
+обновление и передает его в AsyncTeleBot.process_new_updates, не дожидаясь
+окончания обработки, чтобы сразу ответить Telegram.
+
+TLS не настраивается: сервер рассчитан на работу за обратным прокси
+(nginx, Caddy), который терминирует HTTPS.
+"""
+import hmac
+import asyncio
+import logging
+from aiohttp import web
+from telebot import types
+from config.config import Config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Заголовок с секретным токеном, который Telegram передает в каждом запросе
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookServer:
+    """
+    Класс HTTP-сервера для приема обновлений Telegram.
+    """
+
+    def __init__(self, bot, host=None, port=None, path=None, secret_token=None):
+        """
+        Инициализация сервера webhook.
+
+        Args:
+            bot: Объект Telegram-бота (AsyncTeleBot).
+            host (str): Адрес прослушивания. По умолчанию Config.WEBHOOK_LISTEN_HOST.
+            port (int): Порт прослушивания. По умолчанию Config.WEBHOOK_LISTEN_PORT.
+            path (str): Путь запроса для обновлений. По умолчанию Config.WEBHOOK_PATH.
+            secret_token (str): Секретный токен webhook. По умолчанию Config.WEBHOOK_SECRET_TOKEN.
+        """
+        self.bot = bot
+        self.host = host or Config.WEBHOOK_LISTEN_HOST
+        self.port = port if port is not None else Config.WEBHOOK_LISTEN_PORT
+        self.path = path or Config.WEBHOOK_PATH
+        self.secret_token = secret_token if secret_token is not None else Config.WEBHOOK_SECRET_TOKEN
+        self._runner = None
+        self._tasks = set()
+
+    def create_app(self):
+        """
+        Создает приложение aiohttp с маршрутами webhook.
+
+        Returns:
+            web.Application: Приложение aiohttp.
+        """
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_update)
+        app.router.add_get("/health", self._handle_health)
+        return app
+
+    async def start(self):
+        """
+        Запускает HTTP-сервер.
+        """
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+
+        logger.info(f"Сервер webhook запущен на {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        """
+        Останавливает HTTP-сервер и дожидается обработки принятых обновлений.
+        """
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        logger.info("Сервер webhook остановлен")
+
+    async def _handle_update(self, request):
+        """
+        Обработчик POST-запроса с обновлением Telegram.
+
+        Args:
+            request (web.Request): HTTP-запрос.
+
+        Returns:
+            web.Response: Ответ 200 при успешном приеме, 403 при неверном секрете, 400 при неверном теле.
+        """
+        # Сравнение байтов: для строк compare_digest допускает только ASCII
+        # и на произвольном заголовке выбросил бы TypeError
+        if self.secret_token and not hmac.compare_digest(
+            request.headers.get(SECRET_TOKEN_HEADER, "").encode("utf-8", "surrogateescape"),
+            self.secret_token.encode("utf-8")
+        ):
+            metrics.increment("webhook_rejected_total")
+            logger.warning(f"Отклонен запрос webhook с неверным секретным токеном от {request.remote}")
+            return web.Response(status=403)
+
+        try:
+            update = types.Update.de_json(await request.json())
+        except Exception as e:
+            metrics.increment("webhook_invalid_total")
+            logger.error(f"Ошибка при разборе обновления webhook: {str(e)}")
+            return web.Response(status=400)
+
+        # Обрабатываем обновление в фоне, чтобы сразу ответить Telegram
+        task = asyncio.create_task(self.bot.process_new_updates([update]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        metrics.increment("webhook_updates_total")
+
+        return web.Response()
+
+    async def _handle_health(self, request):
+        """
+        Обработчик проверки работоспособности для прокси и мониторинга.
+        """
+        return web.Response(text="ok")
@@ -0,0 +1,429 @@
+"""
+Обработчики команд администратора.
+Управление списком пользователей и уведомления о попытках
+несанкционированного доступа.
+
+Попытки одного пользователя в пределах окна Config.ADMIN_ALERT_WINDOW_SECONDS
+объединяются в одно уведомление, которое редактируется на месте
+("попыток: 37 за 10 мин") не чаще раза в Config.ADMIN_ALERT_EDIT_INTERVAL_SECONDS,
+а не отправляется заново на каждое сообщение.
+"""
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from telebot import types
+from config.config import Config
+from core.outbound import PRIORITY_LOW
+from utils.async_io import run_io
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class UnauthorizedAlert:
+    """
+    Объединенное уведомление о попытках доступа одного пользователя.
+    """
+
+    def __init__(self, username, started_at):
+        """
+        Инициализация уведомления.
+
+        Args:
+            username (str): Имя пользователя.
+            started_at (float): Время первой попытки в окне (time.monotonic()).
+        """
+        self.username = username
+        self.started_at = started_at
+        self.attempts = 1
+        # Отправленные сообщения: идентификатор администратора -> message_id
+        self.messages = {}
+        # Задача отложенного обновления счетчика в сообщениях
+        self.edit_task = None
+
+class AdminHandlers:
+    """
+    Класс для обработки команд и кнопок администратора.
+    """
+
+    # Количество отслеживаемых пользователей, после которого удаляются истекшие уведомления
+    ALERTS_PRUNE_THRESHOLD = 1000
+
+    def __init__(self, bot, user_manager, alert_window=None, alert_edit_interval=None):
+        """
+        Инициализация обработчиков администратора.
+
+        Args:
+            bot: Объект Telegram-бота.
+            user_manager (UserManager): Менеджер пользователей.
+            alert_window (float): Окно объединения попыток (в секундах).
+                По умолчанию Config.ADMIN_ALERT_WINDOW_SECONDS.
+            alert_edit_interval (float): Минимальный интервал обновления уведомления (в секундах).
+                По умолчанию Config.ADMIN_ALERT_EDIT_INTERVAL_SECONDS.
+        """
+        self.bot = bot
+        self.user_manager = user_manager
+        self.alert_window = alert_window or Config.ADMIN_ALERT_WINDOW_SECONDS
+        self.alert_edit_interval = Config.ADMIN_ALERT_EDIT_INTERVAL_SECONDS if alert_edit_interval is None else alert_edit_interval
+
+        # Текущие уведомления по идентификатору пользователя (в порядке первой попытки)
+        self._alerts = OrderedDict()
+
+    def register_callbacks(self, router):
+        """
+        Регистрирует пространства имен callback-запросов администратора.
+
+        Args:
+            router (CallbackRouter): Маршрутизатор callback-запросов.
+        """
+        # Обработчики сами отвечают на запрос, чтобы показать результат действия
+        router.register("admin_", self._handle_menu_callback, auto_answer=False)
+        router.register("add_user_", self._handle_add_user_callback, parser=int, auto_answer=False)
+        router.register("remove_user_", self._handle_remove_user_callback, parser=int, auto_answer=False)
+        router.register("block_user_", self._handle_block_user_callback, parser=int, auto_answer=False)
+
+    async def handle_admin_command(self, message):
+        """
+        Обработчик команды /admin: меню администратора.
+
+        Args:
+            message: Объект сообщения Telegram.
+        """
+        if not await self._check_admin(message):
+            return
+
+        markup = types.InlineKeyboardMarkup()
+        markup.row(types.InlineKeyboardButton("👥 Пользователи", callback_data="admin_users"))
+        markup.row(types.InlineKeyboardButton("🚫 Заблокированные", callback_data="admin_blocked"))
+
+        await self.bot.send_message(message.chat.id, "🔐 Меню администратора", reply_markup=markup)
+
+    async def handle_users_command(self, message):
+        """
+        Обработчик команды /users: список разрешенных пользователей.
+
+        Args:
+            message: Объект сообщения Telegram.
+        """
+        if not await self._check_admin(message):
+            return
+
+        text, markup = self._users_list()
+        await self.bot.send_message(message.chat.id, text, reply_markup=markup)
+
+    async def handle_add_user_command(self, message):
+        """
+        Обработчик команды /adduser ID.
+
+        Args:
+            message: Объект сообщения Telegram.
+        """
+        if not await self._check_admin(message):
+            return
+
+        user_id = await self._parse_user_id(message, "/adduser")
+        if user_id is None:
+            return
+
+        added = await run_io(self.user_manager.add_user, user_id)
+        text = f"✅ Пользователь {user_id} добавлен." if added else f"Пользователь {user_id} уже имеет доступ."
+
+        await self.bot.send_message(message.chat.id, text)
+
+    async def handle_remove_user_command(self, message):
+        """
+        Обработчик команды /removeuser ID.
+
+        Args:
+            message: Объект сообщения Telegram.
+        """
+        if not await self._check_admin(message):
+            return
+
+        user_id = await self._parse_user_id(message, "/removeuser")
+        if user_id is None:
+            return
+
+        removed = await run_io(self.user_manager.remove_user, user_id)
+        text = f"✅ Пользователь {user_id} удален." if removed else f"Пользователя {user_id} нет в списке."
+
+        await self.bot.send_message(message.chat.id, text)
+
+    async def handle_unauthorized_access(self, user_id, username):
+        """
+        Уведомляет администраторов о попытке доступа неразрешенного пользователя.
+        Повторные попытки в пределах окна только увеличивают счетчик в уже
+        отправленном уведомлении.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            username (str): Имя пользователя.
+        """
+        # Попытки заблокированных пользователей не беспокоят администратора
+        if self.user_manager.is_blocked(user_id):
+            return
+
+        metrics.increment("unauthorized_attempts_total")
+        now = time.monotonic()
+        alert = self._alerts.get(user_id)
+
+        if alert is not None and now - alert.started_at < self.alert_window:
+            alert.attempts += 1
+            metrics.increment("admin_alerts_coalesced_total")
+
+            # Пока уведомление отправляется, счетчик обновится после отправки
+            if alert.messages:
+                self._schedule_alert_edit(user_id, alert)
+            return
+
+        self._discard_alert(user_id)
+        if len(self._alerts) >= self.ALERTS_PRUNE_THRESHOLD:
+            self._prune_alerts(now)
+
+        alert = self._alerts[user_id] = UnauthorizedAlert(username, now)
+
+        logger.warning(f"Попытка несанкционированного доступа: пользователь {user_id} ({username})")
+
+        shown_attempts = alert.attempts
+
+        for admin_id in self.user_manager.get_admin_ids():
+            try:
+                # Уведомление администратору уступает очередь ответам пользователям
+                sent = await self.bot.send_message(
+                    admin_id,
+                    self._alert_text(user_id, alert),
+                    reply_markup=self._alert_markup(user_id),
+                    priority=PRIORITY_LOW
+                )
+                alert.messages[admin_id] = sent.message_id
+                metrics.increment("admin_alerts_sent_total")
+            except Exception as e:
+                logger.error(f"Ошибка при уведомлении администратора {admin_id}: {str(e)}")
+
+        # Попытки, пришедшие во время отправки, попадают в уведомление одним редактированием
+        if alert.attempts != shown_attempts and alert.messages and self._alerts.get(user_id) is alert:
+            self._schedule_alert_edit(user_id, alert)
+
+    async def stop(self):
+        """
+        Отменяет отложенные обновления уведомлений (при остановке бота).
+        """
+        tasks = [alert.edit_task for alert in self._alerts.values() if alert.edit_task]
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _schedule_alert_edit(self, user_id, alert):
+        """
+        Планирует обновление счетчика попыток, если оно еще не запланировано:
+        серия попыток дает одно редактирование.
+        """
+        if alert.edit_task is None:
+            alert.edit_task = asyncio.create_task(self._edit_alert_later(user_id, alert))
+
+    async def _edit_alert_later(self, user_id, alert):
+        """
+        Через alert_edit_interval обновляет счетчик попыток в отправленных уведомлениях.
+        """
+        await asyncio.sleep(self.alert_edit_interval)
+        alert.edit_task = None
+
+        # Администратор мог уже добавить или заблокировать пользователя
+        if self._alerts.get(user_id) is not alert:
+            return
+
+        for admin_id, message_id in alert.messages.items():
+            try:
+                await self.bot.edit_message_text(
+                    self._alert_text(user_id, alert),
+                    chat_id=admin_id,
+                    message_id=message_id,
+                    reply_markup=self._alert_markup(user_id),
+                    priority=PRIORITY_LOW
+                )
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении уведомления администратора {admin_id}: {str(e)}")
+
+    def _alert_text(self, user_id, alert):
+        """
+        Формирует текст уведомления о попытках доступа.
+        """
+        text = f"⚠️ Попытка доступа к боту: {alert.username} (ID: {user_id})"
+
+        if alert.attempts > 1:
+            minutes = max(1, round((time.monotonic() - alert.started_at) / 60))
+            text += f"\nПопыток: {alert.attempts} за {minutes} мин."
+
+        return text
+
+    def _alert_markup(self, user_id):
+        """
+        Формирует кнопки уведомления о попытке доступа.
+        """
+        markup = types.InlineKeyboardMarkup()
+        markup.row(
+            types.InlineKeyboardButton("✅ Добавить", callback_data=f"add_user_{user_id}"),
+            types.InlineKeyboardButton("🚫 Заблокировать", callback_data=f"block_user_{user_id}")
+        )
+        return markup
+
+    def _discard_alert(self, user_id):
+        """
+        Забывает уведомление пользователя и отменяет его отложенное обновление.
+        """
+        alert = self._alerts.pop(user_id, None)
+
+        if alert is not None and alert.edit_task is not None:
+            alert.edit_task.cancel()
+
+    def _prune_alerts(self, now):
+        """
+        Удаляет уведомления с истекшим окном.
+        """
+        for user_id, alert in list(self._alerts.items()):
+            if now - alert.started_at < self.alert_window:
+                # Уведомления упорядочены по времени первой попытки
+                break
+
+            self._discard_alert(user_id)
+
+    async def _handle_menu_callback(self, call, action):
+        """
+        Обработчик кнопок меню администратора.
+
+        Args:
+            call: Объект callback-запроса Telegram.
+            action (str): Действие ("users" или "blocked").
+        """
+        if not await self._check_admin_callback(call):
+            return
+
+        if action == "users":
+            text, markup = self._users_list()
+        elif action == "blocked":
+            blocked = self.user_manager.get_blocked_users()
+            text = "🚫 Заблокированные пользователи:\n" + "\n".join(str(user_id) for user_id in blocked) \
+                if blocked else "Заблокированных пользователей нет."
+            markup = types.InlineKeyboardMarkup()
+            for user_id in blocked:
+                markup.row(types.InlineKeyboardButton(f"✅ Разблокировать {user_id}", callback_data=f"add_user_{user_id}"))
+        else:
+            await self.bot.answer_callback_query(call.id, text="Неизвестное действие.")
+            return
+
+        await self.bot.answer_callback_query(call.id)
+        await self.bot.send_message(call.message.chat.id, text, reply_markup=markup)
+
+    async def _handle_add_user_callback(self, call, user_id):
+        """
+        Обработчик кнопки добавления (или разблокировки) пользователя.
+
+        Args:
+            call: Объект callback-запроса Telegram.
+            user_id (int): Идентификатор пользователя.
+        """
+        if not await self._check_admin_callback(call):
+            return
+
+        added = await run_io(self.user_manager.add_user, user_id)
+        self._discard_alert(user_id)
+        await self._finish_callback(call, f"✅ Пользователь {user_id} добавлен." if added
+                                    else f"Пользователь {user_id} уже имеет доступ.")
+
+    async def _handle_remove_user_callback(self, call, user_id):
+        """
+        Обработчик кнопки удаления пользователя.
+
+        Args:
+            call: Объект callback-запроса Telegram.
+            user_id (int): Идентификатор пользователя.
+        """
+        if not await self._check_admin_callback(call):
+            return
+
+        removed = await run_io(self.user_manager.remove_user, user_id)
+        await self._finish_callback(call, f"✅ Пользователь {user_id} удален." if removed
+                                    else f"Пользователя {user_id} нет в списке.")
+
+    async def _handle_block_user_callback(self, call, user_id):
+        """
+        Обработчик кнопки блокировки пользователя.
+
+        Args:
+            call: Объект callback-запроса Telegram.
+            user_id (int): Идентификатор пользователя.
+        """
+        if not await self._check_admin_callback(call):
+            return
+
+        blocked = await run_io(self.user_manager.block_user, user_id)
+        self._discard_alert(user_id)
+        await self._finish_callback(call, f"🚫 Пользователь {user_id} заблокирован." if blocked
+                                    else f"Пользователь {user_id} уже заблокирован или является администратором.")
+
+    async def _finish_callback(self, call, text):
+        """
+        Отвечает на callback-запрос и заменяет кнопки сообщения результатом действия.
+        """
+        await self.bot.answer_callback_query(call.id, text=text)
+        await self.bot.edit_message_text(
+            f"{call.message.text}\n\n{text}" if call.message.text else text,
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            reply_markup=None
+        )
+
+    def _users_list(self):
+        """
+        Формирует список разрешенных пользователей с кнопками удаления.
+
+        Returns:
+            tuple: (текст, клавиатура).
+        """
+        users = self.user_manager.get_allowed_users()
+        markup = types.InlineKeyboardMarkup()
+
+        if not users:
+            return "Список разрешенных пользователей пуст: доступ открыт всем, кроме заблокированных.", markup
+
+        for user_id in users:
+            markup.row(types.InlineKeyboardButton(f"❌ Удалить {user_id}", callback_data=f"remove_user_{user_id}"))
+
+        return "👥 Разрешенные пользователи:\n" + "\n".join(str(user_id) for user_id in users), markup
+
+    async def _parse_user_id(self, message, command):
+        """
+        Разбирает идентификатор пользователя из аргумента команды.
+
+        Returns:
+            int: Идентификатор или None, если аргумент некорректен.
+        """
+        parts = (message.text or "").split()
+
+        try:
+            return int(parts[1])
+        except (IndexError, ValueError):
+            await self.bot.send_message(message.chat.id, f"Использование: {command} ID")
+            return None
+
+    async def _check_admin(self, message):
+        """
+        Проверяет права администратора у автора сообщения.
+        """
+        if self.user_manager.is_admin(message.from_user.id):
+            return True
+
+        await self.bot.send_message(message.chat.id, "⛔ У вас нет прав администратора.")
+        return False
+
+    async def _check_admin_callback(self, call):
+        """
+        Проверяет права администратора у нажавшего кнопку.
+        """
+        if self.user_manager.is_admin(call.from_user.id):
+            return True
+
+        await self.bot.answer_callback_query(call.id, text="⛔ У вас нет прав администратора.")
+        return False
@@ -2,24 +2,39 @@
 Обработчик команды /protocol.
 Реализует сценарий протоколирования встречи.
 """
+import io
 import os
 import logging
 import asyncio
+from types import SimpleNamespace
 from telebot import types
-from core.auth import Auth
-from services.whisper_service import WhisperService
-from services.ollama_service import OllamaService
-from utils.pdf_generator import PDFGenerator
 from utils.file_manager import FileManager
+from utils.async_io import run_io
+from utils.lazy import LazyService, warm_up
 from utils.text_formatter import TextFormatter
+from core.fsm import ScenarioEngine, Step
+from core.job_queue import JobQueue, JobQueueFull
+from config.config import Config
+from handlers.scenarios import PROTOCOL_SCENARIO
 
 logger = logging.getLogger(__name__)
 
 class ProtocolHandler:
     """
     Класс для обработки команды /protocol.
+    Шаги сценария описаны данными в handlers.scenarios, здесь реализованы
+    только действия: распознавание голоса и генерация PDF.
     """
     
+    # Пространство имен callback-запросов кнопок подтверждения
+    CALLBACK_PREFIX = "protocol_confirm_"
+    
+    # Резервное форматирование распознанного текста по типу шага
+    FALLBACK_FORMATTERS = {
+        "questions": TextFormatter.format_questions_to_markdown,
+        "decisions": TextFormatter.format_decisions_to_markdown,
+    }
+    
     def __init__(self, bot, session_manager):
         """
         Инициализация обработчика команды /protocol.
@@ -30,9 +45,31 @@ class ProtocolHandler:
         """
         self.bot = bot
         self.session_manager = session_manager
-        self.whisper_service = WhisperService()
-        self.ollama_service = OllamaService()
-        self.pdf_generator = PDFGenerator()
+        
+        # Тяжелые сервисы создаются при первом обращении или фоновым прогревом
+        self.whisper_service = LazyService("services.whisper_service", "WhisperService")
+        self.ollama_service = LazyService("services.ollama_service", "OllamaService")
+        self.pdf_generator = LazyService("utils.pdf_generator", "PDFGenerator")
+        
+        # Очередь распознавания: ограничивает число одновременных запусков Whisper
+        self.voice_queue = JobQueue(
+            "voice_queue",
+            Config.VOICE_QUEUE_CONCURRENCY,
+            Config.VOICE_QUEUE_MAX_WAITING,
+            Config.VOICE_JOB_ESTIMATE_SECONDS
+        )
+        
+        # Движок сценария с действиями обработчика
+        self.engine = ScenarioEngine(
+            bot,
+            session_manager,
+            [PROTOCOL_SCENARIO],
+            {
+                "transcribe": self._transcribe_voice,
+                "generate_pdf": self._generate_and_send_pdf,
+            },
+            confirm_markup=self._confirm_markup
+        )
         
         logger.info("Инициализирован обработчик команды /protocol")
     
@@ -44,21 +81,7 @@ class ProtocolHandler:
         Args:
             message: Объект сообщения Telegram.
         """
-        user_id = message.from_user.id
-        
-        # Создаем новую сессию для пользователя
-        self.session_manager.create_session(user_id)
-        
-        # Устанавливаем начальное состояние сессии
-        self.session_manager.update_session_state(user_id, "waiting_protocol_name")
-        
-        # Запрашиваем название протокола
-        await self.bot.send_message(
-            message.chat.id,
-            "Введите название протокола:"
-        )
-        
-        logger.info(f"Пользователь {user_id} запустил сценарий протоколирования встречи")
+        await self.engine.start(message, PROTOCOL_SCENARIO.command)
     
     async def handle_text_message(self, message):
         """
@@ -68,39 +91,7 @@ class ProtocolHandler:
         Args:
             message: Объект сообщения Telegram.
         """
-        user_id = message.from_user.id
-        text = message.text
-        
-        # Получаем текущее состояние сессии
-        state = self.session_manager.get_session_state(user_id)
-        
-        if not state:
-            # Если сессия не найдена, предлагаем начать сценарий
-            await self.bot.send_message(
-                message.chat.id,
-                "Для начала работы используйте команду /protocol"
-            )
-            return
-        
-        # Обработка сообщения в зависимости от состояния сессии
-        if state == "waiting_protocol_name":
-            await self._handle_protocol_name(message, text)
-        elif state == "waiting_date":
-            await self._handle_date(message, text)
-        elif state == "waiting_project_number":
-            await self._handle_project_number(message, text)
-        elif state == "waiting_contract_year":
-            await self._handle_contract_year(message, text)
-        elif state == "waiting_project_type":
-            await self._handle_project_type(message, text)
-        elif state == "waiting_object_name":
-            await self._handle_object_name(message, text)
-        elif state == "waiting_client_name":
-            await self._handle_client_name(message, text)
-        elif state == "waiting_questions_confirmation":
-            await self._handle_questions_confirmation(message, text)
-        elif state == "waiting_decisions_confirmation":
-            await self._handle_decisions_confirmation(message, text)
+        await self.engine.handle_text(message)
     
     async def handle_voice_message(self, message):
         """
@@ -110,201 +101,124 @@ class ProtocolHandler:
         Args:
             message: Объект сообщения Telegram.
         """
-        user_id = message.from_user.id
-        
-        # Получаем текущее состояние сессии
-        state = self.session_manager.get_session_state(user_id)
-        
-        if not state:
-            # Если сессия не найдена, предлагаем начать сценарий
-            await self.bot.send_message(
-                message.chat.id,
-                "Для начала работы используйте команду /protocol"
-            )
-            return
-        
-        # Обработка голосового сообщения в зависимости от состояния сессии
-        if state == "waiting_questions_voice":
-            await self._handle_questions_voice(message)
-        elif state == "waiting_decisions_voice":
-            await self._handle_decisions_voice(message)
+        await self.engine.handle_voice(message)
     
-    async def _handle_protocol_name(self, message, text):
+    async def resume_pending_job(self, user_id):
         """
-        Обработчик ввода названия протокола.
+        Возобновляет распознавание или генерацию PDF, прерванные остановкой бота.
         
         Args:
-            message: Объект сообщения Telegram.
-            text: Текст сообщения.
+            user_id (int): Идентификатор пользователя Telegram.
         """
-        user_id = message.from_user.id
-        
-        # Сохраняем название протокола
-        self.session_manager.update_session_data(
-            user_id,
-            {"metadata": {"protocol_name": text}}
-        )
-        
-        # Переходим к следующему шагу - запрос даты
-        self.session_manager.update_session_state(user_id, "waiting_date")
-        
-        await self.bot.send_message(
-            message.chat.id,
-            "Введите дату встречи:"
-        )
+        await self.engine.resume(user_id)
     
-    async def _handle_date(self, message, text):
+    def register_callbacks(self, router):
         """
-        Обработчик ввода даты.
+        Регистрирует пространство имен callback-запросов обработчика.
         
         Args:
-            message: Объект сообщения Telegram.
-            text: Текст сообщения.
+            router (CallbackRouter): Маршрутизатор callback-запросов.
         """
-        user_id = message.from_user.id
-        
-        # Сохраняем дату
-        self.session_manager.update_session_data(
-            user_id,
-            {"metadata": {"date": text}}
-        )
-        
-        # Переходим к следующему шагу - запрос номера проекта
-        self.session_manager.update_session_state(user_id, "waiting_project_number")
-        
-        await self.bot.send_message(
-            message.chat.id,
-            "Введите номер проекта:"
+        router.register(
+            self.CALLBACK_PREFIX,
+            self._handle_confirm_callback,
+            parser=self._parse_confirm_payload,
+            auto_answer=False
         )
     
-    async def _handle_project_number(self, message, text):
+    def _confirm_markup(self, state):
         """
-        Обработчик ввода номера проекта.
+        Кнопки ответа на запрос подтверждения распознанного текста.
+        В callback_data входит состояние шага, к которому относится запрос.
         
         Args:
-            message: Объект сообщения Telegram.
-            text: Текст сообщения.
-        """
-        user_id = message.from_user.id
-        
-        # Сохраняем номер проекта
-        self.session_manager.update_session_data(
-            user_id,
-            {"metadata": {"project_number": text}}
-        )
-        
-        # Переходим к следующему шагу - запрос года договора
-        self.session_manager.update_session_state(user_id, "waiting_contract_year")
-        
-        await self.bot.send_message(
-            message.chat.id,
-            "Введите год договора:"
-        )
-    
-    async def _handle_contract_year(self, message, text):
-        """
-        Обработчик ввода года договора.
-        
-        Args:
-            message: Объект сообщения Telegram.
-            text: Текст сообщения.
+            state (str): Состояние шага подтверждения.
+            
+        Returns:
+            types.InlineKeyboardMarkup: Клавиатура "Да" / "Записать заново".
         """
-        user_id = message.from_user.id
-        
-        # Сохраняем год договора
-        self.session_manager.update_session_data(
-            user_id,
-            {"metadata": {"contract_year": text}}
-        )
-        
-        # Переходим к следующему шагу - запрос типа проекта
-        self.session_manager.update_session_state(user_id, "waiting_project_type")
-        
-        await self.bot.send_message(
-            message.chat.id,
-            "Введите тип проекта:"
+        markup = types.InlineKeyboardMarkup()
+        markup.row(
+            types.InlineKeyboardButton("✅ Да", callback_data=f"{self.CALLBACK_PREFIX}{state}_yes"),
+            types.InlineKeyboardButton("🔁 Записать заново", callback_data=f"{self.CALLBACK_PREFIX}{state}_no")
         )
+        return markup
     
-    async def _handle_project_type(self, message, text):
+    @staticmethod
+    def _parse_confirm_payload(payload):
         """
-        Обработчик ввода типа проекта.
+        Разбирает данные кнопки подтверждения "<состояние>_<yes|no>".
         
         Args:
-            message: Объект сообщения Telegram.
-            text: Текст сообщения.
+            payload (str): Данные после префикса.
+            
+        Returns:
+            tuple: (состояние шага, ответ "yes" или "no").
         """
-        user_id = message.from_user.id
+        state, _, answer = payload.rpartition("_")
+        step = PROTOCOL_SCENARIO.steps.get(state)
         
-        # Сохраняем тип проекта
-        self.session_manager.update_session_data(
-            user_id,
-            {"metadata": {"project_type": text}}
-        )
-        
-        # Переходим к следующему шагу - запрос названия ЖК/объекта
-        self.session_manager.update_session_state(user_id, "waiting_object_name")
+        if answer not in ("yes", "no") or step is None or step.kind != Step.CONFIRM:
+            raise ValueError(f"Недопустимые данные кнопки подтверждения: {payload}")
         
-        await self.bot.send_message(
-            message.chat.id,
-            "Введите название ЖК/объекта:"
-        )
+        return state, answer
     
-    async def _handle_object_name(self, message, text):
+    async def _handle_confirm_callback(self, call, payload):
         """
-        Обработчик ввода названия ЖК/объекта.
+        Обработчик нажатия кнопки подтверждения распознанного текста.
         
         Args:
-            message: Объект сообщения Telegram.
-            text: Текст сообщения.
+            call: Объект callback-запроса Telegram.
+            payload (tuple): Состояние шага и ответ ("yes" или "no").
         """
-        user_id = message.from_user.id
+        state, answer = payload
         
-        # Сохраняем название ЖК/объекта
-        self.session_manager.update_session_data(
-            user_id,
-            {"metadata": {"object_name": text}}
+        # Убираем кнопки, чтобы ответ нельзя было отправить повторно
+        await self.bot.edit_message_reply_markup(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            reply_markup=None
         )
         
-        # Переходим к следующему шагу - запрос имени заказчика
-        self.session_manager.update_session_state(user_id, "waiting_client_name")
+        # Отправитель сообщения с кнопками - бот, поэтому пользователя берем из callback-запроса
+        message = SimpleNamespace(from_user=call.from_user, chat=call.message.chat, text=None)
         
-        await self.bot.send_message(
-            message.chat.id,
-            "Введите имя заказчика:"
-        )
+        if await self.engine.handle_confirmation(message, answer == "yes", state):
+            await self.bot.answer_callback_query(call.id)
+        else:
+            # Кнопка под старым запросом: шаг уже пройден
+            await self.bot.answer_callback_query(call.id, text="Этот запрос уже неактуален.")
     
-    async def _handle_client_name(self, message, text):
+    async def _transcribe_voice(self, message, step, session_data):
         """
-        Обработчик ввода имени заказчика.
+        Действие голосового шага: распознает и форматирует голосовое сообщение
+        (и сохраняет его в директории сессии при Config.ARCHIVE_VOICE_MESSAGES).
         
         Args:
             message: Объект сообщения Telegram.
-            text: Текст сообщения.
+            step: Шаг сценария (params: format_type, file_name).
+            session_data (dict): Данные сессии.
+            
+        Returns:
+            str: Форматированный текст или None при ошибке.
         """
         user_id = message.from_user.id
+        format_type = step.params["format_type"]
         
-        # Сохраняем имя заказчика
-        self.session_manager.update_session_data(
-            user_id,
-            {"metadata": {"client_name": text}}
-        )
+        # У сообщения, восстановленного после перезапуска из старой отметки, идентификатора может не быть
+        file_unique_id = getattr(message.voice, "file_unique_id", None)
         
-        # Переходим к следующему шагу - запрос голосового сообщения с вопросами
-        self.session_manager.update_session_state(user_id, "waiting_questions_voice")
+        # Повторно отправленное сообщение берется из кэша без скачивания и очереди
+        transcription = await self._get_cached_transcription(file_unique_id)
         
-        await self.bot.send_message(
-            message.chat.id,
-            "Теперь отправьте голосовое сообщение с ключевыми вопросами встречи, указывая нумерацию вопросов."
-        )
-    
-    async def _handle_questions_voice(self, message):
-        """
-        Обработчик голосового сообщения с вопросами.
+        # Не скачиваем файл, если очередь распознавания переполнена
+        if transcription is None and self.voice_queue.full:
+            await self._reject_voice(message)
+            return None
         
-        Args:
-            message: Объект сообщения Telegram.
-        """
-        user_id = message.from_user.id
+        # Модель, выгруженная после простоя, загружается, пока сообщение скачивается и ждет очереди
+        if transcription is None and self.whisper_service.created:
+            (await self.whisper_service.get_async()).wake()
         
         # Отправляем сообщение о начале обработки
         processing_msg = await self.bot.send_message(
@@ -312,54 +226,56 @@ class ProtocolHandler:
             "Обрабатываю голосовое сообщение..."
         )
         
+        async def report_position(position, eta):
+            await self._report_queue_position(processing_msg, position, eta)
+        
         try:
-            # Получаем информацию о голосовом сообщении
-            file_info = await self.bot.get_file(message.voice.file_id)
-            
-            # Скачиваем файл
-            downloaded_file = await self.bot.download_file(file_info.file_path)
-            
-            # Сохраняем файл в директории сессии
-            voice_file_path = FileManager.save_voice_message(user_id, downloaded_file)
-            
-            if not voice_file_path:
-                await self.bot.send_message(
-                    message.chat.id,
-                    "Ошибка при сохранении голосового сообщения. Пожалуйста, попробуйте еще раз."
-                )
-                return
-            
-            # Распознаем речь
-            transcription = await self.whisper_service.transcribe_audio(voice_file_path)
+            if transcription is None:
+                # Получаем информацию о голосовом сообщении
+                file_info = await self.bot.get_file(message.voice.file_id)
+                
+                # Скачиваем файл
+                downloaded_file = await self.bot.download_file(file_info.file_path)
+                
+                # Архивная копия сохраняется параллельно с распознаванием, которое
+                # получает аудио из памяти
+                archive = None
+                if Config.ARCHIVE_VOICE_MESSAGES:
+                    archive = asyncio.create_task(
+                        self.session_manager.save_file_async(user_id, downloaded_file, step.params["file_name"])
+                    )
+                
+                # Распознаем речь в ограниченной очереди, сообщая пользователю позицию и время ожидания
+                try:
+                    transcription = await self.voice_queue.run(
+                        self._transcribe_audio,
+                        downloaded_file,
+                        file_unique_id,
+                        on_position=report_position
+                    )
+                except JobQueueFull:
+                    await self._reject_voice(message)
+                    return None
+                finally:
+                    if archive and not await archive:
+                        logger.warning(f"Не удалось сохранить архивную копию голосового сообщения пользователя {user_id}")
             
             if not transcription:
                 await self.bot.send_message(
                     message.chat.id,
                     "Ошибка при распознавании речи. Пожалуйста, попробуйте еще раз."
                 )
-                return
+                return None
             
             # Форматируем текст
-            formatted_text = await self.ollama_service.format_text(transcription, "questions")
+            ollama_service = await self.ollama_service.get_async()
+            formatted_text = await ollama_service.format_text(transcription, format_type)
             
             if not formatted_text:
                 # Используем резервный метод форматирования
-                formatted_text = TextFormatter.format_questions_to_markdown(transcription)
-            
-            # Сохраняем форматированный текст
-            self.session_manager.update_session_data(
-                user_id,
-                {"questions": formatted_text}
-            )
-            
-            # Отправляем результат пользователю
-            await self.bot.send_message(
-                message.chat.id,
-                f"Распознанный текст:\n\n{formatted_text}\n\nВсё верно?"
-            )
+                formatted_text = self.FALLBACK_FORMATTERS[format_type](transcription)
             
-            # Переходим к подтверждению списка вопросов
-            self.session_manager.update_session_state(user_id, "waiting_questions_confirmation")
+            return formatted_text
             
         except Exception as e:
             logger.error(f"Ошибка при обработке голосового сообщения: {str(e)}")
@@ -367,149 +283,119 @@ class ProtocolHandler:
                 message.chat.id,
                 "Произошла ошибка при обработке голосового сообщения. Пожалуйста, попробуйте еще раз."
             )
+            return None
     
-    async def _handle_questions_confirmation(self, message, text):
+    async def warm_up(self):
         """
-        Обработчик подтверждения списка вопросов.
-        
-        Args:
-            message: Объект сообщения Telegram.
-            text: Текст сообщения.
+        Заранее создает тяжелые сервисы, чтобы первое голосовое сообщение
+        не ждало загрузки модели.
         """
-        user_id = message.from_user.id
+        await warm_up([self.whisper_service, self.ollama_service, self.pdf_generator])
         
-        # Обработка подтверждения списка вопросов
-        if text.lower() in ["да", "хорошо", "верно", "ок", "ok", "yes"]:
-            # Переходим к следующему шагу - запрос голосового сообщения с решениями
-            self.session_manager.update_session_state(user_id, "waiting_decisions_voice")
-            
-            await self.bot.send_message(
-                message.chat.id,
-                "Теперь отправьте голосовое сообщение с принятыми решениями, указывая нумерацию решений."
-            )
-        else:
-            # Возвращаемся к запросу голосового сообщения с вопросами
-            self.session_manager.update_session_state(user_id, "waiting_questions_voice")
-            
-            await self.bot.send_message(
-                message.chat.id,
-                "Пожалуйста, отправьте голосовое сообщение с ключевыми вопросами встречи повторно."
-            )
+        # Загрузка модели в процессах распознавания
+        try:
+            whisper_service = await self.whisper_service.get_async()
+            await whisper_service.warm_up()
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке модели Whisper: {str(e)}")
+    
+    async def close(self):
+        """
+        Останавливает процессы распознавания, если они были запущены.
+        """
+        if self.whisper_service.created:
+            whisper_service = await self.whisper_service.get_async()
+            await whisper_service.close()
     
-    async def _handle_decisions_voice(self, message):
+    async def _get_cached_transcription(self, file_unique_id):
         """
-        Обработчик голосового сообщения с решениями.
+        Возвращает ранее распознанный текст голосового сообщения. Пока сервис
+        Whisper не создан, кэш не проверяется, чтобы не загружать его вне очереди.
         
         Args:
-            message: Объект сообщения Telegram.
+            file_unique_id (str): Постоянный идентификатор файла в Telegram (None - кэш не проверяется).
+            
+        Returns:
+            str: Распознанный текст или None.
         """
-        user_id = message.from_user.id
-        
-        # Отправляем сообщение о начале обработки
-        processing_msg = await self.bot.send_message(
-            message.chat.id,
-            "Обрабатываю голосовое сообщение..."
-        )
+        if not file_unique_id or not self.whisper_service.created:
+            return None
         
         try:
-            # Получаем информацию о голосовом сообщении
-            file_info = await self.bot.get_file(message.voice.file_id)
-            
-            # Скачиваем файл
-            downloaded_file = await self.bot.download_file(file_info.file_path)
-            
-            # Сохраняем файл в директории сессии
-            voice_file_path = FileManager.save_voice_message(user_id, downloaded_file, "decisions_voice.ogg")
-            
-            if not voice_file_path:
-                await self.bot.send_message(
-                    message.chat.id,
-                    "Ошибка при сохранении голосового сообщения. Пожалуйста, попробуйте еще раз."
-                )
-                return
-            
-            # Распознаем речь
-            transcription = await self.whisper_service.transcribe_audio(voice_file_path)
-            
-            if not transcription:
-                await self.bot.send_message(
-                    message.chat.id,
-                    "Ошибка при распознавании речи. Пожалуйста, попробуйте еще раз."
-                )
-                return
-            
-            # Форматируем текст
-            formatted_text = await self.ollama_service.format_text(transcription, "decisions")
-            
-            if not formatted_text:
-                # Используем резервный метод форматирования
-                formatted_text = TextFormatter.format_decisions_to_markdown(transcription)
-            
-            # Сохраняем форматированный текст
-            self.session_manager.update_session_data(
-                user_id,
-                {"decisions": formatted_text}
-            )
-            
-            # Отправляем результат пользователю
-            await self.bot.send_message(
-                message.chat.id,
-                f"Распознанный текст:\n\n{formatted_text}\n\nВсё верно?"
-            )
-            
-            # Переходим к подтверждению списка решений
-            self.session_manager.update_session_state(user_id, "waiting_decisions_confirmation")
-            
+            whisper_service = await self.whisper_service.get_async()
+            return await whisper_service.get_cached_transcription(file_unique_id)
         except Exception as e:
-            logger.error(f"Ошибка при обработке голосового сообщения: {str(e)}")
-            await self.bot.send_message(
-                message.chat.id,
-                "Произошла ошибка при обработке голосового сообщения. Пожалуйста, попробуйте еще раз."
-            )
+            logger.error(f"Ошибка при чтении кэша распознавания: {str(e)}")
+            return None
     
-    async def _handle_decisions_confirmation(self, message, text):
+    async def _transcribe_audio(self, voice_file_data, file_unique_id=None):
         """
-        Обработчик подтверждения списка решений.
+        Распознает речь; сервис Whisper создается в слоте очереди распознавания,
+        если прогрев еще не завершен.
         
         Args:
-            message: Объект сообщения Telegram.
-            text: Текст сообщения.
+            voice_file_data (bytes): Данные голосового сообщения.
+            file_unique_id (str): Постоянный идентификатор файла в Telegram (ключ кэша).
+            
+        Returns:
+            str: Распознанный текст или None в случае ошибки.
         """
-        user_id = message.from_user.id
+        whisper_service = await self.whisper_service.get_async()
+        return await whisper_service.transcribe_voice_message(voice_file_data, file_unique_id)
+    
+    async def _report_queue_position(self, processing_msg, position, eta):
+        """
+        Обновляет сообщение о ходе обработки: позиция в очереди или начало распознавания.
         
-        # Обработка подтверждения списка решений
-        if text.lower() in ["да", "хорошо", "верно", "ок", "ok", "yes"]:
-            # Переходим к генерации PDF
-            self.session_manager.update_session_state(user_id, "generating_pdf")
-            
-            await self.bot.send_message(
-                message.chat.id,
-                "Генерирую итоговый PDF-документ..."
+        Args:
+            processing_msg: Сообщение "Обрабатываю голосовое сообщение...".
+            position (int): Позиция в очереди (0 - распознавание началось).
+            eta (float): Оценка времени ожидания в секундах.
+        """
+        if position:
+            text = (
+                f"Голосовое сообщение в очереди на распознавание: позиция {position}, "
+                f"ожидание около {max(1, round(eta / 60))} мин."
             )
-            
-            # Генерируем и отправляем PDF
-            await self._generate_and_send_pdf(message)
         else:
-            # Возвращаемся к запросу голосового сообщения с решениями
-            self.session_manager.update_session_state(user_id, "waiting_decisions_voice")
-            
-            await self.bot.send_message(
-                message.chat.id,
-                "Пожалуйста, отправьте голосовое сообщение с принятыми решениями повторно."
-            )
+            text = "Распознаю голосовое сообщение..."
+        
+        await self.bot.edit_message_text(
+            text,
+            chat_id=processing_msg.chat.id,
+            message_id=processing_msg.message_id
+        )
     
-    async def _generate_and_send_pdf(self, message):
+    async def _reject_voice(self, message):
+        """
+        Сообщает пользователю, что очередь распознавания переполнена.
+        
+        Args:
+            message: Объект сообщения Telegram.
+        """
+        logger.warning(f"Очередь распознавания переполнена, голосовое сообщение пользователя {message.from_user.id} отклонено")
+        await self.bot.send_message(
+            message.chat.id,
+            "Сейчас распознается слишком много голосовых сообщений. "
+            "Пожалуйста, отправьте голосовое сообщение повторно через несколько минут."
+        )
+    
+    async def _generate_and_send_pdf(self, message, step=None, session_data=None):
         """
         Генерирует и отправляет PDF-документ.
+        Используется как действие шага сценария generating_pdf.
         
         Args:
             message: Объект сообщения Telegram.
+            step: Шаг сценария.
+            session_data (dict): Данные сессии.
         """
         user_id = message.from_user.id
         
         try:
-            # Получаем данные сессии
-            session_data = self.session_manager.get_session_data(user_id)
+            # Получаем данные сессии, если они не переданы движком сценариев
+            if session_data is None:
+                session_data = await self.session_manager.get_session_data_async(user_id)
             
             if not session_data:
                 await self.bot.send_message(
@@ -524,7 +410,7 @@ class ProtocolHandler:
             decisions = session_data.get("decisions", "")
             
             # Получаем путь к директории сессии
-            session_dir = self.session_manager.get_session_dir(user_id)
+            session_dir = await self.session_manager.get_session_dir_async(user_id)
             
             if not session_dir:
                 await self.bot.send_message(
@@ -536,8 +422,10 @@ class ProtocolHandler:
             # Путь для сохранения PDF
             pdf_path = os.path.join(session_dir, "protocol.pdf")
             
-            # Генерируем PDF
-            success = self.pdf_generator.generate_protocol_pdf(
+            # Генерируем PDF в пуле ввода-вывода, не блокируя цикл событий
+            pdf_generator = await self.pdf_generator.get_async()
+            success = await run_io(
+                pdf_generator.generate_protocol_pdf,
                 metadata,
                 questions,
                 decisions,
@@ -551,13 +439,25 @@ class ProtocolHandler:
                 )
                 return
             
-            # Отправляем PDF пользователю
-            with open(pdf_path, "rb") as pdf_file:
-                await self.bot.send_document(
+            # Читаем PDF без блокировки цикла событий
+            pdf_data = await FileManager.read_file_async(pdf_path)
+            
+            if pdf_data is None:
+                await self.bot.send_message(
                     message.chat.id,
-                    pdf_file,
-                    caption=f"Протокол встречи: {metadata.get('protocol_name', 'Протокол')}"
+                    "Ошибка при чтении PDF. Пожалуйста, попробуйте еще раз."
                 )
+                return
+            
+            pdf_file = io.BytesIO(pdf_data)
+            pdf_file.name = os.path.basename(pdf_path)
+            
+            # Отправляем PDF пользователю
+            await self.bot.send_document(
+                message.chat.id,
+                pdf_file,
+                caption=f"Протокол встречи: {metadata.get('protocol_name', 'Протокол')}"
+            )
             
             # Отправляем сообщение об успешном завершении
             await self.bot.send_message(
@@ -566,7 +466,7 @@ class ProtocolHandler:
             )
             
             # Удаляем сессию
-            self.session_manager.delete_session(user_id)
+            await self.session_manager.delete_session_async(user_id)
             
         except Exception as e:
             logger.error(f"Ошибка при генерации и отправке PDF: {str(e)}")
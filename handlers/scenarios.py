@@ -0,0 +1,106 @@
+"""
+Описания сценариев бота в виде данных для движка core.fsm.
+Новый сценарий добавляется сюда списком шагов без нового кода обработчиков.
+"""
+from core.fsm import Scenario, Step, validate_not_empty
+
+# Сценарий "Протокол встречи"
+PROTOCOL_SCENARIO = Scenario(
+    name="protocol",
+    command="protocol",
+    initial_state="waiting_protocol_name",
+    steps=[
+        Step(
+            "waiting_protocol_name",
+            prompt="Введите название протокола:",
+            field="metadata.protocol_name",
+            validator=validate_not_empty,
+            next_state="waiting_date"
+        ),
+        Step(
+            "waiting_date",
+            prompt="Введите дату встречи:",
+            field="metadata.date",
+            validator=validate_not_empty,
+            next_state="waiting_project_number"
+        ),
+        Step(
+            "waiting_project_number",
+            prompt="Введите номер проекта:",
+            field="metadata.project_number",
+            validator=validate_not_empty,
+            next_state="waiting_contract_year"
+        ),
+        Step(
+            "waiting_contract_year",
+            prompt="Введите год договора:",
+            field="metadata.contract_year",
+            validator=validate_not_empty,
+            next_state="waiting_project_type"
+        ),
+        Step(
+            "waiting_project_type",
+            prompt="Введите тип проекта:",
+            field="metadata.project_type",
+            validator=validate_not_empty,
+            next_state="waiting_object_name"
+        ),
+        Step(
+            "waiting_object_name",
+            prompt="Введите название ЖК/объекта:",
+            field="metadata.object_name",
+            validator=validate_not_empty,
+            next_state="waiting_client_name"
+        ),
+        Step(
+            "waiting_client_name",
+            prompt="Введите имя заказчика:",
+            field="metadata.client_name",
+            validator=validate_not_empty,
+            next_state="waiting_questions_voice"
+        ),
+        Step(
+            "waiting_questions_voice",
+            kind=Step.VOICE,
+            prompt="Теперь отправьте голосовое сообщение с ключевыми вопросами встречи, указывая нумерацию вопросов.",
+            field="questions",
+            action="transcribe",
+            params={"format_type": "questions", "file_name": "voice_message.ogg"},
+            next_state="waiting_questions_confirmation"
+        ),
+        Step(
+            "waiting_questions_confirmation",
+            kind=Step.CONFIRM,
+            prompt="Распознанный текст:\n\n{value}\n\nВсё верно?",
+            next_state="waiting_decisions_voice",
+            retry_state="waiting_questions_voice",
+            retry_prompt="Пожалуйста, отправьте голосовое сообщение с ключевыми вопросами встречи повторно."
+        ),
+        Step(
+            "waiting_decisions_voice",
+            kind=Step.VOICE,
+            prompt="Теперь отправьте голосовое сообщение с принятыми решениями, указывая нумерацию решений.",
+            field="decisions",
+            action="transcribe",
+            params={"format_type": "decisions", "file_name": "decisions_voice.ogg"},
+            next_state="waiting_decisions_confirmation"
+        ),
+        Step(
+            "waiting_decisions_confirmation",
+            kind=Step.CONFIRM,
+            prompt="Распознанный текст:\n\n{value}\n\nВсё верно?",
+            next_state="generating_pdf",
+            retry_state="waiting_decisions_voice",
+            retry_prompt="Пожалуйста, отправьте голосовое сообщение с принятыми решениями повторно."
+        ),
+        Step(
+            "generating_pdf",
+            kind=Step.ACTION,
+            prompt="Генерирую итоговый PDF-документ...",
+            action="generate_pdf"
+        ),
+    ]
+)
+
+# Все сценарии бота; первый используется по умолчанию
+SCENARIOS = [PROTOCOL_SCENARIO]
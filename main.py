@@ -3,8 +3,15 @@
 Инициализирует и запускает Telegram-бота.
 """
 import os
+import signal
 import logging
 import asyncio
+from dotenv import load_dotenv
+
+# Переменные окружения из .env загружаются до импорта конфигурации,
+# которая читает их при определении класса Config
+load_dotenv()
+
 from core.bot import TelegramBot
 from config.config import Config
 
@@ -24,6 +31,16 @@ async def main():
     
     # Инициализация и запуск бота
     bot = TelegramBot()
+    
+    # SIGTERM (остановка при деплое) и SIGINT (Ctrl+C) запускают согласованную остановку
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, bot.stop)
+        except NotImplementedError:
+            # Windows не поддерживает обработчики сигналов в цикле событий
+            pass
+    
     await bot.run()
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+"""
+Декодирование голосовых сообщений в PCM для распознавания речи.
+
+Голосовые сообщения Telegram (OGG/Opus) передаются на вход ffmpeg через
+канал и возвращаются из него сразу в формате, который ожидает Whisper:
+16 кГц, моно, float32. Аудио не проходит через временные файлы.
+"""
+import asyncio
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Частота дискретизации, на которой обучены модели Whisper
+SAMPLE_RATE = 16000
+
+class AudioDecodeError(Exception):
+    """
+    Исключение при ошибке декодирования аудио.
+    """
+
+async def decode_audio(data, sample_rate=SAMPLE_RATE, timeout=None):
+    """
+    Декодирует аудио (OGG/Opus или любой формат, известный ffmpeg) в PCM.
+
+    Args:
+        data (bytes): Содержимое аудиофайла.
+        sample_rate (int): Частота дискретизации результата.
+        timeout (float): Максимальное время декодирования (в секундах).
+
+    Returns:
+        numpy.ndarray: Моно-сигнал float32 в диапазоне [-1, 1].
+
+    Raises:
+        AudioDecodeError: Если ffmpeg не смог декодировать данные.
+    """
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-f", "f32le", "-ac", "1", "-ar", str(sample_rate),
+        "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+
+    try:
+        # communicate пишет вход и читает выход одновременно, не переполняя буферы каналов
+        stdout, stderr = await asyncio.wait_for(process.communicate(data), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        process.kill()
+        await process.wait()
+        raise
+
+    if process.returncode != 0:
+        raise AudioDecodeError(f"ffmpeg завершился с кодом {process.returncode}: {stderr.decode(errors='replace').strip()}")
+
+    audio = np.frombuffer(stdout, dtype=np.float32)
+
+    logger.info(f"Декодировано аудио: {len(data)} байт -> {len(audio) / sample_rate:.1f} с PCM")
+
+    return audio
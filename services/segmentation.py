@@ -0,0 +1,121 @@
+"""
+Разбиение длинного аудио на сегменты для параллельного распознавания.
+
+Длинная запись распознается одной задачей на одном ядре. Чтобы занять
+все процессы пула, сигнал разрезается на сегменты не длиннее заданного:
+разрезы выбираются в самых длинных паузах между участками речи
+(services.vad), чтобы не разрывать слова; места, где VAD уже вырезал
+длинную паузу (TimestampMap.joins), тоже считаются паузами с исходной
+длиной и поэтому выбираются первыми. Если пауз нет (сплошная речь),
+сегмент режется жестко с перекрытием, а повтор слов на стыке убирается
+при склейке текстов (merge_transcripts).
+"""
+import re
+from services.vad import detect_speech
+
+# Максимальное число слов, которое ищется в перекрытии на стыке сегментов
+MAX_OVERLAP_WORDS = 12
+
+class Segment:
+    """
+    Сегмент аудио для распознавания.
+    """
+
+    def __init__(self, start, end, overlap):
+        """
+        Args:
+            start (int): Начало в отсчетах.
+            end (int): Конец в отсчетах.
+            overlap (bool): Начало перекрывается с концом предыдущего сегмента
+                (жесткий разрез без паузы).
+        """
+        self.start = start
+        self.end = end
+        self.overlap = overlap
+
+    def __repr__(self):
+        return f"Segment({self.start}, {self.end}, overlap={self.overlap})"
+
+def split_at_silence(audio, sample_rate, max_seconds, overlap_seconds, joins=None):
+    """
+    Разбивает сигнал на сегменты не длиннее max_seconds по паузам.
+
+    Args:
+        audio (numpy.ndarray): Моно-сигнал float32.
+        sample_rate (int): Частота дискретизации.
+        max_seconds (float): Максимальная длина сегмента.
+        overlap_seconds (float): Перекрытие при жестком разрезе.
+        joins (list): Места вырезанных пауз (позиция, длина паузы) в отсчетах
+            (TimestampMap.joins для сигнала после VAD).
+
+    Returns:
+        list: Сегменты (Segment) по порядку, покрывающие весь сигнал.
+    """
+    limit = int(max_seconds * sample_rate)
+
+    if len(audio) <= limit:
+        return [Segment(0, len(audio), False)]
+
+    overlap = min(int(overlap_seconds * sample_rate), limit // 2)
+
+    # Кандидаты на разрез - середины пауз между участками речи, с длиной паузы
+    speech = detect_speech(audio, sample_rate)
+    pauses = [
+        ((previous_end + next_start) // 2, next_start - previous_end)
+        for (_, previous_end), (next_start, _) in zip(speech, speech[1:])
+    ] + list(joins or [])
+
+    segments = []
+    start = 0
+    starts_with_overlap = False
+
+    while len(audio) - start > limit:
+        # Разрез не раньше половины сегмента, чтобы не получать коротких кусков
+        candidates = [pause for pause in pauses if start + limit // 2 <= pause[0] <= start + limit]
+
+        if candidates:
+            cut = max(candidates, key=lambda pause: pause[1])[0]
+            segments.append(Segment(start, cut, starts_with_overlap))
+            start, starts_with_overlap = cut, False
+        else:
+            cut = start + limit
+            segments.append(Segment(start, cut, starts_with_overlap))
+            start, starts_with_overlap = cut - overlap, overlap > 0
+
+    segments.append(Segment(start, len(audio), starts_with_overlap))
+
+    return segments
+
+def _normalize(word):
+    return re.sub(r"\W+", "", word.lower())
+
+def merge_transcripts(texts, segments):
+    """
+    Склеивает тексты сегментов по порядку. На стыках с перекрытием
+    удаляется самый длинный повтор: конец предыдущего текста, совпадающий
+    с началом следующего (сравнение слов без регистра и пунктуации).
+
+    Args:
+        texts (list): Тексты сегментов.
+        segments (list): Сегменты (Segment) в том же порядке.
+
+    Returns:
+        str: Полный текст.
+    """
+    words = []
+
+    for text, segment in zip(texts, segments):
+        current = (text or "").split()
+
+        if segment.overlap and words:
+            tail = [_normalize(word) for word in words[-MAX_OVERLAP_WORDS:]]
+            head = [_normalize(word) for word in current[:MAX_OVERLAP_WORDS]]
+
+            for size in range(min(len(tail), len(head)), 0, -1):
+                if tail[-size:] == head[:size]:
+                    current = current[size:]
+                    break
+
+        words.extend(current)
+
+    return " ".join(words)
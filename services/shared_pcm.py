@@ -0,0 +1,168 @@
+"""
+Передача PCM в процессы распознавания через разделяемую память.
+
+Аргументы задач пула передаются в процессы через pickle: сигнал
+копируется при сериализации, при записи в канал и при чтении из него
+(4 байта x 16000 x секунды - около 58 МБ на час записи за каждую копию).
+SharedPCM копирует сигнал один раз в сегмент multiprocessing.shared_memory,
+а в задачу передается только ссылка (PCMRef: имя сегмента и границы
+участка). Процесс подключается к сегменту и передает движку массив NumPy
+поверх общей памяти, без копирования. Сегменты параллельно распознаваемых
+частей одной записи ссылаются на один и тот же сегмент.
+
+Сегмент принадлежит создавшему его процессу и удаляется release() (или при
+выходе из with), когда задачи завершены или отменены; удаление сегмента,
+к которому еще подключен процесс, безопасно - память освобождается после
+его отключения.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+import numpy as np
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_active = 0
+
+def _track(delta):
+    """
+    Учитывает количество существующих сегментов (метрика shared_pcm_segments).
+    """
+    global _active
+
+    with _lock:
+        _active += delta
+        metrics.set_gauge("shared_pcm_segments", _active)
+
+class PCMRef:
+    """
+    Ссылка на участок сигнала в разделяемой памяти; передается в процесс вместо массива.
+    """
+
+    __slots__ = ("name", "start", "end")
+
+    def __init__(self, name, start, end):
+        """
+        Args:
+            name (str): Имя сегмента разделяемой памяти.
+            start (int): Начало участка в отсчетах.
+            end (int): Конец участка в отсчетах.
+        """
+        self.name = name
+        self.start = start
+        self.end = end
+
+    def __getstate__(self):
+        return (self.name, self.start, self.end)
+
+    def __setstate__(self, state):
+        self.name, self.start, self.end = state
+
+    def __len__(self):
+        return self.end - self.start
+
+class SharedPCM:
+    """
+    Сигнал float32 в сегменте разделяемой памяти.
+    """
+
+    def __init__(self, audio):
+        """
+        Создает сегмент и копирует в него сигнал.
+
+        Args:
+            audio (numpy.ndarray): Моно-сигнал.
+        """
+        audio = np.asarray(audio, dtype=np.float32)
+
+        # Сегмент нулевого размера создать нельзя
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, audio.nbytes))
+        _track(1)
+
+        self.length = len(audio)
+        np.ndarray(self.length, dtype=np.float32, buffer=self._shm.buf)[:] = audio
+
+        metrics.increment("shared_pcm_bytes_total", audio.nbytes)
+
+    @property
+    def name(self):
+        """
+        Имя сегмента.
+        """
+        return self._shm.name
+
+    def ref(self, start=0, end=None):
+        """
+        Возвращает ссылку на участок сигнала.
+
+        Args:
+            start (int): Начало участка в отсчетах.
+            end (int): Конец участка в отсчетах (по умолчанию - конец сигнала).
+
+        Returns:
+            PCMRef: Ссылка для передачи в процесс.
+        """
+        return PCMRef(self._shm.name, start, self.length if end is None else end)
+
+    def release(self):
+        """
+        Закрывает и удаляет сегмент. Повторный вызов ничего не делает.
+        """
+        if self._shm is None:
+            return
+
+        shm, self._shm = self._shm, None
+
+        try:
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+        finally:
+            _track(-1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+@contextmanager
+def resolve_refs(args):
+    """
+    Подключается к сегментам ссылок PCMRef в аргументах задачи и подставляет
+    вместо них массивы поверх общей памяти. Вызывается в процессе распознавания.
+
+    Args:
+        args (tuple): Аргументы задачи.
+
+    Yields:
+        list: Аргументы, в которых ссылки заменены массивами NumPy.
+    """
+    segments = []
+    resolved = []
+
+    try:
+        for arg in args:
+            if not isinstance(arg, PCMRef):
+                resolved.append(arg)
+                continue
+
+            shm = shared_memory.SharedMemory(name=arg.name)
+            segments.append(shm)
+            resolved.append(np.ndarray(len(arg), dtype=np.float32, buffer=shm.buf, offset=arg.start * 4))
+
+        yield resolved
+    finally:
+        # Массивы поверх сегмента должны быть освобождены до его закрытия
+        resolved.clear()
+
+        for shm in segments:
+            try:
+                shm.close()
+            except BufferError:
+                # Движок сохранил ссылку на массив: сегмент отключится при ее освобождении
+                logger.warning(f"Сегмент {shm.name} еще используется и не закрыт")
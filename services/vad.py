@@ -0,0 +1,174 @@
+"""
+Обнаружение речи (VAD) по энергии и частоте переходов через ноль.
+
+Время распознавания Whisper растет с длительностью аудио, а в записях
+встреч много пауз. Перед распознаванием из сигнала вырезаются тишина в начале
+и в конце и длинные паузы внутри; короткие паузы остаются, чтобы не сливать
+фразы. Карта времени (TimestampMap) переводит время в сокращенном
+сигнале во время исходной записи и отмечает места склейки, где была
+вырезана пауза: по ним в первую очередь режется запись на сегменты
+(services.segmentation).
+
+Кадр считается речью по двум порогам (гистерезис): участок речи начинается
+с кадра выше верхнего порога энергии и продолжается, пока энергия выше
+нижнего порога. Глухие согласные (с, ш, ф) тихие, но часто пересекают ноль,
+поэтому кадр с высокой частотой переходов через ноль тоже продолжает речь.
+Пороги отсчитываются от уровня шума записи. Все вычисления векторные.
+"""
+import bisect
+import numpy as np
+
+# Длительность кадра анализа (в секундах)
+FRAME_SECONDS = 0.03
+# Верхний и нижний пороги энергии над уровнем шума (дБ)
+HIGH_THRESHOLD_DB = 12.0
+LOW_THRESHOLD_DB = 6.0
+# Доля переходов через ноль в кадре, характерная для глухих согласных,
+# и минимальное превышение шума для таких кадров (дБ)
+ZCR_THRESHOLD = 0.25
+ZCR_MIN_DB = 3.0
+# Уровень шума - перцентиль энергии кадров; запись тише этого уровня (дБ) считается тишиной
+NOISE_PERCENTILE = 5
+SILENCE_DB = -60.0
+
+class TimestampMap:
+    """
+    Соответствие времени в сокращенном сигнале и в исходной записи.
+    """
+
+    def __init__(self, spans, sample_rate):
+        """
+        Инициализация карты.
+
+        Args:
+            spans (list): Сохраненные участки: (начало в сокращенном сигнале,
+                начало в исходном сигнале, длина) в отсчетах.
+            sample_rate (int): Частота дискретизации.
+        """
+        self.spans = spans
+        self.sample_rate = sample_rate
+        self._starts = [span[0] for span in spans]
+
+    def to_original(self, seconds):
+        """
+        Переводит время в сокращенном сигнале во время исходной записи.
+
+        Args:
+            seconds (float): Время в сокращенном сигнале.
+
+        Returns:
+            float: Время в исходной записи.
+        """
+        if not self.spans:
+            return seconds
+
+        sample = seconds * self.sample_rate
+        index = max(0, bisect.bisect_right(self._starts, sample) - 1)
+        kept_start, original_start, length = self.spans[index]
+
+        return (original_start + min(sample - kept_start, length)) / self.sample_rate
+
+    def joins(self):
+        """
+        Возвращает места склейки участков, между которыми вырезана пауза.
+
+        Returns:
+            list: Пары (позиция в сокращенном сигнале, длина вырезанной паузы) в отсчетах.
+        """
+        return [
+            (kept_start, original_start - previous_start - previous_length)
+            for (_, previous_start, previous_length), (kept_start, original_start, _) in zip(self.spans, self.spans[1:])
+        ]
+
+def frame_features(audio, sample_rate):
+    """
+    Вычисляет энергию (дБ) и долю переходов через ноль для кадров сигнала.
+
+    Returns:
+        tuple: (энергия кадров, доля переходов через ноль, длина кадра в отсчетах).
+    """
+    frame = max(1, int(sample_rate * FRAME_SECONDS))
+    count = len(audio) // frame
+    frames = audio[:count * frame].reshape(count, frame)
+
+    energy = 10 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-12)
+    crossings = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+
+    return energy, crossings, frame
+
+def detect_speech(audio, sample_rate):
+    """
+    Находит участки речи.
+
+    Args:
+        audio (numpy.ndarray): Моно-сигнал float32.
+        sample_rate (int): Частота дискретизации.
+
+    Returns:
+        list: Участки речи (начало, конец) в отсчетах, по возрастанию.
+    """
+    energy, crossings, frame = frame_features(audio, sample_rate)
+
+    if not len(energy):
+        return []
+
+    noise = max(np.percentile(energy, NOISE_PERCENTILE), SILENCE_DB)
+    strong = energy > noise + HIGH_THRESHOLD_DB
+    weak = strong | (energy > noise + LOW_THRESHOLD_DB) | ((crossings > ZCR_THRESHOLD) & (energy > noise + ZCR_MIN_DB))
+
+    # Непрерывные серии слабых кадров; речью считаются серии, содержащие сильный кадр
+    edges = np.diff(np.concatenate(([0], weak.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    if not len(starts):
+        return []
+
+    strong_counts = np.add.reduceat(strong.astype(np.int32), starts)
+    # reduceat суммирует до следующего начала серии; кадры между сериями слабые, а значит, не сильные
+    keep = strong_counts > 0
+
+    return [(int(start) * frame, int(end) * frame) for start, end in zip(starts[keep], ends[keep])]
+
+def trim_silence(audio, sample_rate, max_pause, padding):
+    """
+    Вырезает тишину в начале и в конце и паузы длиннее max_pause.
+
+    Args:
+        audio (numpy.ndarray): Моно-сигнал float32.
+        sample_rate (int): Частота дискретизации.
+        max_pause (float): Паузы короче этого значения (в секундах) сохраняются.
+        padding (float): Запас тишины вокруг участков речи (в секундах).
+
+    Returns:
+        tuple: (сокращенный сигнал, TimestampMap). Если речь не найдена,
+            возвращается исходный сигнал: тихую запись лучше распознать целиком,
+            чем потерять.
+    """
+    speech = detect_speech(audio, sample_rate)
+
+    if not speech:
+        return audio, TimestampMap([(0, 0, len(audio))], sample_rate)
+
+    pad = int(padding * sample_rate)
+    gap = int(max_pause * sample_rate)
+
+    # Расширяем участки на запас и объединяем разделенные короткими паузами
+    regions = []
+    for start, end in speech:
+        start, end = max(0, start - pad), min(len(audio), end + pad)
+
+        if regions and start - regions[-1][1] < gap:
+            regions[-1][1] = max(regions[-1][1], end)
+        else:
+            regions.append([start, end])
+
+    spans = []
+    kept = 0
+    for start, end in regions:
+        spans.append((kept, start, end - start))
+        kept += end - start
+
+    trimmed = np.concatenate([audio[start:end] for start, end in regions])
+
+    return trimmed, TimestampMap(spans, sample_rate)
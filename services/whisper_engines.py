@@ -0,0 +1,182 @@
+"""
+Движки распознавания речи для процессов пула Whisper.
+
+Движок загружает модель один раз при создании и затем распознает
+аудио синхронно. Создается внутри процесса-обработчика пула, поэтому
+тяжелые зависимости (whisper, torch, ctranslate2) импортируются только там.
+
+Без GPU рекомендуется движок "faster-whisper": CTranslate2 с квантованием
+весов в int8 в несколько раз быстрее эталонной реализации на CPU
+при сопоставимом качестве (сравнение - benchmarks/bench_whisper.py).
+"""
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class WhisperEngine:
+    """
+    Базовый класс движка распознавания речи.
+    """
+
+    # Имя движка в Config.WHISPER_ENGINE
+    name = None
+    # Можно ли порождать процессы через fork после загрузки модели (общие веса, см. WhisperPool)
+    fork_safe = False
+
+    def __init__(self, model, language=None, beam_size=5, threads=0, compute_type="int8"):
+        """
+        Инициализация движка.
+
+        Args:
+            model (str): Имя модели (tiny, base, small, medium, large).
+            language (str): Язык речи (например, "ru"); None - автоопределение.
+            beam_size (int): Ширина лучевого поиска (1 - жадное декодирование, быстрее).
+            threads (int): Потоков вычислений на процесс (0 - по умолчанию библиотеки).
+            compute_type (str): Тип вычислений квантованных движков (int8, int8_float32, float32).
+        """
+        self.model_name = model
+        self.language = language
+        self.beam_size = beam_size
+        self.threads = threads
+        self.compute_type = compute_type
+        self.version = "0"
+
+    def transcribe(self, audio):
+        """
+        Распознает речь.
+
+        Args:
+            audio (str | numpy.ndarray): Путь к аудиофайлу или моно-сигнал float32, 16 кГц.
+
+        Returns:
+            str: Распознанный текст.
+        """
+        raise NotImplementedError
+
+    def after_fork(self):
+        """
+        Вызывается в процессе, порожденном через fork из процесса с загруженной моделью.
+        """
+
+class OpenAIWhisperEngine(WhisperEngine):
+    """
+    Эталонная реализация openai-whisper (PyTorch).
+    """
+
+    name = "whisper"
+    # Веса PyTorch - отдельные буферы, которые после загрузки только читаются;
+    # пул потоков вычислений создается при первом вычислении, то есть уже в обработчике
+    fork_safe = True
+
+    def __init__(self, model, **options):
+        super().__init__(model, **options)
+
+        import torch
+        import whisper
+
+        if self.threads:
+            torch.set_num_threads(self.threads)
+
+        # Эталонная реализация на CPU считает в float32, compute_type не используется
+        self.version = f"openai-whisper-{whisper.__version__}"
+        self._model = whisper.load_model(model, device="cpu")
+
+    def transcribe(self, audio):
+        # fp16 на CPU не поддерживается
+        result = self._model.transcribe(audio, language=self.language, beam_size=self.beam_size, fp16=False)
+        return result["text"].strip()
+
+    def after_fork(self):
+        import torch
+
+        if self.threads:
+            torch.set_num_threads(self.threads)
+
+class FasterWhisperEngine(WhisperEngine):
+    """
+    faster-whisper: модель Whisper в CTranslate2 с квантованием (int8 на CPU).
+    """
+
+    name = "faster-whisper"
+    # CTranslate2 создает потоки вычислений при загрузке модели, а после fork
+    # в процессе остается только один поток: каждый обработчик загружает модель сам
+    fork_safe = False
+
+    def __init__(self, model, **options):
+        super().__init__(model, **options)
+
+        import faster_whisper
+
+        self.version = f"faster-whisper-{faster_whisper.__version__}-{self.compute_type}"
+        self._model = faster_whisper.WhisperModel(
+            model,
+            device="cpu",
+            compute_type=self.compute_type,
+            cpu_threads=self.threads
+        )
+
+    def transcribe(self, audio):
+        # Сегменты возвращаются генератором: распознавание выполняется при переборе
+        segments, _ = self._model.transcribe(audio, language=self.language, beam_size=self.beam_size)
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+class FakeEngine(WhisperEngine):
+    """
+    Детерминированный движок без модели для тестов и нагрузочных проверок.
+    """
+
+    name = "fake"
+    fork_safe = True
+
+    TEXT = "Вопрос первый. 3D-визуализация спальни. Вопрос второй. Подбор мебели в детскую."
+
+    def __init__(self, model, delay=0.0, rtf=0.0, weights_mb=0, **options):
+        """
+        Args:
+            delay (float): Имитация длительности распознавания (в секундах).
+            rtf (float): Имитация нагрузки на CPU: занимает ядро на rtf секунд
+                на каждую секунду сигнала (для бенчмарков параллельности).
+            weights_mb (int): Имитация весов модели: заполненный буфер такого размера
+                (для бенчмарков памяти).
+        """
+        super().__init__(model, **options)
+        self.version = "fake-1"
+        self.delay = delay
+        self.rtf = rtf
+        # bytearray, а не bytes(n): страницы действительно заполняются и занимают память
+        self._weights = bytearray(b"\x01" * (int(weights_mb) * 1024 * 1024))
+
+    def transcribe(self, audio):
+        if self.delay:
+            time.sleep(self.delay)
+        if self.rtf and not isinstance(audio, str):
+            # Активное ожидание по процессорному времени, а не sleep: процесс занимает ядро,
+            # как настоящая модель, и при нехватке ядер работает дольше
+            deadline = time.process_time() + self.rtf * len(audio) / 16000
+            while time.process_time() < deadline:
+                pass
+        return self.TEXT
+
+ENGINES = {engine.name: engine for engine in (OpenAIWhisperEngine, FasterWhisperEngine, FakeEngine)}
+
+def create_engine(name, model, **options):
+    """
+    Создает движок распознавания по имени.
+
+    Args:
+        name (str): Имя движка (см. ENGINES).
+        model (str): Имя модели.
+        **options: Параметры движка.
+
+    Returns:
+        WhisperEngine: Движок с загруженной моделью.
+    """
+    if name not in ENGINES:
+        raise ValueError(f"Неизвестный движок распознавания: {name}, допустимы: {', '.join(ENGINES)}")
+
+    started = time.monotonic()
+    engine = ENGINES[name](model, **options)
+    logger.info(f"Загружена модель {model} ({name}) за {time.monotonic() - started:.1f} с")
+
+    return engine
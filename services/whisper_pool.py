@@ -0,0 +1,694 @@
+"""
+Пул процессов распознавания речи.
+
+Распознавание Whisper нагружает процессор и держит GIL, поэтому выполняется
+не в цикле событий и не в потоках, а в отдельных процессах. Каждый процесс
+загружает модель один раз и обрабатывает задачи, пока не выполнит
+max_jobs_per_worker задач: после этого он заменяется новым (защита от
+утечек памяти в модели). Задача, превысившая job_timeout, или отмененная
+задача завершает свой процесс, и на его место запускается новый.
+
+Процессы управляются напрямую (процесс + канал), а не через
+ProcessPoolExecutor: так зависший процесс можно завершить, не останавливая
+остальные.
+
+При share_model модель загружается один раз в процессе-шаблоне (Zygote),
+а обработчики порождаются из него через fork: страницы с весами модели
+общие для всех процессов (copy-on-write), и память растет с размером пула
+только на рабочие буферы. Замена процесса после сбоя при этом не требует
+повторной загрузки модели.
+"""
+import os
+import time
+import queue
+import signal
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from services.shared_pcm import resolve_refs
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class TranscriptionError(Exception):
+    """
+    Исключение при ошибке распознавания или аварийном завершении процесса.
+    """
+
+def _serve_jobs(conn, engine):
+    """
+    Сообщает о готовности и выполняет задачи из канала до команды завершения.
+
+    Args:
+        conn: Канал (multiprocessing.Connection) для задач и результатов.
+        engine (WhisperEngine): Движок с загруженной моделью.
+    """
+    conn.send(("ready", engine.version))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+
+        # None - команда на завершение
+        if job is None:
+            break
+
+        method, args = job
+
+        try:
+            # Сигналы из разделяемой памяти (services.shared_pcm) передаются движку без копирования
+            with resolve_refs(args) as resolved:
+                result = getattr(engine, method)(*resolved)
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+def _worker_main(conn, engine_name, model, options):
+    """
+    Цикл процесса-обработчика: загружает модель и выполняет задачи из канала.
+
+    Args:
+        conn: Канал (multiprocessing.Connection) для задач и результатов.
+        engine_name (str): Имя движка распознавания.
+        model (str): Имя модели.
+        options (dict): Параметры движка.
+    """
+    from services.whisper_engines import create_engine
+
+    try:
+        engine = create_engine(engine_name, model, **options)
+    except Exception as e:
+        conn.send(("error", f"Ошибка загрузки модели: {type(e).__name__}: {e}"))
+        return
+
+    _serve_jobs(conn, engine)
+
+def _zygote_main(conn, engine_name, model, options):
+    """
+    Цикл процесса-шаблона: загружает модель и по команде порождает
+    обработчики через fork. Канал обработчика передается дескриптором.
+
+    Args:
+        conn: Управляющий канал с пулом.
+        engine_name (str): Имя движка распознавания.
+        model (str): Имя модели.
+        options (dict): Параметры движка.
+    """
+    import gc
+    from multiprocessing import reduction
+    from multiprocessing.connection import Connection
+    from services.whisper_engines import create_engine
+
+    try:
+        engine = create_engine(engine_name, model, **options)
+    except Exception as e:
+        conn.send(("error", f"Ошибка загрузки модели: {type(e).__name__}: {e}"))
+        return
+
+    # Завершенные обработчики удаляются ядром сразу, без зомби
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    # Объекты модели переносятся в постоянное поколение: сборщик мусора в обработчиках
+    # не пишет в их страницы, и они остаются общими
+    gc.freeze()
+
+    conn.send(("ready", engine.version))
+
+    while True:
+        try:
+            command = conn.recv()
+        except EOFError:
+            break
+
+        if command is None:
+            break
+
+        fd = reduction.recv_handle(conn)
+        pid = os.fork()
+
+        if pid == 0:
+            conn.close()
+            try:
+                engine.after_fork()
+                _serve_jobs(Connection(fd), engine)
+            finally:
+                # Без обработчиков atexit и финализаторов multiprocessing шаблона
+                os._exit(0)
+
+        os.close(fd)
+        conn.send(pid)
+
+def process_memory(pid):
+    """
+    Возвращает память процесса по /proc/<pid>/smaps_rollup (Linux).
+    PSS делит каждую общую страницу между использующими ее процессами,
+    поэтому сумма PSS по процессам - их реальный общий расход памяти.
+
+    Args:
+        pid (int): Идентификатор процесса.
+
+    Returns:
+        dict: {"rss": байт, "pss": байт} или None, если данные недоступны.
+    """
+    usage = {}
+
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                # Значения указаны в килобайтах: "Pss:  123456 kB"
+                name, _, value = line.partition(":")
+                if name in ("Rss", "Pss"):
+                    usage[name.lower()] = int(value.split()[0]) * 1024
+    except OSError:
+        return None
+
+    return usage or None
+
+class ForkedProcess:
+    """
+    Обработчик, порожденный процессом-шаблоном. Он не является дочерним
+    процессом пула, поэтому управляется по pid сигналами.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def is_alive(self):
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def join(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while self.is_alive():
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            time.sleep(0.02)
+
+class Zygote:
+    """
+    Процесс-шаблон с загруженной моделью и канал управления им.
+    """
+
+    def __init__(self, context, engine_name, model, options):
+        """
+        Запускает процесс-шаблон. Модель загружается асинхронно,
+        готовность проверяет wait_ready().
+        """
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_zygote_main,
+            args=(child_conn, engine_name, model, options),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+        self.engine_version = None
+
+    def wait_ready(self, timeout):
+        """
+        Дожидается загрузки модели.
+
+        Args:
+            timeout (float): Максимальное время ожидания (в секундах).
+        """
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"Модель не загрузилась за {timeout} с")
+
+        try:
+            status, value = self.conn.recv()
+        except (EOFError, OSError):
+            raise TranscriptionError("Процесс-шаблон завершился аварийно при загрузке модели")
+
+        if status != "ready":
+            raise TranscriptionError(value)
+
+        self.engine_version = value
+
+    def fork(self, worker_conn, timeout=10):
+        """
+        Порождает обработчик, связанный с пулом каналом worker_conn.
+
+        Returns:
+            ForkedProcess: Порожденный процесс.
+        """
+        from multiprocessing import reduction
+
+        try:
+            self.conn.send("fork")
+            reduction.send_handle(self.conn, worker_conn.fileno(), self.process.pid)
+
+            if not self.conn.poll(timeout):
+                raise TimeoutError(f"Процесс-шаблон не ответил за {timeout} с")
+
+            return ForkedProcess(self.conn.recv())
+        except (EOFError, OSError):
+            raise TranscriptionError("Процесс-шаблон завершился аварийно")
+
+    def stop(self, timeout=5):
+        """
+        Завершает процесс-шаблон. Порожденные обработчики продолжают работать.
+        """
+        if self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+
+            self.process.join(timeout)
+
+        if self.process.is_alive():
+            self.process.kill()
+
+        self.process.join()
+        self.conn.close()
+
+class WorkerProcess:
+    """
+    Процесс-обработчик пула и канал связи с ним.
+    """
+
+    def __init__(self, context, engine_name, model, options, generation, zygote=None):
+        """
+        Запускает процесс. Модель загружается в процессе асинхронно,
+        готовность проверяет wait_ready().
+
+        Args:
+            context: Контекст multiprocessing (spawn, fork, forkserver).
+            engine_name (str): Имя движка распознавания.
+            model (str): Имя модели.
+            options (dict): Параметры движка.
+            generation (int): Поколение пула (увеличивается при каждой остановке).
+            zygote (Zygote): Процесс-шаблон с загруженной моделью; если задан,
+                процесс порождается из него, а не загружает модель сам.
+        """
+        self.conn, child_conn = context.Pipe()
+
+        try:
+            if zygote is not None:
+                self.process = zygote.fork(child_conn)
+            else:
+                self.process = context.Process(
+                    target=_worker_main,
+                    args=(child_conn, engine_name, model, options),
+                    daemon=True
+                )
+                self.process.start()
+        except Exception:
+            self.conn.close()
+            raise
+        finally:
+            child_conn.close()
+
+        self.generation = generation
+        self.jobs = 0
+        self.ready = False
+        # Процесс нельзя использовать повторно (таймаут, отмена, аварийное завершение)
+        self.broken = False
+        self.engine_version = None
+
+    def wait_ready(self, timeout):
+        """
+        Дожидается загрузки модели в процессе.
+
+        Args:
+            timeout (float): Максимальное время ожидания (в секундах).
+        """
+        if self.ready:
+            return
+
+        status, value = self._receive(timeout)
+
+        if status != "ready":
+            self.broken = True
+            raise TranscriptionError(value)
+
+        self.ready = True
+        self.engine_version = value
+
+    def call(self, method, args, timeout):
+        """
+        Выполняет задачу в процессе.
+
+        Args:
+            method (str): Метод движка.
+            args (tuple): Аргументы метода.
+            timeout (float): Максимальное время выполнения (в секундах).
+
+        Returns:
+            Результат метода.
+        """
+        self.conn.send((method, args))
+        self.jobs += 1
+
+        status, value = self._receive(timeout)
+
+        if status == "error":
+            raise TranscriptionError(value)
+
+        return value
+
+    def stop(self, timeout=5):
+        """
+        Завершает процесс: сначала командой, затем принудительно.
+        """
+        if not self.broken and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+
+            self.process.join(timeout)
+
+        self.kill()
+
+    def kill(self):
+        """
+        Принудительно завершает процесс.
+        """
+        self.broken = True
+
+        if self.process.is_alive():
+            self.process.kill()
+
+        self.process.join()
+        self.conn.close()
+
+    def _receive(self, timeout):
+        if not self.conn.poll(timeout):
+            self.broken = True
+            raise TimeoutError(f"Процесс распознавания не ответил за {timeout} с")
+
+        try:
+            return self.conn.recv()
+        except (EOFError, OSError):
+            self.broken = True
+            raise TranscriptionError("Процесс распознавания завершился аварийно")
+
+class PoolJob:
+    """
+    Задача пула; позволяет отменить ее из цикла событий.
+    """
+
+    def __init__(self):
+        self.worker = None
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Отменяет задачу, завершая выполняющий ее процесс.
+        """
+        self.cancelled = True
+
+        if self.worker is not None:
+            # Канал закроет поток задачи, получив конец данных от завершенного процесса
+            self.worker.broken = True
+            self.worker.process.kill()
+
+class WhisperPool:
+    """
+    Класс пула процессов распознавания.
+    """
+
+    def __init__(self, engine, model, size, job_timeout, max_jobs_per_worker,
+                 load_timeout, start_method="spawn", engine_options=None, share_model=False):
+        """
+        Инициализация пула. Процессы запускаются при start() или первой задаче.
+
+        Args:
+            engine (str): Имя движка распознавания.
+            model (str): Имя модели.
+            size (int): Количество процессов.
+            job_timeout (float): Максимальное время задачи (в секундах).
+            max_jobs_per_worker (int): Задач до замены процесса новым (0 - без замены).
+            load_timeout (float): Максимальное время загрузки модели (в секундах).
+            start_method (str): Способ запуска процессов multiprocessing.
+            engine_options (dict): Параметры движка.
+            share_model (bool): Загружать модель один раз в процессе-шаблоне и порождать
+                обработчики через fork (общие страницы весов). Используется, только если
+                движок это допускает (WhisperEngine.fork_safe) и ОС поддерживает fork.
+        """
+        from services.whisper_engines import ENGINES
+
+        self.engine = engine
+        self.model = model
+        self.size = size
+        self.job_timeout = job_timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.load_timeout = load_timeout
+        self.engine_options = engine_options or {}
+        self._context = multiprocessing.get_context(start_method)
+
+        engine_class = ENGINES.get(engine)
+        self.share_model = bool(share_model and hasattr(os, "fork") and engine_class and engine_class.fork_safe)
+        if share_model and not self.share_model:
+            logger.warning(f"Движок {engine} не поддерживает общую модель для процессов: модель загружается в каждом")
+        self._zygote = None
+
+        self._lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._workers = set()
+        self._generation = 0
+        self._started = False
+        # Версия движка из загруженного процесса; сохраняется и после остановки пула
+        self.engine_version = None
+        # Задачи ожидают свободный процесс в собственных потоках, не занимая цикл событий
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="whisper")
+
+    @property
+    def started(self):
+        """
+        Признак запущенного пула.
+        """
+        return self._started
+
+    def start(self):
+        """
+        Запускает процессы и дожидается загрузки модели во всех. Блокирующий вызов.
+        """
+        with self._lock:
+            if self._started:
+                return
+
+            workers = []
+
+            try:
+                if self.share_model:
+                    self._zygote = Zygote(self._context, self.engine, self.model, self.engine_options)
+                    self._zygote.wait_ready(self.load_timeout)
+
+                for _ in range(self.size):
+                    workers.append(self._spawn())
+
+                for worker in workers:
+                    worker.wait_ready(self.load_timeout)
+            except Exception:
+                for worker in workers:
+                    worker.kill()
+                self._workers.clear()
+                self._stop_zygote()
+                metrics.set_gauge("whisper_workers", 0)
+                raise
+
+            for worker in workers:
+                self._idle.put(worker)
+
+            self.engine_version = workers[0].engine_version
+            self._started = True
+
+            logger.info(
+                f"Запущен пул распознавания: {self.size} процессов, модель {self.model} ({self.engine})"
+                f"{', общая для процессов' if self.share_model else ''}"
+            )
+
+    def stop(self):
+        """
+        Останавливает процессы. Выполняемые задачи завершатся, после чего
+        их процессы будут остановлены. Блокирующий вызов.
+        """
+        with self._lock:
+            self._stop_workers()
+
+    def memory_usage(self):
+        """
+        Возвращает память процессов пула (см. process_memory).
+
+        Returns:
+            dict: {"zygote": память процесса-шаблона или None, "workers": [память обработчиков]}.
+        """
+        with self._lock:
+            pids = [worker.process.pid for worker in self._workers]
+            zygote = self._zygote.process.pid if self._zygote is not None else None
+
+        return {
+            "zygote": process_memory(zygote) if zygote else None,
+            "workers": [usage for usage in map(process_memory, pids) if usage],
+        }
+
+    async def start_async(self):
+        """
+        Запускает пул, не блокируя цикл событий.
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self.start)
+
+    async def stop_async(self):
+        """
+        Останавливает пул, не блокируя цикл событий.
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self.stop)
+
+    async def run(self, method, *args):
+        """
+        Выполняет задачу в свободном процессе.
+
+        Args:
+            method (str): Метод движка (например, "transcribe").
+            *args: Аргументы метода (передаются через pickle; длинные сигналы -
+                ссылками PCMRef на разделяемую память).
+
+        Returns:
+            Результат метода.
+
+        Raises:
+            TimeoutError: Если задача превысила job_timeout.
+            TranscriptionError: При ошибке распознавания.
+        """
+        job = PoolJob()
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._run_sync, job, method, args)
+        except asyncio.CancelledError:
+            job.cancel()
+            raise
+
+    def _run_sync(self, job, method, args):
+        """
+        Выполняет задачу в потоке пула: берет свободный процесс и ждет результата.
+        """
+        worker = self._acquire()
+
+        # Задачу отменили, пока она ждала свободный процесс
+        if job.cancelled:
+            self._idle.put(worker)
+            raise asyncio.CancelledError()
+
+        job.worker = worker
+        started = time.monotonic()
+
+        try:
+            worker.wait_ready(self.load_timeout)
+            result = worker.call(method, args, self.job_timeout)
+            metrics.observe("whisper_job_seconds", time.monotonic() - started)
+            return result
+        except TimeoutError:
+            metrics.increment("whisper_timeouts_total")
+            raise
+        finally:
+            metrics.increment("whisper_jobs_total")
+            self._release(worker)
+
+    def _acquire(self):
+        """
+        Дожидается свободного процесса, запуская пул при необходимости.
+        """
+        while True:
+            self.start()
+
+            try:
+                # Ожидание ограничено, чтобы заметить остановку пула
+                return self._idle.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    def _release(self, worker):
+        """
+        Возвращает процесс в пул или заменяет его новым.
+        """
+        recycle = self.max_jobs_per_worker and worker.jobs >= self.max_jobs_per_worker
+
+        with self._lock:
+            if worker.generation != self._generation:
+                # Пул остановлен, пока выполнялась задача
+                worker.stop()
+                return
+
+            if not worker.broken and not recycle:
+                self._idle.put(worker)
+                return
+
+            self._workers.discard(worker)
+
+        if worker.broken:
+            logger.warning(f"Процесс распознавания {worker.process.pid} заменяется после сбоя")
+        else:
+            logger.info(f"Процесс распознавания {worker.process.pid} выполнил {worker.jobs} задач и заменяется")
+
+        metrics.increment("whisper_worker_restarts_total")
+        generation = worker.generation
+        worker.stop()
+
+        with self._lock:
+            # Пул мог быть остановлен, пока завершался процесс
+            if generation == self._generation:
+                try:
+                    self._idle.put(self._spawn())
+                except Exception as e:
+                    # Процесс-шаблон недоступен: пул будет запущен заново следующей задачей
+                    logger.error(f"Не удалось заменить процесс распознавания: {str(e)}")
+                    self._stop_workers()
+
+    def _spawn(self):
+        """
+        Запускает процесс текущего поколения пула. Вызывается под блокировкой.
+        """
+        worker = WorkerProcess(
+            self._context,
+            self.engine,
+            self.model,
+            self.engine_options,
+            self._generation,
+            zygote=self._zygote
+        )
+        self._workers.add(worker)
+        metrics.set_gauge("whisper_workers", len(self._workers))
+        return worker
+
+    def _stop_workers(self):
+        """
+        Останавливает свободные процессы и отвязывает занятые. Вызывается под блокировкой.
+        """
+        self._generation += 1
+        self._started = False
+
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+            worker.stop()
+
+        self._workers.clear()
+        self._stop_zygote()
+        metrics.set_gauge("whisper_workers", 0)
+
+    def _stop_zygote(self):
+        """
+        Останавливает процесс-шаблон. Вызывается под блокировкой.
+        """
+        if self._zygote is not None:
+            self._zygote.stop()
+            self._zygote = None
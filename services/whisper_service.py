@@ -1,27 +1,335 @@
 """
 Сервис для распознавания речи через Whisper.
+
+Распознавание выполняется локально в пуле процессов (services.whisper_pool):
+модель загружается один раз в каждом процессе, а цикл событий только
+ожидает результат. Голосовые сообщения декодируются в PCM в памяти
+(services.audio_decoder) и передаются движку без временных файлов;
+тишина и длинные паузы перед распознаванием вырезаются (services.vad).
+Длинные записи при нескольких процессах пула разбиваются по паузам
+на сегменты, которые распознаются параллельно (services.segmentation).
+Сигнал передается процессам через разделяемую память (services.shared_pcm).
+
+Результаты распознавания голосовых сообщений кэшируются (TranscriptionCache):
+повторно пересланное сообщение или повторная доставка обновления не
+запускают распознавание заново.
+
+После WHISPER_IDLE_UNLOAD_SECONDS простоя процессы пула останавливаются
+и память модели освобождается; первое новое голосовое сообщение запускает
+загрузку в фоне (wake), пока сообщение скачивается и декодируется.
 """
 import os
-import logging
-import aiohttp
 import json
+import time
 import asyncio
-import tempfile
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
 from config.config import Config
+from services.audio_decoder import decode_audio, SAMPLE_RATE
+from services.vad import trim_silence
+from services.segmentation import split_at_silence, merge_transcripts
+from services.whisper_pool import WhisperPool
+from services.shared_pcm import SharedPCM
+from utils.async_io import run_io
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+class TranscriptionCache:
+    """
+    Кэш распознанных текстов: LRU в памяти и ограниченный по размеру
+    каталог на диске (файл на запись, вытесняются давно не использованные).
+    Методы блокирующие, вызываются через run_io.
+    """
+    
+    def __init__(self, directory, memory_entries, disk_bytes):
+        """
+        Инициализация кэша. Каталог читается при первом обращении.
+        
+        Args:
+            directory (str): Каталог записей на диске.
+            memory_entries (int): Количество записей в памяти.
+            disk_bytes (int): Максимальный размер записей на диске (0 - не сохранять на диск).
+        """
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        # Имя файла -> размер, от давно использованных к недавним
+        self._disk = None
+    
+    def get(self, key):
+        """
+        Возвращает текст по ключу.
+        
+        Args:
+            key (str): Ключ записи.
+            
+        Returns:
+            str: Текст или None, если записи нет.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            
+            if not self.disk_bytes:
+                return None
+            
+            self._load_index()
+            name = self._file_name(key)
+            
+            if name not in self._disk:
+                return None
+            
+            path = os.path.join(self.directory, name)
+            
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                os.utime(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Поврежденная запись кэша распознавания {name}: {str(e)}")
+                self._remove(name)
+                return None
+            
+            if entry.get("key") != key:
+                return None
+            
+            self._disk.move_to_end(name)
+            self._remember(key, entry["text"])
+            
+            return entry["text"]
+    
+    def put(self, key, text):
+        """
+        Сохраняет текст в памяти и на диске, вытесняя давно не использованные записи.
+        
+        Args:
+            key (str): Ключ записи.
+            text (str): Распознанный текст.
+        """
+        with self._lock:
+            self._remember(key, text)
+            
+            if not self.disk_bytes:
+                return
+            
+            self._load_index()
+            name = self._file_name(key)
+            path = os.path.join(self.directory, name)
+            
+            # Запись во временный файл и атомарная замена: при сбое не остается обрезанных записей
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"key": key, "text": text}, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+            
+            self._disk[name] = os.path.getsize(path)
+            self._disk.move_to_end(name)
+            
+            total = sum(self._disk.values())
+            while total > self.disk_bytes and len(self._disk) > 1:
+                oldest = next(iter(self._disk))
+                total -= self._disk[oldest]
+                self._remove(oldest)
+    
+    def _remember(self, key, text):
+        """
+        Добавляет запись в LRU в памяти. Вызывается под блокировкой.
+        """
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+    
+    def _load_index(self):
+        """
+        Читает список записей на диске в порядке последнего использования. Вызывается под блокировкой.
+        """
+        if self._disk is not None:
+            return
+        
+        os.makedirs(self.directory, exist_ok=True)
+        
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        
+        self._disk = OrderedDict((name, size) for _, name, size in sorted(entries))
+    
+    def _remove(self, name):
+        """
+        Удаляет запись с диска. Вызывается под блокировкой.
+        """
+        self._disk.pop(name, None)
+        
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+    
+    @staticmethod
+    def _file_name(key):
+        return hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json"
+
 class WhisperService:
     """
-    Класс для работы с Whisper API для распознавания речи.
+    Класс для работы с Whisper для распознавания речи.
     """
     
-    def __init__(self):
+    def __init__(self, engine=None, model=None, pool_size=None, engine_options=None):
+        """
+        Инициализация сервиса Whisper. Процессы пула запускаются при
+        прогреве (warm_up) или первом распознавании.
+        
+        Args:
+            engine (str): Движок распознавания. По умолчанию Config.WHISPER_ENGINE.
+            model (str): Модель. По умолчанию Config.WHISPER_MODEL.
+            pool_size (int): Количество процессов. По умолчанию Config.WHISPER_POOL_SIZE.
+            engine_options (dict): Параметры движка. По умолчанию из Config
+                (WHISPER_LANGUAGE, WHISPER_BEAM_SIZE, WHISPER_THREADS, WHISPER_COMPUTE_TYPE).
+        """
+        self.engine = engine or Config.WHISPER_ENGINE
+        self.model = model or Config.WHISPER_MODEL
+        self.pool = WhisperPool(
+            self.engine,
+            self.model,
+            size=pool_size or Config.WHISPER_POOL_SIZE,
+            job_timeout=Config.WHISPER_JOB_TIMEOUT_SECONDS,
+            max_jobs_per_worker=Config.WHISPER_MAX_JOBS_PER_WORKER,
+            load_timeout=Config.WHISPER_LOAD_TIMEOUT_SECONDS,
+            share_model=Config.WHISPER_SHARE_MODEL,
+            engine_options=engine_options if engine_options is not None else {
+                "language": Config.WHISPER_LANGUAGE,
+                "beam_size": Config.WHISPER_BEAM_SIZE,
+                "threads": Config.WHISPER_THREADS,
+                "compute_type": Config.WHISPER_COMPUTE_TYPE,
+            }
+        )
+        self.cache = None
+        if Config.TRANSCRIPTION_CACHE_ENABLED:
+            self.cache = TranscriptionCache(
+                Config.TRANSCRIPTION_CACHE_DIR,
+                Config.TRANSCRIPTION_CACHE_MEMORY_ENTRIES,
+                int(Config.TRANSCRIPTION_CACHE_DISK_MB * 1024 * 1024)
+            )
+        
+        # Учет простоя для выгрузки модели
+        self._active = 0
+        self._last_used = time.monotonic()
+        self._idle_task = None
+        self._reload_task = None
+        self._unloaded = False
+        self._woke_at = None
+        
+        logger.info(f"Инициализирован сервис Whisper с моделью {self.model} ({self.engine})")
+    
+    async def warm_up(self):
+        """
+        Запускает процессы пула и дожидается загрузки модели.
+        """
+        self._watch_idle()
+        await self.pool.start_async()
+    
+    async def close(self):
+        """
+        Останавливает процессы пула.
+        """
+        for task in (self._idle_task, self._reload_task):
+            if task is not None and not task.done():
+                task.cancel()
+        
+        await self.pool.stop_async()
+    
+    def wake(self):
         """
-        Инициализация сервиса Whisper.
+        Начинает загрузку модели в фоне, если она выгружена после простоя.
+        Вызывается при получении голосового сообщения, до его скачивания.
         """
-        self.model = Config.WHISPER_MODEL
-        logger.info(f"Инициализирован сервис Whisper с моделью {self.model}")
+        self._last_used = time.monotonic()
+        self._watch_idle()
+        
+        if self._unloaded and self._woke_at is None:
+            self._woke_at = time.monotonic()
+            logger.info("Загрузка модели Whisper после простоя")
+        
+        if self.pool.started or (self._reload_task is not None and not self._reload_task.done()):
+            return
+        
+        self._reload_task = asyncio.create_task(self._reload())
+    
+    async def _reload(self):
+        """
+        Запускает процессы пула в фоне.
+        """
+        started = time.monotonic()
+        
+        try:
+            await self.pool.start_async()
+        except Exception as e:
+            # Задача распознавания повторит запуск и получит ошибку сама
+            logger.error(f"Ошибка при загрузке модели Whisper: {str(e)}")
+            return
+        
+        metrics.observe("whisper_reload_seconds", time.monotonic() - started)
+    
+    def _watch_idle(self):
+        """
+        Запускает задачу выгрузки модели при простое, если она еще не запущена.
+        """
+        if Config.WHISPER_IDLE_UNLOAD_SECONDS <= 0:
+            return
+        
+        if self._idle_task is None or self._idle_task.done():
+            self._idle_task = asyncio.create_task(self._unload_when_idle())
+    
+    async def _unload_when_idle(self):
+        """
+        Останавливает процессы пула после Config.WHISPER_IDLE_UNLOAD_SECONDS без распознавания.
+        """
+        idle_limit = Config.WHISPER_IDLE_UNLOAD_SECONDS
+        
+        while True:
+            await asyncio.sleep(min(60, idle_limit / 4))
+            
+            idle = time.monotonic() - self._last_used
+            
+            if self._active or not self.pool.started or idle < idle_limit:
+                continue
+            
+            await self.pool.stop_async()
+            
+            self._unloaded = True
+            metrics.increment("whisper_unloads_total")
+            logger.info(f"Модель Whisper выгружена после {idle:.0f} с простоя")
+    
+    def _begin_job(self):
+        """
+        Отмечает начало распознавания (модель не выгружается, пока оно выполняется).
+        """
+        self.wake()
+        self._active += 1
+    
+    def _end_job(self, text):
+        """
+        Отмечает завершение распознавания. Для первого распознавания после
+        выгрузки модели сохраняет время от пробуждения до результата.
+        """
+        self._active -= 1
+        self._last_used = time.monotonic()
+        
+        if text and self._woke_at is not None:
+            elapsed = time.monotonic() - self._woke_at
+            self._woke_at = None
+            self._unloaded = False
+            metrics.observe("whisper_wake_to_first_transcript_seconds", elapsed)
+            logger.info(f"Первый текст после загрузки модели получен через {elapsed:.1f} с")
     
     async def transcribe_audio(self, audio_file_path):
         """
@@ -39,47 +347,232 @@ class WhisperService:
                 logger.error(f"Аудиофайл не найден: {audio_file_path}")
                 return None
             
-            # Здесь будет код для вызова Whisper API
-            # В реальном проекте здесь будет использоваться локальный Whisper через CLI или API
+            logger.info(f"Распознавание речи из файла: {audio_file_path}")
             
-            # Для демонстрации используем имитацию распознавания
-            logger.info(f"Имитация распознавания речи из файла: {audio_file_path}")
+            text = None
+            self._begin_job()
+            try:
+                text = await self.pool.run("transcribe", audio_file_path)
+            finally:
+                self._end_job(text)
             
-            # Имитация задержки распознавания
-            await asyncio.sleep(2)
-            
-            # Возвращаем пример распознанного текста
-            # В реальном проекте здесь будет результат распознавания Whisper
-            return "Вопрос первый. 3D-визуализация спальни. Вопрос второй. Подбор мебели в детскую."
+            return text
             
         except Exception as e:
             logger.error(f"Ошибка при распознавании речи: {str(e)}")
             return None
     
-    async def transcribe_voice_message(self, voice_file_data):
+    async def get_cached_transcription(self, file_unique_id):
+        """
+        Возвращает сохраненный текст голосового сообщения, не скачивая его.
+        
+        Args:
+            file_unique_id (str): Постоянный идентификатор файла в Telegram.
+            
+        Returns:
+            str: Распознанный текст или None, если его нет в кэше.
+        """
+        key = self._cache_key(f"file:{file_unique_id}")
+        
+        # Кэш выключен или модель еще не загружалась
+        if key is None:
+            return None
+        
+        text = await run_io(self.cache.get, key)
+        
+        if text is not None:
+            metrics.increment("transcription_cache_hits_total")
+            logger.info(f"Текст голосового сообщения {file_unique_id} взят из кэша")
+        
+        return text
+    
+    async def transcribe_voice_message(self, voice_file_data, file_unique_id=None):
         """
-        Распознает речь из голосового сообщения Telegram.
+        Распознает речь из голосового сообщения Telegram. Сообщение
+        декодируется в PCM в памяти, без временных файлов. Результат
+        кэшируется по file_unique_id и по хэшу содержимого: то же аудио,
+        отправленное заново (с другим идентификатором), не распознается повторно.
         
         Args:
             voice_file_data (bytes): Данные голосового сообщения.
+            file_unique_id (str): Постоянный идентификатор файла в Telegram.
             
         Returns:
             str: Распознанный текст или None в случае ошибки.
         """
+        idents = []
+        if self.cache is not None:
+            # Сначала идентификатор файла, затем хэш содержимого (то же аудио в новом сообщении)
+            digest = await run_io(lambda: hashlib.sha256(voice_file_data).hexdigest())
+            idents = ([f"file:{file_unique_id}"] if file_unique_id else []) + [f"sha256:{digest}"]
+            
+            try:
+                for ident in idents:
+                    key = self._cache_key(ident)
+                    text = await run_io(self.cache.get, key) if key else None
+                    if text is not None:
+                        metrics.increment("transcription_cache_hits_total")
+                        logger.info(f"Текст голосового сообщения взят из кэша ({ident.split(':')[0]})")
+                        return text
+            except OSError as e:
+                logger.error(f"Ошибка при чтении кэша распознавания: {str(e)}")
+            
+            metrics.increment("transcription_cache_misses_total")
+        
         try:
-            # Сохраняем голосовое сообщение во временный файл
-            with tempfile.NamedTemporaryFile(suffix='.ogg', delete=False) as temp_file:
-                temp_file.write(voice_file_data)
-                temp_file_path = temp_file.name
+            audio = await decode_audio(voice_file_data, timeout=Config.AUDIO_DECODE_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.error(f"Ошибка при декодировании голосового сообщения: {str(e)}")
+            return None
+        
+        text = await self.transcribe_pcm(audio)
+        
+        if text and idents:
+            # Версия движка известна только после загрузки модели, поэтому ключи вычисляются здесь
+            try:
+                for key in filter(None, map(self._cache_key, idents)):
+                    await run_io(self.cache.put, key, text)
+            except OSError as e:
+                logger.error(f"Ошибка при сохранении текста в кэш распознавания: {str(e)}")
+        
+        return text
+    
+    async def transcribe_pcm(self, audio):
+        """
+        Распознает речь из декодированного сигнала.
+        
+        Args:
+            audio (numpy.ndarray): Моно-сигнал float32, 16 кГц.
             
-            # Распознаем речь из файла
-            transcription = await self.transcribe_audio(temp_file_path)
+        Returns:
+            str: Распознанный текст или None в случае ошибки.
+        """
+        pcm = None
+        text = None
+        timestamps = None
+        self._begin_job()
+        
+        try:
+            if Config.VAD_ENABLED:
+                audio, timestamps = await self._trim_silence(audio)
             
-            # Удаляем временный файл
-            os.unlink(temp_file_path)
+            # Сигнал копируется в разделяемую память один раз; процессы получают ссылки
+            if Config.WHISPER_SHARED_PCM:
+                try:
+                    pcm = await run_io(SharedPCM, audio)
+                except OSError as e:
+                    # Например, переполнен /dev/shm: сигнал передается копией
+                    logger.warning(f"Не удалось разместить сигнал в разделяемой памяти: {str(e)}")
             
-            return transcription
+            if self.pool.size > 1 and len(audio) > Config.WHISPER_SEGMENT_SECONDS * SAMPLE_RATE:
+                text = await self._transcribe_segments(audio, pcm, timestamps)
+            else:
+                text = await self.pool.run("transcribe", pcm.ref() if pcm else audio)
             
+            return text
         except Exception as e:
             logger.error(f"Ошибка при распознавании голосового сообщения: {str(e)}")
             return None
+        finally:
+            # Сегмент удаляется и при отмене распознавания
+            if pcm is not None:
+                pcm.release()
+            self._end_job(text)
+    
+    def _cache_key(self, ident):
+        """
+        Ключ кэша: модель, версия движка (с типом вычислений) и язык входят в ключ,
+        поэтому при их смене старые записи не используются.
+        
+        Args:
+            ident (str): Идентификатор аудио (file_unique_id или хэш содержимого).
+            
+        Returns:
+            str: Ключ или None, если кэш выключен или модель еще не загружалась.
+        """
+        if self.cache is None or self.pool.engine_version is None:
+            return None
+        
+        language = self.pool.engine_options.get("language")
+        return f"{self.engine}:{self.model}:{self.pool.engine_version}:{language}:{ident}"
+    
+    async def _trim_silence(self, audio):
+        """
+        Вырезает тишину и длинные паузы (векторные вычисления NumPy в пуле ввода-вывода).
+        
+        Args:
+            audio (numpy.ndarray): Моно-сигнал float32, 16 кГц.
+            
+        Returns:
+            tuple: (сокращенный сигнал, TimestampMap для пересчета времени в исходную запись).
+        """
+        trimmed, timestamps = await run_io(
+            trim_silence,
+            audio,
+            SAMPLE_RATE,
+            Config.VAD_MAX_PAUSE_SECONDS,
+            Config.VAD_PADDING_SECONDS
+        )
+        
+        saved = (len(audio) - len(trimmed)) / SAMPLE_RATE
+        metrics.observe("vad_seconds_saved", saved)
+        metrics.increment("vad_seconds_saved_total", saved)
+        logger.info(
+            f"VAD: {len(audio) / SAMPLE_RATE:.1f} с -> {len(trimmed) / SAMPLE_RATE:.1f} с "
+            f"(вырезано {saved:.1f} с, участков речи: {len(timestamps.spans)})"
+        )
+        
+        return trimmed, timestamps
+    
+    async def _transcribe_segments(self, audio, pcm=None, timestamps=None):
+        """
+        Распознает длинный сигнал по сегментам параллельно во всех процессах пула.
+        
+        Args:
+            audio (numpy.ndarray): Моно-сигнал float32, 16 кГц.
+            pcm (SharedPCM): Тот же сигнал в разделяемой памяти; если задан,
+                процессам передаются ссылки на его участки.
+            timestamps (TimestampMap): Карта времени сигнала после VAD: места
+                вырезанных пауз - предпочтительные разрезы, а границы сегментов
+                в журнале приводятся ко времени исходной записи.
+            
+        Returns:
+            str: Тексты сегментов, склеенные по порядку.
+        """
+        segments = await run_io(
+            split_at_silence,
+            audio,
+            SAMPLE_RATE,
+            Config.WHISPER_SEGMENT_SECONDS,
+            Config.WHISPER_SEGMENT_OVERLAP_SECONDS,
+            timestamps.joins() if timestamps else None
+        )
+        metrics.observe("whisper_segments", len(segments))
+        logger.info(f"Аудио {len(audio) / SAMPLE_RATE:.1f} с разбито на {len(segments)} сегментов")
+        
+        if timestamps and logger.isEnabledFor(logging.DEBUG):
+            for number, segment in enumerate(segments, 1):
+                logger.debug(
+                    f"Сегмент {number}: {timestamps.to_original(segment.start / SAMPLE_RATE):.1f}-"
+                    f"{timestamps.to_original(segment.end / SAMPLE_RATE):.1f} с исходной записи"
+                )
+        
+        # Без разделяемой памяти срез массива копируется при передаче в процесс
+        tasks = [
+            asyncio.create_task(self.pool.run(
+                "transcribe",
+                pcm.ref(segment.start, segment.end) if pcm else audio[segment.start:segment.end]
+            ))
+            for segment in segments
+        ]
+        
+        try:
+            texts = await asyncio.gather(*tasks)
+        except BaseException:
+            # Ошибка одного сегмента делает результат бесполезным: освобождаем процессы
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        return merge_transcripts(texts, segments)
@@ -1,15 +1,46 @@
 """
 Модуль для тестирования функциональности Telegram-бота.
 """
+import io
 import os
+import json
+import math
+import wave
+import shutil
+import tempfile
+import struct
+import time
 import logging
 import asyncio
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
+from multiprocessing import shared_memory
 from config.config import Config
 from core.session_manager import SessionManager
+from core.session_store import FileSessionStore, SqliteSessionStore
+from core.session_janitor import SessionJanitor
+from core.fsm import ScenarioEngine
+from handlers.scenarios import PROTOCOL_SCENARIO
+from handlers.protocol_handler import ProtocolHandler
+from core.webhook_server import WebhookServer, SECRET_TOKEN_HEADER
+from core.update_scheduler import UpdateScheduler, serialize_update
+from core.outbound import OutboundDispatcher, RateLimitedBot, PRIORITY_LOW
+from core.callback_router import CallbackRouter
+from core.update_dedup import UpdateDeduplicator
+from core.job_queue import JobQueue, JobQueueFull
+from utils.lazy import LazyService
 from core.auth import Auth
-from services.whisper_service import WhisperService
+from core.user_manager import UserManager
+from handlers.admin_handlers import AdminHandlers
+import numpy as np
+from services.whisper_service import WhisperService, TranscriptionCache
+from services.audio_decoder import decode_audio, AudioDecodeError, SAMPLE_RATE
+from services.vad import trim_silence
+from services.segmentation import Segment, split_at_silence, merge_transcripts
+from services.shared_pcm import SharedPCM, resolve_refs
+from services.whisper_engines import FakeEngine
+from services.whisper_pool import WhisperPool
+from utils.metrics import metrics
 from services.ollama_service import OllamaService
 from utils.pdf_generator import PDFGenerator
 from utils.file_manager import FileManager
@@ -107,6 +138,64 @@ class TestSessionManager(unittest.TestCase):
         state = self.session_manager.get_session_state(self.test_user_id)
         self.assertEqual(state, "waiting_protocol_name")
     
+    def test_transition(self):
+        """
+        Тест атомарного перехода состояния с обновлением данных.
+        """
+        # Создаем сессию
+        self.session_manager.create_session(self.test_user_id, initial_state="waiting_protocol_name")
+        
+        # Переход из ожидаемого состояния применяет данные и состояние вместе
+        result = self.session_manager.transition(
+            self.test_user_id,
+            "waiting_date",
+            {"metadata": {"protocol_name": "Test Protocol"}},
+            expected_state="waiting_protocol_name"
+        )
+        self.assertTrue(result)
+        
+        session_data = self.session_manager.get_session_data(self.test_user_id)
+        self.assertEqual(session_data["state"], "waiting_date")
+        self.assertEqual(session_data["metadata"]["protocol_name"], "Test Protocol")
+        
+        # Переход из неожиданного состояния отклоняется без изменений
+        result = self.session_manager.transition(
+            self.test_user_id,
+            "waiting_project_number",
+            {"metadata": {"date": "01.01.2025"}},
+            expected_state="waiting_protocol_name"
+        )
+        self.assertFalse(result)
+        
+        session_data = self.session_manager.get_session_data(self.test_user_id)
+        self.assertEqual(session_data["state"], "waiting_date")
+        self.assertNotIn("date", session_data["metadata"])
+    
+    def test_async_transition(self):
+        """
+        Тест асинхронных вариантов методов менеджера сессий.
+        """
+        async def scenario():
+            await self.session_manager.create_session_async(self.test_user_id, initial_state="waiting_protocol_name")
+            result = await self.session_manager.transition_async(
+                self.test_user_id,
+                "waiting_date",
+                {"metadata": {"protocol_name": "Test Protocol"}},
+                expected_state="waiting_protocol_name"
+            )
+            file_path = await self.session_manager.save_file_async(self.test_user_id, b"voice", "voice_message.ogg")
+            return result, file_path
+        
+        result, file_path = asyncio.run(scenario())
+        
+        self.assertTrue(result)
+        self.assertTrue(os.path.exists(file_path))
+        
+        # Данные сохранены в хранилище, а не только в кэше
+        session_data = self.session_manager.store.load(self.test_user_id)
+        self.assertEqual(session_data["state"], "waiting_date")
+        self.assertEqual(session_data["metadata"]["protocol_name"], "Test Protocol")
+    
     def test_delete_session(self):
         """
         Тест удаления сессии.
@@ -125,16 +214,971 @@ class TestSessionManager(unittest.TestCase):
         
         # Проверяем, что директория удалена
         self.assertFalse(os.path.exists(session_dir))
+    
+    def test_cached_reads_do_not_touch_disk(self):
+        """
+        Тест чтения данных активной сессии из кэша без обращения к диску.
+        """
+        # Создаем сессию
+        self.session_manager.create_session(self.test_user_id)
+        
+        # Чтение состояния и данных не должно открывать файлы
+        with patch("builtins.open", side_effect=AssertionError("обращение к диску")):
+            self.assertEqual(self.session_manager.get_session_state(self.test_user_id), "init")
+            self.assertEqual(self.session_manager.get_session_data(self.test_user_id)["user_id"], self.test_user_id)
+    
+    def test_flush_on_state_change(self):
+        """
+        Тест сброса изменений на диск при смене состояния.
+        """
+        session_manager = SessionManager(flush_interval_ms=60000)
+        session_dir = session_manager.create_session(self.test_user_id)
+        session_file = os.path.join(session_dir, "session.json")
+        
+        def saved():
+            with open(session_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        
+        async def scenario():
+            # Изменение данных без смены состояния ждет отложенного сброса
+            await session_manager.update_session_data_async(self.test_user_id, {"metadata": {"protocol_name": "Test Protocol"}})
+            self.assertEqual(saved()["metadata"], {})
+            
+            # Смена состояния сбрасывает все изменения на диск
+            await session_manager.update_session_data_async(self.test_user_id, {"state": "waiting_date"})
+            return saved()
+        
+        result = asyncio.run(scenario())
+        self.assertEqual(result["metadata"]["protocol_name"], "Test Protocol")
+        self.assertEqual(result["state"], "waiting_date")
+        session_manager.close()
+    
+    def test_data_changes_flushed_in_background(self):
+        """
+        Тест отложенного сброса изменений без смены состояния при политике "state".
+        """
+        session_manager = SessionManager(flush_interval_ms=50)
+        session_dir = session_manager.create_session(self.test_user_id)
+        session_file = os.path.join(session_dir, "session.json")
+        
+        async def scenario():
+            await session_manager.update_session_data_async(self.test_user_id, {"metadata": {"protocol_name": "Test"}})
+            await asyncio.sleep(0.2)
+            
+            with open(session_file, "r", encoding="utf-8") as f:
+                return json.load(f)["metadata"]
+        
+        self.assertEqual(asyncio.run(scenario()), {"protocol_name": "Test"})
+        session_manager.close()
+    
+    def test_data_change_survives_crash(self):
+        """
+        Тест аварийного завершения после изменения данных без смены состояния:
+        изменения не теряются, если процесс завершился после окна сброса
+        (асинхронный вызов) или сразу после синхронного вызова.
+        """
+        store = SqliteSessionStore(os.path.join(self.test_dir, "sessions.db"))
+        session_manager = SessionManager(flush_interval_ms=50, store=store)
+        session_manager.create_session(self.test_user_id)
+        session_manager.create_session(self.test_user_id + 1)
+        
+        async def scenario():
+            await session_manager.update_session_data_async(self.test_user_id, {"metadata": {"protocol_name": "Async"}})
+            await asyncio.sleep(0.2)
+        
+        asyncio.run(scenario())
+        session_manager.update_session_data(self.test_user_id + 1, {"metadata": {"protocol_name": "Sync"}})
+        
+        # Новый менеджер без close() старого - как после аварийного завершения
+        restarted = SessionManager(store=store)
+        self.assertEqual(restarted.get_session_data(self.test_user_id)["metadata"], {"protocol_name": "Async"})
+        self.assertEqual(restarted.get_session_data(self.test_user_id + 1)["metadata"], {"protocol_name": "Sync"})
+        store.close()
+    
+    def test_flush_does_not_overwrite_recreated_session(self):
+        """
+        Тест удаления сессии во время ее асинхронной записи: запись не затирает
+        созданную заново сессию старыми данными.
+        """
+        store = SqliteSessionStore(os.path.join(self.test_dir, "sessions.db"))
+        session_manager = SessionManager(store=store)
+        session_manager.create_session(self.test_user_id)
+        original_save = store.save
+        
+        def slow_save(user_id, session_data):
+            time.sleep(0.1)
+            return original_save(user_id, session_data)
+        
+        async def scenario():
+            await session_manager.update_session_data_async(self.test_user_id, {"metadata": {"protocol_name": "Old"}})
+            with patch.object(store, "save", side_effect=slow_save):
+                flush = asyncio.create_task(session_manager.flush_async(self.test_user_id))
+                await asyncio.sleep(0.01)
+                await session_manager.create_session_async(self.test_user_id, initial_state="new")
+                await flush
+        
+        asyncio.run(scenario())
+        
+        saved = store.load(self.test_user_id)
+        self.assertEqual((saved["state"], saved["metadata"]), ("new", {}))
+        session_manager.close()
+    
+    def test_failed_save_keeps_previous_file(self):
+        """
+        Тест атомарной записи: сбой при записи не портит сохраненный session.json.
+        """
+        store = FileSessionStore(self.test_dir)
+        store.create(self.test_user_id, {"state": "init"})
+        session_file = os.path.join(self.test_dir, f"user_id={self.test_user_id}", "session.json")
+        
+        with patch("json.dump", side_effect=OSError("нет места на диске")):
+            self.assertFalse(store.save(self.test_user_id, {"state": "waiting_date"}))
+        
+        self.assertEqual(store.load(self.test_user_id), {"state": "init"})
+        self.assertEqual(os.listdir(os.path.dirname(session_file)), ["session.json"])
+    
+    def test_flush_on_shutdown(self):
+        """
+        Тест отложенного сброса изменений при политике "shutdown".
+        """
+        session_manager = SessionManager(flush_policy=SessionManager.FLUSH_ON_SHUTDOWN)
+        session_dir = session_manager.create_session(self.test_user_id)
+        session_file = os.path.join(session_dir, "session.json")
+        
+        session_manager.update_session_state(self.test_user_id, "waiting_date")
+        with open(session_file, "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["state"], "init")
+        
+        # При остановке все изменения сохраняются
+        session_manager.close()
+        with open(session_file, "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["state"], "waiting_date")
+
+class TestSqliteSessionStore(unittest.TestCase):
+    """
+    Тесты для хранилища сессий SQLite.
+    """
+    
+    def setUp(self):
+        """
+        Подготовка к тестам.
+        """
+        # Создаем временную директорию для тестов
+        self.test_dir = "/tmp/test_sessions_sqlite"
+        os.makedirs(self.test_dir, exist_ok=True)
+        
+        # Подменяем директорию сессий
+        self.original_session_dir = Config.SESSION_BASE_DIR
+        Config.SESSION_BASE_DIR = self.test_dir
+        
+        self.db_path = os.path.join(self.test_dir, "sessions.db")
+        self.store = SqliteSessionStore(self.db_path)
+        self.session_manager = SessionManager(store=self.store)
+        
+        # Тестовый пользователь
+        self.test_user_id = 123456789
+    
+    def tearDown(self):
+        """
+        Очистка после тестов.
+        """
+        self.session_manager.close()
+        
+        # Восстанавливаем оригинальную директорию сессий
+        Config.SESSION_BASE_DIR = self.original_session_dir
+        
+        # Удаляем временную директорию
+        if os.path.exists(self.test_dir):
+            import shutil
+            shutil.rmtree(self.test_dir)
+    
+    def test_session_lifecycle(self):
+        """
+        Тест создания, обновления и удаления сессии в SQLite.
+        """
+        session_dir = self.session_manager.create_session(self.test_user_id, initial_state="waiting_protocol_name")
+        
+        # Директория для файлов не создается, пока в нее ничего не сохраняют
+        self.assertFalse(os.path.exists(session_dir))
+        
+        self.session_manager.transition(
+            self.test_user_id,
+            "waiting_date",
+            {"metadata": {"protocol_name": "Test Protocol"}}
+        )
+        
+        # Данные читаются из базы новым экземпляром хранилища
+        session_data = SqliteSessionStore(self.db_path).load(self.test_user_id)
+        self.assertEqual(session_data["state"], "waiting_date")
+        self.assertEqual(session_data["metadata"]["protocol_name"], "Test Protocol")
+        
+        # Файлы сохраняются на диск, в сессии хранится ссылка
+        file_path = self.session_manager.save_file(self.test_user_id, b"voice", "voice_message.ogg")
+        self.assertTrue(os.path.exists(file_path))
+        self.assertEqual(self.session_manager.get_session_data(self.test_user_id)["files"]["voice_message.ogg"], file_path)
+        
+        # Удаление сессии удаляет строку и файлы
+        self.assertTrue(self.session_manager.delete_session(self.test_user_id))
+        self.assertFalse(self.store.exists(self.test_user_id))
+        self.assertFalse(os.path.exists(session_dir))
+    
+    def test_import_file_sessions(self):
+        """
+        Тест миграции сессий из директорий user_id=* в SQLite.
+        """
+        # Готовим сессию в файловом хранилище
+        file_store = FileSessionStore(self.test_dir)
+        file_store.create(self.test_user_id, {"user_id": self.test_user_id, "metadata": {}, "state": "waiting_date"})
+        voice_path = os.path.join(self.test_dir, f"user_id={self.test_user_id}", "voice_message.ogg")
+        with open(voice_path, "wb") as f:
+            f.write(b"voice")
+        
+        imported = self.store.import_file_sessions(self.test_dir)
+        
+        self.assertEqual(imported, 1)
+        session_data = self.store.load(self.test_user_id)
+        self.assertEqual(session_data["state"], "waiting_date")
+        self.assertEqual(session_data["files"]["voice_message.ogg"], voice_path)
+
+class TestSessionJanitor(unittest.TestCase):
+    """
+    Тесты для фоновой очистки истекших сессий.
+    """
+    
+    def setUp(self):
+        """
+        Подготовка к тестам.
+        """
+        # Создаем временную директорию для тестов
+        self.test_dir = "/tmp/test_sessions_janitor"
+        os.makedirs(self.test_dir, exist_ok=True)
+        
+        # Подменяем директорию сессий
+        self.original_session_dir = Config.SESSION_BASE_DIR
+        Config.SESSION_BASE_DIR = self.test_dir
+        
+        self.session_manager = SessionManager()
+        self.janitor = SessionJanitor(self.session_manager, ttl_seconds=60, interval_seconds=1)
+    
+    def tearDown(self):
+        """
+        Очистка после тестов.
+        """
+        # Восстанавливаем оригинальную директорию сессий
+        Config.SESSION_BASE_DIR = self.original_session_dir
+        
+        # Удаляем временную директорию
+        if os.path.exists(self.test_dir):
+            import shutil
+            shutil.rmtree(self.test_dir)
+    
+    def test_expired_sessions_are_deleted(self):
+        """
+        Тест удаления только неактивных дольше TTL сессий.
+        """
+        self.session_manager.create_session(1)
+        self.session_manager.create_session(2)
+        
+        # Активность второй сессии продлевает ее жизнь
+        with patch("core.session_manager.time.time", return_value=time.time() + 120):
+            self.session_manager.update_session_state(2, "waiting_date")
+        
+        deleted = asyncio.run(self.janitor.run_once(now=time.time() + 90))
+        
+        self.assertEqual(deleted, 1)
+        self.assertEqual(self.session_manager.get_session_state(1), None)
+        self.assertEqual(self.session_manager.get_session_state(2), "waiting_date")
+    
+    def test_activity_index_loaded_from_store(self):
+        """
+        Тест очистки сессий, оставшихся в хранилище после перезапуска.
+        """
+        self.session_manager.create_session(1)
+        
+        # Новый менеджер сессий видит сессию только через хранилище
+        session_manager = SessionManager()
+        self.assertEqual(session_manager.load_activity_index(), 1)
+        
+        janitor = SessionJanitor(session_manager, ttl_seconds=60)
+        deleted = asyncio.run(janitor.run_once(now=time.time() + 90))
+        
+        self.assertEqual(deleted, 1)
+        self.assertFalse(session_manager.store.exists(1))
+
+class TestScenarioEngine(unittest.TestCase):
+    """
+    Тесты для табличного движка сценариев.
+    """
+    
+    def setUp(self):
+        """
+        Подготовка к тестам.
+        """
+        # Создаем временную директорию для тестов
+        self.test_dir = "/tmp/test_sessions_fsm"
+        os.makedirs(self.test_dir, exist_ok=True)
+        
+        # Подменяем директорию сессий
+        self.original_session_dir = Config.SESSION_BASE_DIR
+        Config.SESSION_BASE_DIR = self.test_dir
+        
+        self.session_manager = SessionManager()
+        self.bot = MagicMock()
+        self.bot.send_message = AsyncMock()
+        self.transcribe = AsyncMock(return_value="1. Вопрос")
+        self.generate_pdf = AsyncMock()
+        self.engine = ScenarioEngine(
+            self.bot,
+            self.session_manager,
+            [PROTOCOL_SCENARIO],
+            {"transcribe": self.transcribe, "generate_pdf": self.generate_pdf}
+        )
+    
+    def tearDown(self):
+        """
+        Очистка после тестов.
+        """
+        # Восстанавливаем оригинальную директорию сессий
+        Config.SESSION_BASE_DIR = self.original_session_dir
+        
+        # Удаляем временную директорию
+        if os.path.exists(self.test_dir):
+            import shutil
+            shutil.rmtree(self.test_dir)
+    
+    def _message(self, text=None):
+        message = MagicMock()
+        message.from_user.id = 12345
+        message.chat.id = 12345
+        message.text = text
+        message.voice.file_id = "voice_file_id"
+        message.voice.file_unique_id = "voice_unique_id"
+        return message
+    
+    def _last_reply(self):
+        return self.bot.send_message.call_args[0][1]
+    
+    def test_text_steps_and_validation(self):
+        """
+        Тест ввода текстовых полей с проверкой непустого значения.
+        """
+        async def scenario():
+            await self.engine.start(self._message("/protocol"), "protocol")
+            for text in ["Протокол", "01.01.2025", "42"]:
+                await self.engine.handle_text(self._message(text))
+            await self.engine.handle_text(self._message("   "))
+        
+        asyncio.run(scenario())
+        
+        session_data = self.session_manager.get_session_data(12345)
+        self.assertEqual(session_data["state"], "waiting_contract_year")
+        self.assertEqual(session_data["metadata"]["protocol_name"], "Протокол")
+        self.assertEqual(session_data["metadata"]["project_number"], "42")
+        self.assertEqual(self._last_reply(), "Введите год договора:")
+    
+    def test_voice_confirmation_and_retry(self):
+        """
+        Тест голосового шага, отказа в подтверждении и повторного ввода.
+        """
+        self.session_manager.create_session(12345, initial_state="waiting_questions_voice")
+        
+        async def scenario():
+            await self.engine.handle_voice(self._message())
+            await self.engine.handle_text(self._message("нет"))
+            await self.engine.handle_voice(self._message())
+            await self.engine.handle_text(self._message("Да"))
+        
+        asyncio.run(scenario())
+        
+        self.assertEqual(self.transcribe.await_count, 2)
+        self.assertEqual(self.session_manager.get_session_state(12345), "waiting_decisions_voice")
+        self.assertEqual(self.session_manager.get_session_data(12345)["questions"], "1. Вопрос")
+    
+    def test_action_step_runs_on_enter(self):
+        """
+        Тест запуска действия при входе в состояние генерации PDF.
+        """
+        self.session_manager.create_session(12345, initial_state="waiting_decisions_confirmation")
+        
+        asyncio.run(self.engine.handle_text(self._message("ок")))
+        
+        self.generate_pdf.assert_awaited_once()
+        self.assertEqual(self._last_reply(), "Генерирую итоговый PDF-документ...")
+
+    def test_interrupted_voice_job_is_resumed(self):
+        """
+        Тест возобновления распознавания, прерванного остановкой бота.
+        """
+        self.session_manager.create_session(12345, initial_state="waiting_questions_voice")
+        
+        async def hang(*args):
+            await asyncio.sleep(60)
+        
+        async def interrupted():
+            self.transcribe.side_effect = hang
+            task = asyncio.create_task(self.engine.handle_voice(self._message()))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            await self.session_manager.close_async()
+        
+        asyncio.run(interrupted())
+        
+        # После перезапуска отметка о прерванной обработке найдена в хранилище
+        session_manager = SessionManager()
+        self.assertEqual(session_manager.list_sessions_with("pending_job"), [12345])
+        
+        transcribe = AsyncMock(return_value="1. Вопрос")
+        engine = ScenarioEngine(
+            self.bot,
+            session_manager,
+            [PROTOCOL_SCENARIO],
+            {"transcribe": transcribe, "generate_pdf": self.generate_pdf}
+        )
+        
+        self.assertTrue(asyncio.run(engine.resume(12345)))
+        self.assertEqual(transcribe.call_args[0][0].voice.file_id, "voice_file_id")
+        self.assertEqual(session_manager.get_session_state(12345), "waiting_questions_confirmation")
+        self.assertIsNone(session_manager.get_session_data(12345)["pending_job"])
+    
+    def test_stale_confirm_button_does_not_confirm_next_step(self):
+        """
+        Тест кнопок подтверждения: ответ текстом убирает кнопки, а кнопка
+        старого запроса не подтверждает следующий шаг.
+        """
+        self.bot.send_message = AsyncMock(return_value=MagicMock(message_id=77))
+        self.bot.edit_message_reply_markup = AsyncMock()
+        engine = ScenarioEngine(
+            self.bot,
+            self.session_manager,
+            [PROTOCOL_SCENARIO],
+            {"transcribe": self.transcribe, "generate_pdf": self.generate_pdf},
+            confirm_markup=lambda state: f"markup:{state}"
+        )
+        self.session_manager.create_session(12345, initial_state="waiting_questions_voice")
+        
+        async def scenario():
+            await engine.handle_voice(self._message())
+            self.assertEqual(self.bot.send_message.await_args.kwargs["reply_markup"], "markup:waiting_questions_confirmation")
+            
+            # Подтверждение текстом убирает кнопки под запросом
+            await engine.handle_text(self._message("да"))
+            self.bot.edit_message_reply_markup.assert_awaited_once_with(chat_id=12345, message_id=77, reply_markup=None)
+            
+            await engine.handle_voice(self._message())
+            
+            # Кнопка под запросом вопросов не подтверждает решения
+            stale = await engine.handle_confirmation(self._message(), True, "waiting_questions_confirmation")
+            current = await engine.handle_confirmation(self._message(), True, "waiting_decisions_confirmation")
+            return stale, current
+        
+        self.assertEqual(asyncio.run(scenario()), (False, True))
+        self.generate_pdf.assert_awaited_once()
+        
+        # Состояние шага передается в данных кнопки
+        self.assertEqual(
+            ProtocolHandler._parse_confirm_payload("waiting_decisions_confirmation_yes"),
+            ("waiting_decisions_confirmation", "yes")
+        )
+        with self.assertRaises(ValueError):
+            ProtocolHandler._parse_confirm_payload("yes")
+    
+    def _resume_with_handler(self, session_manager):
+        """
+        Возобновляет обработку через настоящее действие ProtocolHandler._transcribe_voice
+        и возвращает подмененный сервис Whisper.
+        """
+        bot = MagicMock()
+        bot.send_message = AsyncMock()
+        bot.edit_message_text = AsyncMock()
+        bot.get_file = AsyncMock(return_value=MagicMock(file_path="voice.ogg"))
+        bot.download_file = AsyncMock(return_value=b"voice data")
+        
+        whisper_service = MagicMock()
+        whisper_service.get_cached_transcription = AsyncMock(return_value=None)
+        whisper_service.transcribe_voice_message = AsyncMock(return_value="1. Вопрос")
+        ollama_service = MagicMock()
+        ollama_service.format_text = AsyncMock(return_value=None)
+        
+        handler = ProtocolHandler(bot, session_manager)
+        handler.whisper_service = MagicMock(created=True, get_async=AsyncMock(return_value=whisper_service))
+        handler.ollama_service = MagicMock(get_async=AsyncMock(return_value=ollama_service))
+        
+        with patch.object(Config, "ARCHIVE_VOICE_MESSAGES", False):
+            asyncio.run(handler.resume_pending_job(12345))
+        
+        bot.get_file.assert_awaited_once_with("voice_file_id")
+        self.assertEqual(session_manager.get_session_state(12345), "waiting_questions_confirmation")
+        self.assertIsNone(session_manager.get_session_data(12345)["pending_job"])
+        
+        return whisper_service
+    
+    def test_interrupted_voice_job_is_resumed_by_handler(self):
+        """
+        Тест возобновления распознавания настоящим действием обработчика /protocol:
+        идентификатор файла для кэша восстанавливается из отметки.
+        """
+        self.session_manager.create_session(12345, initial_state="waiting_questions_voice")
+        
+        async def hang(*args):
+            await asyncio.sleep(60)
+        
+        async def interrupted():
+            self.transcribe.side_effect = hang
+            task = asyncio.create_task(self.engine.handle_voice(self._message()))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            await self.session_manager.close_async()
+        
+        asyncio.run(interrupted())
+        
+        whisper_service = self._resume_with_handler(SessionManager())
+        
+        whisper_service.get_cached_transcription.assert_awaited_once_with("voice_unique_id")
+        whisper_service.transcribe_voice_message.assert_awaited_once_with(b"voice data", "voice_unique_id")
+    
+    def test_resume_of_checkpoint_without_file_unique_id(self):
+        """
+        Тест возобновления по отметке без file_unique_id (сохраненной до его появления):
+        кэш по идентификатору пропускается, распознавание выполняется.
+        """
+        self.session_manager.create_session(12345, initial_state="waiting_questions_voice")
+        self.session_manager.update_session_data(12345, {
+            "pending_job": {
+                "state": "waiting_questions_voice",
+                "chat_id": 12345,
+                "file_id": "voice_file_id",
+                "started_at": time.time(),
+            }
+        })
+        self.session_manager.close()
+        
+        whisper_service = self._resume_with_handler(SessionManager())
+        
+        whisper_service.get_cached_transcription.assert_not_awaited()
+        whisper_service.transcribe_voice_message.assert_awaited_once_with(b"voice data", None)
+
+class TestWebhookServer(unittest.TestCase):
+    """
+    Тесты для сервера webhook.
+    """
+    
+    def test_secret_token_verification(self):
+        """
+        Тест приема обновлений только с верным секретным токеном.
+        """
+        from aiohttp.test_utils import TestClient, TestServer
+        
+        bot = MagicMock()
+        bot.process_new_updates = AsyncMock()
+        server = WebhookServer(bot, path="/webhook", secret_token="secret")
+        update = {"update_id": 1}
+        
+        async def scenario():
+            async with TestClient(TestServer(server.create_app())) as client:
+                rejected = await client.post("/webhook", json=update, headers={SECRET_TOKEN_HEADER: "wrong"})
+                non_ascii = await client.post("/webhook", json=update, headers={SECRET_TOKEN_HEADER: "секрет"})
+                accepted = await client.post("/webhook", json=update, headers={SECRET_TOKEN_HEADER: "secret"})
+                await server.stop()
+                return rejected.status, non_ascii.status, accepted.status
+        
+        self.assertEqual(asyncio.run(scenario()), (403, 403, 200))
+        bot.process_new_updates.assert_awaited_once()
+        self.assertEqual(bot.process_new_updates.call_args[0][0][0].update_id, 1)
+
+class TestUpdateScheduler(unittest.TestCase):
+    """
+    Тесты для планировщика обработки обновлений.
+    """
+    
+    @staticmethod
+    def _update(update_id, user_id, text):
+        from telebot import types
+        return types.Update.de_json({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+                "text": text,
+            },
+        })
+    
+    def test_per_user_order_and_cross_user_concurrency(self):
+        """
+        Тест порядка обработки для пользователя и параллельности для разных пользователей.
+        """
+        handled = []
+        
+        async def process(updates):
+            message = updates[0].message
+            # Первое сообщение пользователя 1 обрабатывается долго (как голосовое)
+            if message.text == "slow":
+                await asyncio.sleep(0.2)
+            handled.append((message.from_user.id, message.text))
+        
+        async def scenario():
+            scheduler = UpdateScheduler(process, workers=4)
+            scheduler.start()
+            await scheduler.submit([
+                self._update(1, 1, "slow"),
+                self._update(2, 1, "second"),
+                self._update(3, 2, "other"),
+            ])
+            await scheduler.stop()
+            return scheduler.pending
+        
+        self.assertEqual(asyncio.run(scenario()), 0)
+        self.assertEqual(handled, [(2, "other"), (1, "slow"), (1, "second")])
+    
+    def test_detached_handling_frees_worker(self):
+        """
+        Тест передачи долгой обработки в фон: единственный обработчик свободен
+        для других пользователей, а порядок сообщений пользователя сохраняется.
+        """
+        handled = []
+        
+        async def scenario():
+            slot = asyncio.Event()
+            
+            async def voice(message):
+                # Ожидание слота очереди распознавания
+                await slot.wait()
+                handled.append((message.from_user.id, message.text))
+            
+            async def process(updates):
+                message = updates[0].message
+                if message.text == "voice":
+                    await scheduler.detach(voice(message))
+                else:
+                    handled.append((message.from_user.id, message.text))
+                    # Сообщение другого пользователя обработано, пока голосовое ждет слота
+                    slot.set()
+            
+            scheduler = UpdateScheduler(process, workers=1)
+            scheduler.start()
+            await scheduler.submit([
+                self._update(1, 1, "voice"),
+                self._update(2, 1, "after voice"),
+                self._update(3, 2, "other"),
+            ])
+            await asyncio.wait_for(scheduler.join(), 1)
+            await scheduler.stop()
+        
+        asyncio.run(scenario())
+        
+        self.assertEqual(handled, [(2, "other"), (1, "voice"), (1, "after voice")])
+
+class TestUpdateDeduplicator(unittest.TestCase):
+    """
+    Тесты для отсева повторно доставленных обновлений.
+    """
+    
+    def setUp(self):
+        """
+        Подготовка к тестам.
+        """
+        self.test_dir = "/tmp/test_update_dedup"
+        os.makedirs(self.test_dir, exist_ok=True)
+    
+    def tearDown(self):
+        """
+        Очистка после тестов.
+        """
+        if os.path.exists(self.test_dir):
+            import shutil
+            shutil.rmtree(self.test_dir)
+    
+    def test_redelivered_updates_are_dropped(self):
+        """
+        Тест отсева повторов, в том числе после перезапуска.
+        """
+        update = TestUpdateScheduler._update
+        
+        for store in (FileSessionStore(self.test_dir), SqliteSessionStore(os.path.join(self.test_dir, "sessions.db"))):
+            async def scenario():
+                dedup = UpdateDeduplicator(store, capacity=100, persist=True)
+                first = dedup.filter([update(1, 1, "a"), update(2, 1, "b")])
+                # Повтор обновления 1 и новое обновление 3
+                second = dedup.filter([update(1, 1, "a"), update(3, 1, "b")])
+                await dedup.flush()
+                
+                # Новый экземпляр (после перезапуска) загружает ключи из хранилища
+                restarted = UpdateDeduplicator(store, capacity=100, persist=True)
+                await restarted.load()
+                third = restarted.filter([update(2, 1, "b"), update(4, 2, "c")])
+                await restarted.flush()
+                return [len(first), len(second), len(third)]
+            
+            self.assertEqual(asyncio.run(scenario()), [2, 1, 1])
+            store.close()
+    
+    def test_pending_updates_survive_restart(self):
+        """
+        Тест сохранения необработанных к остановке обновлений и их восстановления после перезапуска.
+        """
+        from telebot import types
+        
+        updates = [TestUpdateScheduler._update(1, 1, "первое"), TestUpdateScheduler._update(2, 1, "второе")]
+        
+        for store in (FileSessionStore(self.test_dir), SqliteSessionStore(os.path.join(self.test_dir, "sessions.db"))):
+            store.save_pending_updates([serialize_update(update) for update in updates])
+            
+            restored = [types.Update.de_json(data) for data in store.take_pending_updates()]
+            
+            self.assertEqual([(update.update_id, update.message.text) for update in restored], [(1, "первое"), (2, "второе")])
+            self.assertEqual(restored[0].message.from_user.id, 1)
+            # Восстановленные обновления удаляются из хранилища
+            self.assertEqual(store.take_pending_updates(), [])
+            store.close()
+    
+    def test_slow_store_keeps_batch_order(self):
+        """
+        Тест порядка обработки, когда сохранение ключей первого пакета задерживается:
+        следующий пакет не обгоняет его в очереди пользователя.
+        """
+        update = TestUpdateScheduler._update
+        handled = []
+        store = MagicMock()
+        calls = []
+        
+        def add_processed_updates(keys, capacity):
+            calls.append(keys)
+            # Медленная запись только для первого пакета
+            if len(calls) == 1:
+                time.sleep(0.2)
+        
+        store.add_processed_updates.side_effect = add_processed_updates
+        
+        async def process(updates):
+            handled.append(updates[0].message.text)
+        
+        async def scenario():
+            dedup = UpdateDeduplicator(store, capacity=100, persist=True)
+            scheduler = UpdateScheduler(process, workers=2)
+            scheduler.start()
+            
+            async def accept(updates):
+                await scheduler.submit(dedup.filter(updates))
+            
+            first = asyncio.create_task(accept([update(1, 1, "первое")]))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(accept([update(2, 1, "второе")]))
+            await asyncio.gather(first, second)
+            await dedup.flush()
+            await scheduler.stop()
+        
+        asyncio.run(scenario())
+        self.assertEqual(handled, ["первое", "второе"])
+        # Ключи пакетов сохранены в порядке приема
+        self.assertEqual(calls, [["u:1", "m:1:1"], ["u:2", "m:1:2"]])
+
+class TestOutboundDispatcher(unittest.TestCase):
+    """
+    Тесты для диспетчера исходящих запросов.
+    """
+    
+    def test_flood_wait_retry(self):
+        """
+        Тест повтора запроса после ошибки 429 с учетом retry_after.
+        """
+        from telebot.apihelper import ApiTelegramException
+        
+        flood = ApiTelegramException("sendMessage", None, {
+            "ok": False,
+            "error_code": 429,
+            "description": "Too Many Requests: retry after 0.1",
+            "parameters": {"retry_after": 0.1},
+        })
+        bot = MagicMock()
+        bot.send_message = AsyncMock(side_effect=[flood, "sent"])
+        limited_bot = RateLimitedBot(bot, OutboundDispatcher(global_rate=100, chat_rate=100))
+        
+        async def scenario():
+            started = time.monotonic()
+            result = await limited_bot.send_message(12345, "Текст")
+            await limited_bot.dispatcher.stop()
+            return result, time.monotonic() - started
+        
+        result, elapsed = asyncio.run(scenario())
+        
+        self.assertEqual(result, "sent")
+        self.assertEqual(bot.send_message.await_count, 2)
+        self.assertGreaterEqual(elapsed, 0.1)
+    
+    def test_priority_order(self):
+        """
+        Тест отправки ответов пользователям раньше уведомлений администратору.
+        """
+        sent = []
+        
+        async def send_message(chat_id, text):
+            sent.append(text)
+        
+        bot = MagicMock()
+        bot.send_message = send_message
+        limited_bot = RateLimitedBot(bot, OutboundDispatcher(global_rate=100, chat_rate=100))
+        
+        async def scenario():
+            # Исчерпываем общий лимит, чтобы запросы встали в очередь
+            limited_bot.dispatcher.global_bucket.tokens = 0
+            await asyncio.gather(
+                limited_bot.send_message(1, "admin", priority=PRIORITY_LOW),
+                limited_bot.send_message(2, "user"),
+            )
+            await limited_bot.dispatcher.stop()
+        
+        asyncio.run(scenario())
+        
+        self.assertEqual(sent, ["user", "admin"])
+
+class TestCallbackRouter(unittest.TestCase):
+    """
+    Тесты для маршрутизатора callback-запросов.
+    """
+    
+    def setUp(self):
+        """
+        Подготовка к тестам.
+        """
+        self.bot = MagicMock()
+        self.bot.answer_callback_query = AsyncMock()
+        self.router = CallbackRouter(self.bot)
+        self.admin = AsyncMock()
+        self.remove_user = AsyncMock()
+        self.router.register("admin_", self.admin)
+        self.router.register("admin_remove_user_", self.remove_user, parser=int)
+    
+    def _call(self, data):
+        call = MagicMock()
+        call.id = "42"
+        call.data = data
+        return call
+    
+    def test_longest_prefix_and_typed_payload(self):
+        """
+        Тест выбора самого длинного префикса и разбора данных.
+        """
+        call = self._call("admin_remove_user_12345")
+        asyncio.run(self.router.dispatch(call))
+        
+        self.remove_user.assert_awaited_once_with(call, 12345)
+        self.admin.assert_not_awaited()
+        self.bot.answer_callback_query.assert_awaited_once_with("42")
+    
+    def test_unknown_and_invalid_callbacks_are_answered(self):
+        """
+        Тест ответа на неизвестные и некорректные callback-запросы.
+        """
+        asyncio.run(self.router.dispatch(self._call("unknown_button")))
+        asyncio.run(self.router.dispatch(self._call("admin_remove_user_abc")))
+        
+        self.remove_user.assert_not_awaited()
+        self.assertEqual(self.bot.answer_callback_query.await_count, 2)
+
+class TestJobQueue(unittest.TestCase):
+    """
+    Тесты для ограниченной очереди задач.
+    """
+    
+    def test_concurrency_positions_and_rejection(self):
+        """
+        Тест ограничения параллелизма, уведомлений о позиции и отказа при переполнении.
+        """
+        queue = JobQueue("test_queue", concurrency=1, max_waiting=1, estimated_duration=60)
+        positions = []
+        
+        async def job(release):
+            await release.wait()
+            return "done"
+        
+        async def scenario():
+            first_release, second_release = asyncio.Event(), asyncio.Event()
+            
+            async def on_position(position, eta):
+                positions.append((position, eta))
+            
+            first = asyncio.create_task(queue.run(job, first_release))
+            second = asyncio.create_task(queue.run(job, second_release, on_position=on_position))
+            await asyncio.sleep(0)
+            
+            self.assertTrue(queue.full)
+            with self.assertRaises(JobQueueFull):
+                await queue.run(job, asyncio.Event())
+            
+            first_release.set()
+            second_release.set()
+            return await asyncio.gather(first, second)
+        
+        self.assertEqual(asyncio.run(scenario()), ["done", "done"])
+        self.assertEqual(positions[0], (1, 60))
+        self.assertEqual(positions[-1], (0, 0))
+        self.assertEqual(queue.running, 0)
+        self.assertFalse(queue.full)
+    
+    def test_cancelled_waiter_does_not_block_queue(self):
+        """
+        Тест отмены ожидающей задачи: место переходит следующей, счетчики не расходятся.
+        """
+        queue = JobQueue("test_queue", concurrency=1, max_waiting=2, estimated_duration=60)
+        
+        async def job(release):
+            await release.wait()
+            return "done"
+        
+        async def scenario():
+            first_release = asyncio.Event()
+            ready = asyncio.Event()
+            ready.set()
+            
+            first = asyncio.create_task(queue.run(job, first_release))
+            second = asyncio.create_task(queue.run(job, ready))
+            third = asyncio.create_task(queue.run(job, ready))
+            await asyncio.sleep(0)
+            
+            # Первая задача завершается раньше, чем отмененная успевает покинуть очередь
+            first_release.set()
+            second.cancel()
+            
+            results = await asyncio.wait_for(asyncio.gather(first, third), timeout=1)
+            with self.assertRaises(asyncio.CancelledError):
+                await second
+            return results
+        
+        self.assertEqual(asyncio.run(scenario()), ["done", "done"])
+        self.assertEqual(queue.running, 0)
+        self.assertEqual(len(queue._waiting), 0)
+
+class TestLazyService(unittest.TestCase):
+    """
+    Тесты для отложенного создания сервисов.
+    """
+    
+    def test_created_once_on_first_use(self):
+        """
+        Тест создания экземпляра только при первом обращении.
+        """
+        service = LazyService("utils.text_formatter", "TextFormatter")
+        self.assertFalse(service.created)
+        
+        instance = asyncio.run(service.get_async())
+        
+        self.assertTrue(service.created)
+        self.assertIsInstance(instance, TextFormatter)
+        self.assertIs(service.get(), instance)
 
 class TestAuth(unittest.TestCase):
     """
-    Тесты для аутентификации.
+    Тесты для аутентификации и менеджера пользователей.
     """
     
     def setUp(self):
         """
         Подготовка к тестам.
         """
+        self.test_dir = "/tmp/test_users"
+        self.users_file = os.path.join(self.test_dir, "users.json")
+        
         # Сохраняем оригинальный список разрешенных пользователей
         self.original_allowed_users = Config.ALLOWED_USERS
         
@@ -147,16 +1191,23 @@ class TestAuth(unittest.TestCase):
         """
         # Восстанавливаем оригинальный список разрешенных пользователей
         Config.ALLOWED_USERS = self.original_allowed_users
+        
+        if os.path.exists(self.test_dir):
+            import shutil
+            shutil.rmtree(self.test_dir)
     
     def test_is_user_allowed(self):
         """
         Тест проверки доступа пользователя.
         """
-        # Проверяем разрешенного пользователя
-        self.assertTrue(Auth.is_user_allowed(123456789))
+        user_manager = UserManager(self.users_file, admin_id=555)
+        
+        # Проверяем разрешенного пользователя и администратора
+        self.assertTrue(user_manager.is_user_allowed(123456789))
+        self.assertTrue(user_manager.is_user_allowed(555))
         
         # Проверяем запрещенного пользователя
-        self.assertFalse(Auth.is_user_allowed(111111111))
+        self.assertFalse(user_manager.is_user_allowed(111111111))
     
     def test_empty_allowed_users(self):
         """
@@ -164,14 +1215,125 @@ class TestAuth(unittest.TestCase):
         """
         # Устанавливаем пустой список разрешенных пользователей
         Config.ALLOWED_USERS = []
+        user_manager = UserManager(self.users_file)
+        
+        # Проверяем, что любой незаблокированный пользователь имеет доступ
+        self.assertTrue(user_manager.is_user_allowed(123456789))
+        self.assertTrue(user_manager.block_user(111111111))
+        self.assertFalse(user_manager.is_user_allowed(111111111))
+    
+    def test_persistence_and_reload(self):
+        """
+        Тест атомарного сохранения и перечитывания измененного файла.
+        """
+        user_manager = UserManager(self.users_file, reload_interval=0)
+        self.assertTrue(user_manager.add_user(111111111))
+        self.assertFalse(os.path.exists(f"{self.users_file}.tmp"))
+        
+        # Новый экземпляр видит сохраненные изменения
+        self.assertTrue(UserManager(self.users_file).is_user_allowed(111111111))
+        
+        # Ручное изменение файла подхватывается по времени модификации
+        with open(self.users_file, "w", encoding="utf-8") as f:
+            json.dump({"allowed_users": [222222222], "blocked_users": [], "admins": []}, f)
+        os.utime(self.users_file, ns=(time.time_ns(), time.time_ns() + 10**9))
+        
+        self.assertTrue(user_manager.is_user_allowed(222222222))
+        self.assertFalse(user_manager.is_user_allowed(111111111))
+    
+    def test_unauthorized_access_alerts_admin(self):
+        """
+        Тест объединения попыток в одно уведомление (с низким приоритетом) и блокировки кнопкой.
+        """
+        user_manager = UserManager(self.users_file, admin_id=555)
+        bot = MagicMock()
+        bot.send_message = AsyncMock()
+        bot.answer_callback_query = AsyncMock()
+        bot.edit_message_text = AsyncMock()
+        admin_handlers = AdminHandlers(bot, user_manager, alert_edit_interval=0)
+        router = CallbackRouter(bot)
+        admin_handlers.register_callbacks(router)
+        
+        # Администратор блокирует пользователя кнопкой из уведомления
+        call = MagicMock()
+        call.data = "block_user_111111111"
+        call.from_user.id = 555
+        
+        async def scenario():
+            for _ in range(3):
+                await admin_handlers.handle_unauthorized_access(111111111, "stranger")
+            await asyncio.sleep(0.01)
+            
+            await router.dispatch(call)
+            await admin_handlers.handle_unauthorized_access(111111111, "stranger")
+        
+        asyncio.run(scenario())
         
-        # Проверяем, что любой пользователь имеет доступ
-        self.assertTrue(Auth.is_user_allowed(123456789))
-        self.assertTrue(Auth.is_user_allowed(111111111))
+        # Три попытки - одно уведомление, обновленное на месте
+        bot.send_message.assert_awaited_once()
+        self.assertEqual(bot.send_message.await_args.args[0], 555)
+        self.assertEqual(bot.send_message.await_args.kwargs["priority"], PRIORITY_LOW)
+        self.assertIn("Попыток: 3", bot.edit_message_text.await_args_list[0].args[0])
+        
+        # Попытки заблокированного пользователя больше не беспокоят администратора
+        self.assertTrue(user_manager.is_blocked(111111111))
+    
+    def test_attempts_during_alert_send_are_edited_in(self):
+        """
+        Тест попыток, пришедших, пока первое уведомление еще отправляется: счетчик
+        обновляется одним редактированием после отправки.
+        """
+        user_manager = UserManager(self.users_file, admin_id=555)
+        bot = MagicMock()
+        bot.edit_message_text = AsyncMock()
+        admin_handlers = AdminHandlers(bot, user_manager, alert_edit_interval=0)
+        
+        async def slow_send(*args, **kwargs):
+            await asyncio.sleep(0.05)
+            return MagicMock(message_id=1)
+        
+        bot.send_message = AsyncMock(side_effect=slow_send)
+        
+        async def scenario():
+            first = asyncio.create_task(admin_handlers.handle_unauthorized_access(111111111, "stranger"))
+            await asyncio.sleep(0.01)
+            for _ in range(2):
+                await admin_handlers.handle_unauthorized_access(111111111, "stranger")
+            await first
+            await asyncio.sleep(0.01)
+        
+        asyncio.run(scenario())
+        
+        bot.send_message.assert_awaited_once()
+        bot.edit_message_text.assert_awaited_once()
+        self.assertIn("Попыток: 3", bot.edit_message_text.await_args.args[0])
+    
+    def test_repeated_rejection_is_not_resent(self):
+        """
+        Тест негативного кэша отказов в доступе.
+        """
+        Config.ALLOWED_USERS = [123456789]
+        bot = MagicMock()
+        bot.send_message = AsyncMock()
+        auth = Auth(UserManager(self.users_file))
+        handler = AsyncMock()
+        protected = auth.auth_required(bot)(handler)
+        
+        message = MagicMock()
+        message.from_user.id = 111111111
+        
+        async def scenario():
+            for _ in range(5):
+                await protected(message)
+        
+        asyncio.run(scenario())
+        
+        handler.assert_not_awaited()
+        bot.send_message.assert_awaited_once()
 
 class TestWhisperService(unittest.TestCase):
     """
-    Тесты для сервиса Whisper.
+    Тесты для сервиса Whisper (пул процессов с детерминированным движком без модели).
     """
     
     def setUp(self):
@@ -179,7 +1341,7 @@ class TestWhisperService(unittest.TestCase):
         Подготовка к тестам.
         """
         # Создаем экземпляр сервиса Whisper
-        self.whisper_service = WhisperService()
+        self.whisper_service = WhisperService(engine="fake", model="tiny", pool_size=1, engine_options={})
         
         # Создаем временный аудиофайл
         self.test_audio_file = "/tmp/test_audio.ogg"
@@ -190,30 +1352,391 @@ class TestWhisperService(unittest.TestCase):
         """
         Очистка после тестов.
         """
+        self.whisper_service.pool.stop()
+        
         # Удаляем временный аудиофайл
         if os.path.exists(self.test_audio_file):
             os.unlink(self.test_audio_file)
     
-    async def test_transcribe_audio(self):
+    def test_transcribe_audio(self):
         """
         Тест распознавания речи.
         """
         # Распознаем речь
-        transcription = await self.whisper_service.transcribe_audio(self.test_audio_file)
+        transcription = asyncio.run(self.whisper_service.transcribe_audio(self.test_audio_file))
         
         # Проверяем результат
-        self.assertIsNotNone(transcription)
-        self.assertIsInstance(transcription, str)
+        self.assertEqual(transcription, FakeEngine.TEXT)
     
-    async def test_transcribe_nonexistent_file(self):
+    def test_transcribe_nonexistent_file(self):
         """
         Тест распознавания несуществующего файла.
         """
         # Распознаем несуществующий файл
-        transcription = await self.whisper_service.transcribe_audio("/tmp/nonexistent.ogg")
+        transcription = asyncio.run(self.whisper_service.transcribe_audio("/tmp/nonexistent.ogg"))
         
         # Проверяем результат
         self.assertIsNone(transcription)
+    
+    @unittest.skipUnless(shutil.which("ffmpeg"), "ffmpeg не установлен")
+    def test_decode_audio_in_memory(self):
+        """
+        Тест декодирования аудио в PCM 16 кГц без временных файлов.
+        """
+        # Полсекунды тона 440 Гц в WAV 8 кГц
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(8000)
+            wav.writeframes(b"".join(
+                struct.pack("<h", int(16000 * math.sin(2 * math.pi * 440 * i / 8000))) for i in range(4000)
+            ))
+        
+        audio = asyncio.run(decode_audio(buffer.getvalue()))
+        
+        self.assertEqual(audio.dtype, np.float32)
+        self.assertAlmostEqual(len(audio) / SAMPLE_RATE, 0.5, delta=0.01)
+        self.assertLessEqual(float(np.abs(audio).max()), 1.0)
+        
+        # Некорректные данные
+        with self.assertRaises(AudioDecodeError):
+            asyncio.run(decode_audio(b"not an audio file"))
+    
+    def test_timeout_and_recycling_replace_worker(self):
+        """
+        Тест замены процесса после таймаута задачи и после лимита задач.
+        """
+        pool = WhisperPool("fake", "tiny", size=1, job_timeout=0.5, max_jobs_per_worker=2,
+                           load_timeout=30, engine_options={"delay": 0.1})
+        
+        async def scenario():
+            first = [await pool.run("transcribe", "a.ogg") for _ in range(2)]
+            pool.job_timeout = 0.05
+            with self.assertRaises(TimeoutError):
+                await pool.run("transcribe", "b.ogg")
+            pool.job_timeout = 0.5
+            return first, await pool.run("transcribe", "c.ogg")
+        
+        restarts = metrics.get_counter("whisper_worker_restarts_total")
+        try:
+            first, last = asyncio.run(scenario())
+        finally:
+            pool.stop()
+        
+        self.assertEqual(first, [FakeEngine.TEXT] * 2)
+        self.assertEqual(last, FakeEngine.TEXT)
+        self.assertEqual(metrics.get_counter("whisper_worker_restarts_total") - restarts, 2)
+    
+    def test_idle_unload_and_wake(self):
+        """
+        Тест выгрузки модели после простоя и загрузки при новом сообщении.
+        """
+        async def scenario():
+            await self.whisper_service.warm_up()
+            first = await self.whisper_service.transcribe_audio(self.test_audio_file)
+            
+            # Простой дольше WHISPER_IDLE_UNLOAD_SECONDS
+            await asyncio.sleep(0.5)
+            unloaded = not self.whisper_service.pool.started
+            
+            # Новое сообщение: загрузка в фоне, затем распознавание
+            self.whisper_service.wake()
+            second = await self.whisper_service.transcribe_audio(self.test_audio_file)
+            
+            await self.whisper_service.close()
+            return first, unloaded, second
+        
+        unloads = metrics.get_counter("whisper_unloads_total")
+        with patch.object(Config, "WHISPER_IDLE_UNLOAD_SECONDS", 0.2):
+            first, unloaded, second = asyncio.run(scenario())
+        
+        self.assertEqual(first, FakeEngine.TEXT)
+        self.assertTrue(unloaded)
+        self.assertEqual(second, FakeEngine.TEXT)
+        self.assertEqual(metrics.get_counter("whisper_unloads_total") - unloads, 1)
+        self.assertIn("whisper_wake_to_first_transcript_seconds", metrics.snapshot()["observations"])
+    
+    @unittest.skipUnless(hasattr(os, "fork"), "fork не поддерживается")
+    def test_shared_model_workers(self):
+        """
+        Тест пула с общей моделью: обработчики порождаются из процесса-шаблона
+        и после таймаута заменяются без повторной загрузки модели.
+        """
+        pool = WhisperPool("fake", "tiny", size=2, job_timeout=0.5, max_jobs_per_worker=0,
+                           load_timeout=30, engine_options={"delay": 0.1, "weights_mb": 50}, share_model=True)
+        
+        async def scenario():
+            pool.job_timeout = 0.05
+            with self.assertRaises(TimeoutError):
+                await pool.run("transcribe", "a.ogg")
+            pool.job_timeout = 0.5
+            results = await asyncio.gather(*[pool.run("transcribe", "b.ogg") for _ in range(4)])
+            return results, pool.memory_usage()
+        
+        try:
+            results, usage = asyncio.run(scenario())
+        finally:
+            pool.stop()
+        
+        self.assertTrue(pool.share_model)
+        self.assertEqual(results, [FakeEngine.TEXT] * 4)
+        
+        # Страницы весов общие: доля процесса (PSS) заметно меньше его RSS
+        if usage["workers"]:
+            self.assertEqual(len(usage["workers"]), 2)
+            for worker in usage["workers"]:
+                self.assertLess(worker["pss"], 0.7 * worker["rss"])
+    
+    def test_share_model_warning_at_startup(self):
+        """
+        Тест предупреждения при запуске, если движок не поддерживает общую модель.
+        """
+        with patch.multiple(Config, TELEGRAM_BOT_TOKEN="token", BOT_MODE="polling",
+                            ALLOWED_USERS=[1], WHISPER_SHARE_MODEL=True):
+            with patch.object(Config, "WHISPER_ENGINE", "faster-whisper"):
+                with self.assertLogs("config.config", level="WARNING") as logs:
+                    self.assertTrue(Config.validate())
+            self.assertIn("WHISPER_SHARE_MODEL", logs.output[0])
+            
+            # Движок с общей моделью предупреждения не вызывает
+            with patch.object(Config, "WHISPER_ENGINE", "whisper"):
+                with self.assertNoLogs("config.config", level="WARNING"):
+                    self.assertTrue(Config.validate())
+
+class TestVAD(unittest.TestCase):
+    """
+    Тесты для вырезания тишины перед распознаванием.
+    """
+    
+    def test_trim_silence_keeps_short_pauses_and_maps_time(self):
+        """
+        Тест вырезания тишины, сохранения коротких пауз и пересчета времени.
+        """
+        rng = np.random.default_rng(0)
+        
+        def tone(seconds):
+            t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+            return (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+        
+        def silence(seconds):
+            return (0.001 * rng.standard_normal(int(seconds * SAMPLE_RATE))).astype(np.float32)
+        
+        # Речь 2-4.5 с (с паузой 0.5 с) и 10-12 с
+        audio = np.concatenate([silence(2), tone(1), silence(0.5), tone(1), silence(5.5), tone(2), silence(3)])
+        
+        trimmed, timestamps = trim_silence(audio, SAMPLE_RATE, max_pause=1.0, padding=0.2)
+        
+        # Короткая пауза сохранена, длинная и тишина по краям вырезаны
+        self.assertEqual(len(timestamps.spans), 2)
+        self.assertLess(len(trimmed) / SAMPLE_RATE, 6)
+        
+        # Начало второго участка в сокращенном сигнале соответствует ~10 с исходной записи
+        second_start = timestamps.spans[1][0] / SAMPLE_RATE
+        self.assertAlmostEqual(timestamps.to_original(second_start + 0.2), 10.0, delta=0.1)
+        
+        # Склейка на месте длинной паузы: вырезано 5.5 с без запаса по 0.2 с с каждой стороны
+        [(position, removed)] = timestamps.joins()
+        self.assertEqual(position, timestamps.spans[1][0])
+        self.assertAlmostEqual(removed / SAMPLE_RATE, 5.1, delta=0.1)
+    
+    def test_no_speech_returns_original(self):
+        """
+        Тест сохранения исходного сигнала, если речь не найдена.
+        """
+        audio = np.zeros(SAMPLE_RATE, dtype=np.float32)
+        trimmed, _ = trim_silence(audio, SAMPLE_RATE, max_pause=1.0, padding=0.2)
+        
+        self.assertEqual(len(trimmed), len(audio))
+
+class TestSegmentation(unittest.TestCase):
+    """
+    Тесты для разбиения длинных записей на сегменты и склейки текстов.
+    """
+    
+    def test_split_prefers_pauses(self):
+        """
+        Тест разбиения по паузам на сегменты ограниченной длины.
+        """
+        t = np.arange(8 * SAMPLE_RATE) / SAMPLE_RATE
+        phrase = (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+        pause = np.zeros(SAMPLE_RATE, dtype=np.float32)
+        # Фразы по 8 с через паузы 1 с: 35 с
+        audio = np.concatenate([phrase, pause, phrase, pause, phrase, pause, phrase])
+        
+        segments = split_at_silence(audio, SAMPLE_RATE, max_seconds=20, overlap_seconds=1)
+        
+        self.assertGreater(len(segments), 1)
+        self.assertEqual(segments[0].start, 0)
+        self.assertEqual(segments[-1].end, len(audio))
+        for previous, segment in zip(segments, segments[1:]):
+            # Разрезы в паузах, без перекрытия
+            self.assertEqual(segment.start, previous.end)
+            self.assertFalse(segment.overlap)
+            self.assertLess(abs(np.mean(audio[segment.start - 100:segment.start + 100] ** 2)), 1e-4)
+        for segment in segments:
+            self.assertLessEqual(segment.end - segment.start, 20 * SAMPLE_RATE)
+    
+    def test_split_without_pauses_overlaps(self):
+        """
+        Тест жесткого разреза с перекрытием при сплошной речи.
+        """
+        t = np.arange(50 * SAMPLE_RATE) / SAMPLE_RATE
+        audio = (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+        
+        segments = split_at_silence(audio, SAMPLE_RATE, max_seconds=20, overlap_seconds=1)
+        
+        self.assertEqual(len(segments), 3)
+        self.assertEqual(segments[1].start, segments[0].end - SAMPLE_RATE)
+        self.assertTrue(segments[1].overlap)
+    
+    def test_split_at_vad_joins(self):
+        """
+        Тест разреза в месте паузы, вырезанной VAD, вместо жесткого разреза с перекрытием.
+        """
+        t = np.arange(30 * SAMPLE_RATE) / SAMPLE_RATE
+        audio = (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+        
+        segments = split_at_silence(audio, SAMPLE_RATE, max_seconds=20, overlap_seconds=1,
+                                    joins=[(15 * SAMPLE_RATE, 3 * SAMPLE_RATE)])
+        
+        self.assertEqual([(segment.start, segment.end) for segment in segments],
+                         [(0, 15 * SAMPLE_RATE), (15 * SAMPLE_RATE, len(audio))])
+        self.assertFalse(segments[1].overlap)
+    
+    def test_merge_removes_overlap_duplicates(self):
+        """
+        Тест удаления повтора слов на стыке сегментов с перекрытием.
+        """
+        segments = [Segment(0, 10, False), Segment(9, 20, True), Segment(20, 30, False)]
+        texts = ["Обсудили бюджет проекта,", "проекта и сроки сдачи.", "Сроки сдачи в мае."]
+        
+        self.assertEqual(
+            merge_transcripts(texts, segments),
+            "Обсудили бюджет проекта, и сроки сдачи. Сроки сдачи в мае."
+        )
+    
+    def test_long_audio_transcribed_in_parallel(self):
+        """
+        Тест параллельного распознавания сегментов в нескольких процессах пула.
+        """
+        service = WhisperService(engine="fake", model="tiny", pool_size=2, engine_options={"delay": 0.3})
+        audio = (0.01 * np.random.default_rng(0).standard_normal(SAMPLE_RATE * 4)).astype(np.float32)
+        
+        try:
+            service.pool.start()
+            with patch.object(Config, "VAD_ENABLED", False), \
+                    patch.object(Config, "WHISPER_SEGMENT_SECONDS", 1), \
+                    patch.object(Config, "WHISPER_SEGMENT_OVERLAP_SECONDS", 0):
+                started = time.monotonic()
+                transcription = asyncio.run(service.transcribe_pcm(audio))
+                elapsed = time.monotonic() - started
+        finally:
+            service.pool.stop()
+        
+        # 4 сегмента по 0.3 с в двух процессах
+        self.assertEqual(transcription, " ".join([FakeEngine.TEXT] * 4))
+        self.assertLess(elapsed, 1.1)
+
+class TestTranscriptionCache(unittest.TestCase):
+    """
+    Тесты для кэша распознанных текстов.
+    """
+    
+    def setUp(self):
+        """
+        Подготовка к тестам.
+        """
+        self.test_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        """
+        Очистка после тестов.
+        """
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+    
+    def test_disk_cache_is_bounded_and_persistent(self):
+        """
+        Тест ограничения кэша в памяти и на диске и чтения записей после перезапуска.
+        """
+        cache = TranscriptionCache(self.test_dir, memory_entries=2, disk_bytes=300)
+        for i in range(5):
+            cache.put(f"key{i}", f"текст {i} " * 5)
+        
+        self.assertEqual(len(cache._memory), 2)
+        self.assertLessEqual(sum(os.path.getsize(os.path.join(self.test_dir, name)) for name in os.listdir(self.test_dir)), 300)
+        
+        # Новый экземпляр читает недавние записи с диска, вытесненные недоступны
+        restarted = TranscriptionCache(self.test_dir, memory_entries=2, disk_bytes=300)
+        self.assertEqual(restarted.get("key4"), "текст 4 " * 5)
+        self.assertIsNone(restarted.get("key0"))
+    
+    def test_repeated_voice_message_is_not_transcribed_again(self):
+        """
+        Тест повторного сообщения: по file_unique_id и по хэшу содержимого текст берется из кэша.
+        """
+        with patch.object(Config, "TRANSCRIPTION_CACHE_DIR", self.test_dir):
+            service = WhisperService(engine="fake", model="tiny", pool_size=1, engine_options={})
+        service.pool.engine_version = "fake-1"
+        
+        async def run():
+            with patch("services.whisper_service.decode_audio", AsyncMock(return_value=np.zeros(16000, dtype=np.float32))), \
+                    patch.object(service, "transcribe_pcm", AsyncMock(return_value="Текст")) as transcribe:
+                first = await service.transcribe_voice_message(b"voice", "id1")
+                # То же аудио, пересланное новым сообщением
+                forwarded = await service.transcribe_voice_message(b"voice", "id2")
+                by_file_id = await service.get_cached_transcription("id1")
+                
+                # Другая версия движка - старые записи не используются
+                service.pool.engine_version = "fake-2"
+                stale = await service.get_cached_transcription("id1")
+                
+                return first, forwarded, by_file_id, stale, transcribe.await_count
+        
+        self.assertEqual(asyncio.run(run()), ("Текст", "Текст", "Текст", None, 1))
+
+class TestSharedPCM(unittest.TestCase):
+    """
+    Тесты для передачи сигнала процессам через разделяемую память.
+    """
+    
+    def test_ref_resolves_to_view_of_segment(self):
+        """
+        Тест подстановки участка сигнала вместо ссылки и удаления сегмента.
+        """
+        audio = np.arange(100, dtype=np.float32)
+        
+        with SharedPCM(audio) as pcm:
+            with resolve_refs(("a.ogg", pcm.ref(10, 20))) as args:
+                self.assertEqual(args[0], "a.ogg")
+                np.testing.assert_array_equal(args[1], audio[10:20])
+            name = pcm.name
+        
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+    
+    def test_segment_released_after_cancel(self):
+        """
+        Тест удаления сегмента, если распознавание отменено.
+        """
+        service = WhisperService(engine="fake", model="tiny", pool_size=1, engine_options={"delay": 1})
+        
+        async def scenario():
+            task = asyncio.create_task(service.transcribe_pcm(np.zeros(SAMPLE_RATE, dtype=np.float32)))
+            await asyncio.sleep(0.3)
+            self.assertEqual(metrics.get_gauge("shared_pcm_segments"), 1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        
+        try:
+            service.pool.start()
+            with patch.object(Config, "VAD_ENABLED", False), patch.object(Config, "WHISPER_SHARED_PCM", True):
+                asyncio.run(scenario())
+        finally:
+            service.pool.stop()
+        
+        self.assertEqual(metrics.get_gauge("shared_pcm_segments"), 0)
 
 class TestOllamaService(unittest.TestCase):
     """
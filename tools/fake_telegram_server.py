@@ -0,0 +1,259 @@
+"""
+Локальный фейковый сервер Telegram Bot API для офлайн-тестирования.
+
+Отвечает на вызовы методов Bot API (/bot<token>/<method>) правдоподобными
+результатами и записывает их, а также умеет отправлять синтетические
+обновления на webhook бота. Позволяет нагрузочно тестировать режим webhook
+без доступа к api.telegram.org.
+
+Запуск из корня проекта:
+    python -m tools.fake_telegram_server [--port 8081] [--latency-ms 0]
+        [--webhook-url http://127.0.0.1:8080/telegram/webhook --updates 1000 --secret TOKEN]
+
+Чтобы бот обращался к фейковому серверу, вызовите FakeTelegramServer.install()
+в том же процессе (подменяет telebot.asyncio_helper.API_URL и FILE_URL).
+"""
+import time
+import asyncio
+import argparse
+import itertools
+from urllib.parse import parse_qsl
+import aiohttp
+from aiohttp import web
+from telebot import asyncio_helper
+from core.webhook_server import SECRET_TOKEN_HEADER
+
+# Содержимое, возвращаемое при скачивании любого файла
+FAKE_FILE_CONTENT = b"OggS" + b"\x00" * 1020
+
+def make_update(update_id, user_id, text):
+    """
+    Формирует JSON синтетического обновления с текстовым сообщением.
+
+    Args:
+        update_id (int): Идентификатор обновления.
+        user_id (int): Идентификатор пользователя (и чата).
+        text (str): Текст сообщения.
+
+    Returns:
+        dict: Обновление в формате Bot API.
+    """
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id}"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "text": text,
+        },
+    }
+
+class FakeTelegramServer:
+    """
+    Класс фейкового сервера Bot API.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8081, latency=0.0):
+        """
+        Инициализация фейкового сервера.
+
+        Args:
+            host (str): Адрес прослушивания.
+            port (int): Порт прослушивания.
+            latency (float): Искусственная задержка ответа на каждый вызов (в секундах).
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls = []
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+        # Результаты методов Bot API по имени метода
+        self._methods = {
+            "getme": self._get_me,
+            "getupdates": self._get_updates,
+            "getfile": self._get_file,
+            "sendmessage": self._send_message,
+            "editmessagetext": self._send_message,
+            "senddocument": self._send_message,
+        }
+
+    @property
+    def api_url(self):
+        """
+        Шаблон адреса методов в формате telebot.asyncio_helper.API_URL.
+        """
+        return f"http://{self.host}:{self.port}/bot{{0}}/{{1}}"
+
+    @property
+    def file_url(self):
+        """
+        Шаблон адреса файлов в формате telebot.asyncio_helper.FILE_URL.
+        """
+        return f"http://{self.host}:{self.port}/file/bot{{0}}/{{1}}"
+
+    def install(self):
+        """
+        Направляет запросы AsyncTeleBot текущего процесса на фейковый сервер.
+        """
+        asyncio_helper.API_URL = self.api_url
+        asyncio_helper.FILE_URL = self.file_url
+
+    def count(self, method):
+        """
+        Возвращает количество вызовов метода.
+
+        Args:
+            method (str): Имя метода Bot API (например, "sendMessage").
+
+        Returns:
+            int: Количество вызовов.
+        """
+        method = method.lower()
+        return sum(1 for call in self.calls if call[1] == method)
+
+    async def start(self):
+        """
+        Запускает сервер.
+        """
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._handle_file)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        """
+        Останавливает сервер.
+        """
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_method(self, request):
+        method = request.match_info["method"].lower()
+        params = dict(request.query)
+
+        # telebot передает параметры телом запроса даже для GET, поэтому разбираем его вручную
+        if request.content_type == "multipart/form-data":
+            reader = await request.multipart()
+            async for part in reader:
+                params[part.name] = part.filename or await part.text()
+        elif request.can_read_body:
+            params.update(parse_qsl((await request.read()).decode("utf-8")))
+
+        self.calls.append((time.monotonic(), method, params))
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        handler = self._methods.get(method)
+        result = await handler(params) if handler else True
+
+        return web.json_response({"ok": True, "result": result})
+
+    async def _handle_file(self, request):
+        return web.Response(body=FAKE_FILE_CONTENT)
+
+    async def _get_me(self, params):
+        return {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+    async def _get_updates(self, params):
+        # Обновления в режиме polling не генерируются, имитируем пустой long polling
+        await asyncio.sleep(min(float(params.get("timeout", 1)), 1.0))
+        return []
+
+    async def _get_file(self, params):
+        file_id = params.get("file_id", "file")
+        return {
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_size": len(FAKE_FILE_CONTENT),
+            "file_path": f"voice/{file_id}.oga",
+        }
+
+    async def _send_message(self, params):
+        chat_id = int(params.get("chat_id", 0))
+        return {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text") or params.get("caption") or "",
+        }
+
+async def push_updates(webhook_url, updates, users=100, secret_token=None, concurrency=50):
+    """
+    Отправляет синтетические обновления на webhook бота.
+
+    Args:
+        webhook_url (str): Адрес webhook бота.
+        updates (int): Количество обновлений.
+        users (int): Количество разных пользователей.
+        secret_token (str): Секретный токен webhook.
+        concurrency (int): Количество одновременных запросов.
+
+    Returns:
+        dict: Время отправки каждого обновления (update_id -> time.monotonic()).
+    """
+    headers = {SECRET_TOKEN_HEADER: secret_token} if secret_token else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    sent = {}
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async def post(update_id):
+            async with semaphore:
+                sent[update_id] = time.monotonic()
+                update = make_update(update_id, 1000 + update_id % users, f"message {update_id}")
+                async with session.post(webhook_url, json=update) as resp:
+                    resp.raise_for_status()
+
+        await asyncio.gather(*(post(update_id) for update_id in range(1, updates + 1)))
+
+    return sent
+
+async def run(args):
+    """
+    Запускает сервер и, если указан webhook, отправляет на него обновления.
+    """
+    server = FakeTelegramServer(args.host, args.port, args.latency_ms / 1000)
+    await server.start()
+
+    print(f"Фейковый Telegram Bot API: {server.api_url.format('<token>', '<method>')}")
+
+    try:
+        if args.webhook_url:
+            started = time.monotonic()
+            await push_updates(args.webhook_url, args.updates, args.users, args.secret, args.concurrency)
+            elapsed = time.monotonic() - started
+            print(f"Отправлено обновлений: {args.updates} за {elapsed:.2f} с ({args.updates / elapsed:.0f}/с)")
+
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+def main():
+    """
+    Разбирает аргументы командной строки и запускает сервер.
+    """
+    parser = argparse.ArgumentParser(description="Фейковый сервер Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1", help="Адрес прослушивания")
+    parser.add_argument("--port", type=int, default=8081, help="Порт прослушивания")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Задержка ответа на каждый вызов")
+    parser.add_argument("--webhook-url", help="Адрес webhook бота для отправки обновлений")
+    parser.add_argument("--updates", type=int, default=1000, help="Количество отправляемых обновлений")
+    parser.add_argument("--users", type=int, default=100, help="Количество разных пользователей")
+    parser.add_argument("--secret", help="Секретный токен webhook")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных запросов")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Миграция сессий из директорий user_id=* в хранилище SQLite.
+
+Запуск из корня проекта:
+    python -m tools.migrate_sessions [--sessions-dir DIR] [--db PATH] [--remove-json]
+
+Голосовые сообщения и PDF остаются в директориях сессий,
+в базу записываются данные сессий и ссылки на файлы.
+"""
+import argparse
+import logging
+from dotenv import load_dotenv
+
+# Переменные окружения из .env загружаются до импорта конфигурации
+load_dotenv()
+
+from config.config import Config
+from core.session_store import SqliteSessionStore
+
+logger = logging.getLogger(__name__)
+
+def main():
+    """
+    Разбирает аргументы командной строки и выполняет миграцию.
+    """
+    parser = argparse.ArgumentParser(description="Импорт сессий из session.json в SQLite")
+    parser.add_argument("--sessions-dir", default=Config.SESSION_BASE_DIR,
+                        help="Базовая директория сессий (по умолчанию Config.SESSION_BASE_DIR)")
+    parser.add_argument("--db", default=Config.SESSION_DB_PATH,
+                        help="Путь к базе SQLite (по умолчанию Config.SESSION_DB_PATH)")
+    parser.add_argument("--remove-json", action="store_true",
+                        help="Удалять session.json после успешного импорта")
+    args = parser.parse_args()
+
+    store = SqliteSessionStore(args.db)
+
+    try:
+        imported = store.import_file_sessions(args.sessions_dir, remove_json=args.remove_json)
+    finally:
+        store.close()
+
+    print(f"Импортировано сессий: {imported} -> {args.db}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Утилита для выполнения блокирующих операций ввода-вывода вне цикла событий.
+
+Синхронная работа с файлами и хранилищем сессий выполняется в ограниченном
+пуле потоков, чтобы медленный диск не останавливал обработку остальных чатов.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+def get_io_executor():
+    """
+    Возвращает общий пул потоков для операций ввода-вывода, создавая его при первом вызове.
+
+    Returns:
+        ThreadPoolExecutor: Пул потоков размером Config.IO_EXECUTOR_WORKERS.
+    """
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=Config.IO_EXECUTOR_WORKERS,
+            thread_name_prefix="io"
+        )
+        logger.info(f"Создан пул ввода-вывода на {Config.IO_EXECUTOR_WORKERS} потоков")
+
+    return _executor
+
+async def run_io(func, *args, **kwargs):
+    """
+    Выполняет блокирующую функцию в пуле ввода-вывода и ожидает результат.
+
+    Args:
+        func (callable): Блокирующая функция.
+        *args: Позиционные аргументы функции.
+        **kwargs: Именованные аргументы функции.
+
+    Returns:
+        Результат выполнения функции.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), functools.partial(func, *args, **kwargs))
+
+def shutdown_io_executor(wait=True):
+    """
+    Останавливает пул ввода-вывода.
+
+    Args:
+        wait (bool): Дожидаться ли завершения уже запущенных операций.
+    """
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
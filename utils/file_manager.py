@@ -5,6 +5,7 @@ import os
 import logging
 import shutil
 from config.config import Config
+from utils.async_io import run_io
 
 logger = logging.getLogger(__name__)
 
@@ -123,3 +124,67 @@ class FileManager:
         except Exception as e:
             logger.error(f"Ошибка при сохранении PDF-документа для пользователя {user_id}: {str(e)}")
             return None
+    
+    @staticmethod
+    def read_file(file_path):
+        """
+        Читает файл целиком.
+        
+        Args:
+            file_path (str): Путь к файлу.
+            
+        Returns:
+            bytes: Содержимое файла или None в случае ошибки.
+        """
+        try:
+            with open(file_path, "rb") as f:
+                return f.read()
+        except Exception as e:
+            logger.error(f"Ошибка при чтении файла {file_path}: {str(e)}")
+            return None
+    
+    # Асинхронные варианты выполняют операции в пуле ввода-вывода,
+    # не блокируя цикл событий бота.
+    
+    @staticmethod
+    async def save_voice_message_async(user_id, voice_file_data, file_name="voice_message.ogg"):
+        """
+        Асинхронно сохраняет голосовое сообщение в директории сессии пользователя.
+        
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+            voice_file_data (bytes): Данные голосового сообщения.
+            file_name (str): Имя файла для сохранения.
+            
+        Returns:
+            str: Путь к сохраненному файлу или None в случае ошибки.
+        """
+        return await run_io(FileManager.save_voice_message, user_id, voice_file_data, file_name)
+    
+    @staticmethod
+    async def save_pdf_async(user_id, pdf_data, file_name="protocol.pdf"):
+        """
+        Асинхронно сохраняет PDF-документ в директории сессии пользователя.
+        
+        Args:
+            user_id (int): Идентификатор пользователя Telegram.
+            pdf_data (bytes): Данные PDF-документа.
+            file_name (str): Имя файла для сохранения.
+            
+        Returns:
+            str: Путь к сохраненному файлу или None в случае ошибки.
+        """
+        return await run_io(FileManager.save_pdf, user_id, pdf_data, file_name)
+    
+    @staticmethod
+    async def read_file_async(file_path):
+        """
+        Асинхронно читает файл целиком.
+        
+        Args:
+            file_path (str): Путь к файлу.
+            
+        Returns:
+            bytes: Содержимое файла или None в случае ошибки.
+        """
+        return await run_io(FileManager.read_file, file_path)
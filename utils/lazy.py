@@ -0,0 +1,90 @@
+"""
+Утилита для отложенного создания тяжелых сервисов.
+
+Модуль сервиса импортируется, а его экземпляр создается при первом
+обращении (или заранее, фоновым прогревом), а не при запуске бота.
+Так загрузка модели Whisper не задерживает ответ на /start.
+"""
+import time
+import logging
+import importlib
+import threading
+from utils.async_io import run_io
+
+logger = logging.getLogger(__name__)
+
+class LazyService:
+    """
+    Класс отложенно создаваемого сервиса.
+    """
+
+    def __init__(self, module, name, *args, **kwargs):
+        """
+        Инициализация обертки. Модуль сервиса при этом не импортируется.
+
+        Args:
+            module (str): Имя модуля (например, "services.whisper_service").
+            name (str): Имя класса сервиса в модуле.
+            *args: Позиционные аргументы конструктора.
+            **kwargs: Именованные аргументы конструктора.
+        """
+        self.module = module
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def created(self):
+        """
+        Признак уже созданного экземпляра.
+        """
+        return self._instance is not None
+
+    def get(self):
+        """
+        Возвращает экземпляр сервиса, создавая его при первом вызове.
+        Блокирует вызывающий поток на время создания.
+
+        Returns:
+            Экземпляр сервиса.
+        """
+        if self._instance is None:
+            # Прогрев и первое обращение могут совпасть по времени
+            with self._lock:
+                if self._instance is None:
+                    started = time.monotonic()
+                    service_class = getattr(importlib.import_module(self.module), self.name)
+                    self._instance = service_class(*self.args, **self.kwargs)
+                    logger.info(f"Создан сервис {self.name} за {time.monotonic() - started:.2f} с")
+
+        return self._instance
+
+    async def get_async(self):
+        """
+        Возвращает экземпляр сервиса; создание выполняется в пуле ввода-вывода,
+        не блокируя цикл событий.
+
+        Returns:
+            Экземпляр сервиса.
+        """
+        if self._instance is not None:
+            return self._instance
+
+        return await run_io(self.get)
+
+async def warm_up(services):
+    """
+    Заранее создает сервисы (фоновый прогрев после запуска бота).
+    Ошибка создания одного сервиса не мешает остальным: при первом
+    обращении создание будет повторено.
+
+    Args:
+        services (list): Список LazyService.
+    """
+    for service in services:
+        try:
+            await service.get_async()
+        except Exception as e:
+            logger.error(f"Ошибка при прогреве сервиса {service.name}: {str(e)}")
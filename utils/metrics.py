@@ -0,0 +1,135 @@
+"""
+Утилита для сбора метрик работы бота.
+
+Простой реестр в памяти процесса: счетчики, текущие значения (gauge)
+и наблюдения (количество, сумма, максимум и последние значения для перцентилей).
+"""
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class MetricsRegistry:
+    """
+    Класс реестра метрик.
+    """
+
+    # Количество последних наблюдений, по которым считаются перцентили
+    SAMPLES_LIMIT = 1000
+
+    def __init__(self):
+        """
+        Инициализация реестра метрик.
+        """
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._observations = {}
+
+    def increment(self, name, value=1):
+        """
+        Увеличивает счетчик.
+
+        Args:
+            name (str): Имя метрики.
+            value (float): Величина приращения.
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        """
+        Устанавливает текущее значение метрики.
+
+        Args:
+            name (str): Имя метрики.
+            value (float): Значение.
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        """
+        Добавляет наблюдение (длительность, размер и т.п.).
+
+        Args:
+            name (str): Имя метрики.
+            value (float): Наблюдаемое значение.
+        """
+        with self._lock:
+            observation = self._observations.get(name)
+
+            if observation is None:
+                observation = {"count": 0, "sum": 0.0, "max": value, "samples": deque(maxlen=self.SAMPLES_LIMIT)}
+                self._observations[name] = observation
+
+            observation["count"] += 1
+            observation["sum"] += value
+            observation["max"] = max(observation["max"], value)
+            observation["samples"].append(value)
+
+    def get_counter(self, name):
+        """
+        Возвращает значение счетчика.
+
+        Args:
+            name (str): Имя метрики.
+
+        Returns:
+            float: Значение счетчика (0, если он еще не увеличивался).
+        """
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def get_gauge(self, name):
+        """
+        Возвращает текущее значение метрики.
+
+        Args:
+            name (str): Имя метрики.
+
+        Returns:
+            float: Значение или None, если оно не устанавливалось.
+        """
+        with self._lock:
+            return self._gauges.get(name)
+
+    def snapshot(self):
+        """
+        Возвращает снимок всех метрик.
+
+        Returns:
+            dict: Словарь с разделами "counters", "gauges" и "observations".
+        """
+        with self._lock:
+            observations = {}
+
+            for name, observation in self._observations.items():
+                samples = sorted(observation["samples"])
+                observations[name] = {
+                    "count": observation["count"],
+                    "sum": observation["sum"],
+                    "avg": observation["sum"] / observation["count"],
+                    "max": observation["max"],
+                    "p50": samples[int(0.50 * (len(samples) - 1))],
+                    "p99": samples[int(0.99 * (len(samples) - 1))],
+                }
+
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "observations": observations,
+            }
+
+    def reset(self):
+        """
+        Сбрасывает все метрики.
+        """
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._observations.clear()
+
+# Общий реестр метрик процесса
+metrics = MetricsRegistry()